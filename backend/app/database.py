@@ -1,6 +1,9 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from .models import Base
+from .migrations import upgrade_schema
+from .sqlite_profile import WRITER_OPTION, apply_sqlite_profile, is_sqlite, pool_options
 import os
 from dotenv import load_dotenv
 
@@ -10,11 +13,43 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./ancestree.db")
 
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
+    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {},
+    **pool_options(DATABASE_URL)
 )
 
+if is_sqlite(DATABASE_URL):
+    apply_sqlite_profile(engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Sessions that write; on SQLite their transactions take turns (see app/sqlite_profile.py)
+WriteSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine.execution_options(**{WRITER_OPTION: True}))
+
+def async_database_url(url: str) -> str:
+    """The same database through an asyncio driver: aiosqlite for SQLite, asyncpg for PostgreSQL."""
+    scheme, _, rest = url.partition("://")
+    if scheme in ("sqlite", "sqlite+pysqlite"):
+        return f"sqlite+aiosqlite://{rest}"
+    if scheme in ("postgres", "postgresql", "postgresql+psycopg2"):
+        return f"postgresql+asyncpg://{rest}"
+    return url
+
+# Async routes use their own pool on the same database; the schema is still
+# created and upgraded through the sync engine in init_db
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_database_url(DATABASE_URL)
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool_options(ASYNC_DATABASE_URL))
+
+if is_sqlite(ASYNC_DATABASE_URL):
+    apply_sqlite_profile(async_engine.sync_engine)
+
+# Objects stay usable after commit, since touching an expired attribute
+# would need implicit IO that an async session cannot do
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+AsyncWriteSessionLocal = async_sessionmaker(
+    async_engine.execution_options(**{WRITER_OPTION: True}), autoflush=False, expire_on_commit=False
+)
+
 def get_db():
     db = SessionLocal()
     try:
@@ -22,5 +57,21 @@ def get_db():
     finally:
         db.close()
 
+def get_write_db():
+    db = WriteSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_async_write_db():
+    async with AsyncWriteSessionLocal() as db:
+        yield db
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
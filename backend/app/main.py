@@ -1,10 +1,14 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 import os
 
-from .database import init_db
-from .routes import auth, family_members, documents, search
+from .database import async_engine, engine, init_db
+from .routes import auth, family_members, documents, search, gedcom, duplicates, stats, sync, events, families
+from .sqlite_profile import SQLITE_WRITER_RETRY_AFTER, WriterTimeout, database_stats
+from .utils.pagination import NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER
+from .utils.rate_limit import LIMIT_HEADER, REMAINING_HEADER, rate_limiter
 
 app = FastAPI(
     title="Ancestree API",
@@ -19,6 +23,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER, "ETag", "Last-Modified", "Retry-After", LIMIT_HEADER, REMAINING_HEADER],
 )
 
 # Mount uploads directory for serving files
@@ -31,12 +36,33 @@ app.include_router(auth.router)
 app.include_router(family_members.router)
 app.include_router(documents.router)
 app.include_router(search.router)
+app.include_router(gedcom.router)
+app.include_router(duplicates.router)
+app.include_router(stats.router)
+app.include_router(sync.router)
+app.include_router(events.router)
+app.include_router(families.router)
+
+@app.exception_handler(WriterTimeout)
+async def writer_timeout_handler(request: Request, exc: WriterTimeout):
+    """Too many writers queued on SQLite: ask the client to retry rather than fail"""
+    print(f"Write to {request.url.path} gave up: {exc}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "The database is busy, please retry shortly"},
+        headers={"Retry-After": str(SQLITE_WRITER_RETRY_AFTER)},
+    )
 
 @app.on_event("startup")
 def on_startup():
     """Initialize database on startup"""
     init_db()
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Close pooled async connections; aiosqlite keeps a thread open for each"""
+    await async_engine.dispose()
+
 @app.get("/")
 def root():
     return {
@@ -48,3 +74,13 @@ def root():
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
+
+@app.get("/health/database")
+def database_health():
+    """Connection pool usage and, on SQLite, writer queue waits and lock errors."""
+    return database_stats(engine, async_engine)
+
+@app.get("/health/rate-limits")
+def rate_limit_health():
+    """Configured limits, requests admitted and rejected per limit, and requests in progress."""
+    return rate_limiter.stats()
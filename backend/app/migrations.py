@@ -0,0 +1,114 @@
+"""
+Schema upgrades for existing databases.
+
+`Base.metadata.create_all` only creates missing tables, so databases created
+by an older version never receive new columns or indexes. `upgrade_schema`
+runs after it on startup and adds whatever the models declare that the
+database lacks; that only inspects the schema, so it runs every time.
+
+Steps that touch data or objects metadata can't describe run once per
+database: each is recorded by name in `schema_steps` when it completes. To
+change what an applied step did, add a new step rather than editing it.
+"""
+from datetime import datetime
+from typing import Callable, List
+import logging
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, literal, select
+from sqlalchemy.engine import Connection, Engine
+
+from .models import Base
+from .services.fulltext import install_fulltext_search
+from .services.name_index import backfill_name_codes
+from .services.tree_stats import backfill_tree_stats
+from .utils.upsert import dialect_insert
+
+logger = logging.getLogger(__name__)
+
+# Extra steps for things metadata can't describe (triggers, virtual tables)
+# and data backfills, in order. Each receives an open connection inside the
+# upgrade transaction and is recorded under its function name.
+UPGRADE_STEPS: List[Callable[[Connection], None]] = [
+    install_fulltext_search,
+    backfill_name_codes,
+    backfill_tree_stats,
+]
+
+
+schema_steps = Table(
+    "schema_steps",
+    MetaData(),
+    Column("name", String(100), primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _column_default(connection: Connection, column) -> str:
+    """DEFAULT clause for a column added to a table that may already have rows."""
+    if column.server_default is not None:
+        return f" DEFAULT {column.server_default.arg}"
+    if column.default is not None and column.default.is_scalar:
+        value = literal(column.default.arg, column.type).compile(
+            dialect=connection.dialect, compile_kwargs={"literal_binds": True}
+        )
+        return f" DEFAULT {value}"
+    if not column.nullable:
+        raise RuntimeError(
+            f"Cannot add NOT NULL column {column.table.name}.{column.name} without a default; "
+            "give it a server_default or add an upgrade step that fills it"
+        )
+    return ""
+
+
+def _add_missing_columns(connection: Connection) -> None:
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=connection.dialect)
+            # Existing rows take the default, so counters start from a real value
+            default = _column_default(connection, column)
+            not_null = "" if column.nullable else " NOT NULL"
+            connection.exec_driver_sql(
+                f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}{default}{not_null}'
+            )
+            logger.info(f"Added column {table.name}.{column.name}")
+
+
+def _add_missing_indexes(connection: Connection) -> None:
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=connection)
+                logger.info(f"Created index {index.name}")
+
+
+def _run_pending_steps(connection: Connection) -> None:
+    schema_steps.create(connection, checkfirst=True)
+    applied = set(connection.scalars(select(schema_steps.c.name)))
+    for step in UPGRADE_STEPS:
+        if step.__name__ in applied:
+            continue
+        step(connection)
+        # Another worker starting at the same moment may have run it too; steps are idempotent
+        connection.execute(
+            dialect_insert(connection, schema_steps).on_conflict_do_nothing(),
+            {"name": step.__name__, "applied_at": datetime.utcnow()}
+        )
+        logger.info(f"Applied schema step {step.__name__}")
+
+
+def upgrade_schema(engine: Engine) -> None:
+    """Add columns, indexes and extra objects the models need but the database lacks."""
+    with engine.begin() as connection:
+        _add_missing_columns(connection)
+        _add_missing_indexes(connection)
+        _run_pending_steps(connection)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, Text, ForeignKey, DateTime, Boolean, Enum
+from sqlalchemy import Column, Integer, String, Date, Text, ForeignKey, DateTime, Boolean, Enum, Index, Float, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -21,6 +21,9 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+    # Advanced by every change to the user's members, marriages or documents
+    tree_version = Column(Integer, nullable=False, default=0, server_default="0")
+    tree_modified_at = Column(DateTime)
 
     # Relationships
     family_members = relationship("FamilyMember", back_populates="owner")
@@ -66,12 +69,20 @@ class FamilyMember(Base):
     marriages = relationship("Marriage", foreign_keys="Marriage.person1_id", back_populates="person1")
     marriages_as_spouse = relationship("Marriage", foreign_keys="Marriage.person2_id", back_populates="person2")
 
+    __table_args__ = (
+        # Covers user-scoped listing in id order and the pedigree graph load
+        Index("ix_family_members_user_id_pedigree", "user_id", "id", "father_id", "mother_id", "gender"),
+        # Child lookups; two equality columns so the planner prefers them over user_id alone
+        Index("ix_family_members_father_id", "father_id", "user_id"),
+        Index("ix_family_members_mother_id", "mother_id", "user_id"),
+    )
+
 class Marriage(Base):
     __tablename__ = "marriages"
 
     id = Column(Integer, primary_key=True, index=True)
-    person1_id = Column(Integer, ForeignKey("family_members.id"), nullable=False)
-    person2_id = Column(Integer, ForeignKey("family_members.id"), nullable=False)
+    person1_id = Column(Integer, ForeignKey("family_members.id"), nullable=False, index=True)
+    person2_id = Column(Integer, ForeignKey("family_members.id"), nullable=False, index=True)
 
     marriage_date = Column(Date)
     marriage_place = Column(String)
@@ -107,6 +118,11 @@ class Document(Base):
     owner = relationship("User", back_populates="documents")
     family_member = relationship("FamilyMember", back_populates="documents")
 
+    __table_args__ = (
+        Index("ix_documents_user_id_id", "user_id", "id"),
+        Index("ix_documents_family_member_id", "family_member_id", "user_id"),
+    )
+
 class SearchHistory(Base):
     __tablename__ = "search_history"
 
@@ -119,3 +135,82 @@ class SearchHistory(Base):
     sources_searched = Column(String)  # JSON string of sources
 
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_search_history_user_id_created_at", "user_id", "created_at", "id"),
+    )
+
+class PossibleDuplicate(Base):
+    __tablename__ = "possible_duplicates"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # Stored with member1_id < member2_id so each pair appears once
+    member1_id = Column(Integer, ForeignKey("family_members.id"), nullable=False)
+    member2_id = Column(Integer, ForeignKey("family_members.id"), nullable=False)
+
+    score = Column(Float, nullable=False)
+    reasons = Column(String)  # Comma-separated fields that matched
+    status = Column(String, default="pending")  # pending, dismissed
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "member1_id", "member2_id", name="uq_possible_duplicates_pair"),
+        # Review queue: best candidates first
+        Index("ix_possible_duplicates_user_id_status_score", "user_id", "status", "score", "id"),
+        Index("ix_possible_duplicates_user_id_member2_id", "user_id", "member2_id"),
+    )
+
+class NameCode(Base):
+    __tablename__ = "name_codes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    member_id = Column(Integer, ForeignKey("family_members.id"), nullable=False)
+
+    field = Column(String, nullable=False)  # given, surname
+    algorithm = Column(String, nullable=False)  # soundex, daitch_mokotoff, metaphone
+    code = Column(String, nullable=False)
+
+    __table_args__ = (
+        # Fuzzy lookup: codes for a name -> candidate members, without touching the table
+        Index("ix_name_codes_lookup", "user_id", "field", "algorithm", "code", "member_id"),
+        Index("ix_name_codes_member_id", "member_id"),
+    )
+
+class TreeStat(Base):
+    __tablename__ = "tree_stats"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    metric = Column(String, nullable=False)  # members, surname, gender, birth_place, birth_century, lifespan_century
+    bucket = Column(String, nullable=False, default="")  # e.g. the surname or century; "" for totals
+    count = Column(Integer, nullable=False, default=0)
+    total = Column(Float, nullable=False, default=0.0)  # sum of the measured value (lifespan years)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "metric", "bucket", name="uq_tree_stats_bucket"),
+        # Top-N reads per metric
+        Index("ix_tree_stats_user_id_metric_count", "user_id", "metric", "count"),
+    )
+
+class TreeChange(Base):
+    __tablename__ = "tree_changes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    # Latest change per row; deletes stay behind as tombstones
+    entity = Column(String, nullable=False)  # member, document, marriage
+    entity_id = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False)  # users.tree_version the change was committed at
+    deleted = Column(Boolean, nullable=False, default=False)
+    changed_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "entity", "entity_id", name="uq_tree_changes_entity"),
+        # Delta sync: everything after a version, entity columns included
+        Index("ix_tree_changes_user_id_version", "user_id", "version", "entity", "entity_id", "deleted"),
+    )
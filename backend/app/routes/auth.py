@@ -1,41 +1,67 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 
-from ..database import get_db
+from ..database import AsyncWriteSessionLocal, get_async_db, get_async_write_db
 from ..models import User
 from ..schemas import UserCreate, UserLogin, Token, User as UserSchema
+from ..services.passwords import PASSWORD_RETRY_AFTER, PasswordPoolSaturated, needs_rehash, password_hasher
+from ..sqlite_profile import WriterTimeout
 from ..utils.auth import (
-    verify_password,
-    get_password_hash,
     create_access_token,
     get_current_user,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
+from ..utils.token_cache import Principal, token_cache
 
 router = APIRouter(prefix="/api/auth", tags=["authentication"])
 
+def _saturated(e: PasswordPoolSaturated) -> HTTPException:
+    print(f"Password pool saturated: {e}")
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-ins in progress, please retry shortly",
+        headers={"Retry-After": str(PASSWORD_RETRY_AFTER)},
+    )
+
+async def rehash_password(user_id: int, password: str):
+    """Re-hash a password at the current bcrypt cost after a successful login"""
+    try:
+        hashed_password = await password_hasher.hash(password)
+        async with AsyncWriteSessionLocal() as db:
+            await db.execute(update(User).where(User.id == user_id).values(hashed_password=hashed_password))
+            await db.commit()
+    except (PasswordPoolSaturated, SQLAlchemyError, WriterTimeout) as e:
+        # The old hash still works; try again at the next login
+        print(f"Could not rehash password for user {user_id}: {e}")
+
 @router.post("/register", response_model=UserSchema)
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_write_db)):
     """Register a new user"""
+    # Hash before the first query: on SQLite a write session's transaction
+    # holds the writer turn, which must not wait on bcrypt
+    try:
+        hashed_password = await password_hasher.hash(user.password)
+    except PasswordPoolSaturated as e:
+        raise _saturated(e)
+
     # Check if user already exists
-    db_user = db.query(User).filter(User.email == user.email).first()
-    if db_user:
+    if await db.scalar(select(User.id).where(User.email == user.email)):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
 
-    db_user = db.query(User).filter(User.username == user.username).first()
-    if db_user:
+    if await db.scalar(select(User.id).where(User.username == user.username)):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already taken"
         )
 
     # Create new user
-    hashed_password = get_password_hash(user.password)
     db_user = User(
         email=user.email,
         username=user.username,
@@ -43,17 +69,26 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
     )
 
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
 
     return db_user
 
 @router.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(
+    background_tasks: BackgroundTasks,
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_async_db)
+):
     """Login and get access token"""
-    user = db.query(User).filter(User.username == form_data.username).first()
+    user = await db.scalar(select(User).where(User.username == form_data.username))
 
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    try:
+        valid = user is not None and await password_hasher.verify(form_data.password, user.hashed_password)
+    except PasswordPoolSaturated as e:
+        raise _saturated(e)
+
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -66,6 +101,9 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
             detail="User account is inactive"
         )
 
+    if needs_rehash(user.hashed_password):
+        background_tasks.add_task(rehash_password, user.id, form_data.password)
+
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
@@ -74,6 +112,16 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=UserSchema)
-def get_current_user_info(current_user: User = Depends(get_current_user)):
+def get_current_user_info(current_user: Principal = Depends(get_current_user)):
     """Get current user information"""
     return current_user
+
+@router.get("/token-cache/stats")
+def get_token_cache_stats(current_user: Principal = Depends(get_current_user)):
+    """Hit rate and size of this worker's verified-token cache"""
+    return token_cache.stats()
+
+@router.get("/password-pool/stats")
+def get_password_pool_stats(current_user: Principal = Depends(get_current_user)):
+    """Load on this worker's password hashing pool"""
+    return password_hasher.stats()
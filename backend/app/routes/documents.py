@@ -1,5 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 import os
 import shutil
@@ -7,10 +9,14 @@ from pathlib import Path
 import uuid
 from datetime import datetime
 
-from ..database import get_db
-from ..models import User, Document, FamilyMember
+from ..database import get_async_db, get_async_write_db
+from ..models import Document, FamilyMember
 from ..schemas import Document as DocumentSchema
-from ..utils.auth import get_current_user
+from ..services.tree_version import bump_tree_version, tree_state
+from ..utils.auth import get_current_user_async
+from ..utils.token_cache import Principal
+from ..utils.conditional import cache_headers, not_modified
+from ..utils.pagination import MAX_PAGE_SIZE, count_rows_async, keyset_page_async, set_page_headers
 
 router = APIRouter(prefix="/api/documents", tags=["documents"])
 
@@ -35,8 +41,9 @@ async def upload_document(
     family_member_id: Optional[int] = Form(None),
     source: Optional[str] = Form("uploaded"),
     source_url: Optional[str] = Form(None),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    write_db: AsyncSession = Depends(get_async_write_db),
+    current_user: Principal = Depends(get_current_user_async)
 ):
     """Upload a document or image"""
     # Check file size
@@ -52,10 +59,10 @@ async def upload_document(
 
     # Verify family member belongs to user if provided
     if family_member_id:
-        member = db.query(FamilyMember).filter(
+        member = await db.scalar(select(FamilyMember.id).where(
             FamilyMember.id == family_member_id,
             FamilyMember.user_id == current_user.id
-        ).first()
+        ))
         if not member:
             raise HTTPException(status_code=404, detail="Family member not found")
 
@@ -71,16 +78,17 @@ async def upload_document(
     unique_filename = f"{uuid.uuid4()}{file_extension}"
     file_path = f"{UPLOAD_DIR}/{subdir}/{unique_filename}"
 
-    # Save file
+    # Save file, off the event loop
     try:
-        save_upload_file(file, Path(file_path))
+        await run_in_threadpool(save_upload_file, file, Path(file_path))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Could not save file: {str(e)}"
         )
 
-    # Create database record
+    # Create database record. Only now is the write session used, so the
+    # writer turn is not held while the file is saved
     db_document = Document(
         user_id=current_user.id,
         family_member_id=family_member_id,
@@ -93,40 +101,62 @@ async def upload_document(
         source_url=source_url
     )
 
-    db.add(db_document)
-    db.commit()
-    db.refresh(db_document)
+    try:
+        write_db.add(db_document)
+        await write_db.flush()
+        await write_db.run_sync(bump_tree_version, current_user.id, upserted={"document": [db_document.id]})
+        await write_db.commit()
+    except Exception:
+        # No record, so don't keep the file
+        Path(file_path).unlink(missing_ok=True)
+        raise
+    await write_db.refresh(db_document)
 
     return db_document
 
 @router.get("", response_model=List[DocumentSchema])
-def get_documents(
+async def get_documents(
+    request: Request,
+    response: Response,
     family_member_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-    skip: int = 0,
-    limit: int = 100
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user_async),
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    include_total: bool = False,
+    skip: int = Query(0, ge=0, deprecated=True)
 ):
-    """Get documents for current user, optionally filtered by family member"""
-    query = db.query(Document).filter(Document.user_id == current_user.id)
+    """
+    Get documents for current user, optionally filtered by family member.
+    Ordered by id; the next page's cursor is returned in X-Next-Cursor.
+    """
+    tree = await db.run_sync(tree_state, current_user.id)
+    cached = not_modified(request, tree)
+    if cached:
+        return cached
+    response.headers.update(cache_headers(tree))
+
+    query = select(Document).where(Document.user_id == current_user.id)
 
     if family_member_id:
-        query = query.filter(Document.family_member_id == family_member_id)
+        query = query.where(Document.family_member_id == family_member_id)
+
+    documents, next_cursor = await keyset_page_async(db, query, [Document.id], cursor, limit, skip=skip)
+    set_page_headers(response, next_cursor, await count_rows_async(db, query) if include_total else None)
 
-    documents = query.offset(skip).limit(limit).all()
     return documents
 
 @router.get("/{document_id}", response_model=DocumentSchema)
-def get_document(
+async def get_document(
     document_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user_async)
 ):
     """Get a specific document"""
-    document = db.query(Document).filter(
+    document = await db.scalar(select(Document).where(
         Document.id == document_id,
         Document.user_id == current_user.id
-    ).first()
+    ))
 
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
@@ -134,16 +164,16 @@ def get_document(
     return document
 
 @router.delete("/{document_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_document(
+async def delete_document(
     document_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_write_db),
+    current_user: Principal = Depends(get_current_user_async)
 ):
     """Delete a document"""
-    document = db.query(Document).filter(
+    document = await db.scalar(select(Document).where(
         Document.id == document_id,
         Document.user_id == current_user.id
-    ).first()
+    ))
 
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
@@ -156,7 +186,8 @@ def delete_document(
         print(f"Error deleting file: {e}")
 
     # Delete database record
-    db.delete(document)
-    db.commit()
+    await db.delete(document)
+    await db.run_sync(bump_tree_version, current_user.id, deleted={"document": [document_id]})
+    await db.commit()
 
     return None
@@ -0,0 +1,107 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.orm import Session
+from typing import List, Optional
+
+from ..database import get_db, get_write_db
+from ..models import PossibleDuplicate
+from ..schemas import (
+    FamilyMember as FamilyMemberSchema,
+    PossibleDuplicate as PossibleDuplicateSchema,
+    DuplicateScanResult,
+    DuplicateMerge
+)
+from ..services.duplicates import merge_duplicate, replace_candidates, scan_duplicates
+from ..services.pedigree_graph import pedigree_index
+from ..utils.auth import get_current_user
+from ..utils.rate_limit import rate_limit
+from ..utils.token_cache import Principal
+from ..utils.pagination import MAX_PAGE_SIZE, count_rows, keyset_page, set_page_headers
+
+router = APIRouter(prefix="/api/duplicates", tags=["duplicates"])
+
+@router.post("/scan", response_model=DuplicateScanResult, dependencies=[Depends(rate_limit("duplicate_scan", get_current_user))])
+def scan_for_duplicates(
+    db: Session = Depends(get_db),
+    write_db: Session = Depends(get_write_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Look for members who may be the same person and replace the pending
+    review queue with the results. Dismissed pairs stay dismissed.
+    """
+    pairs, stats = scan_duplicates(db, current_user.id)
+    # The scan runs on a read session; the writer is only taken to store the results
+    db.rollback()
+    candidates = replace_candidates(write_db, current_user.id, pairs)
+    write_db.commit()
+    return {**stats, "candidates": candidates}
+
+@router.get("", response_model=List[PossibleDuplicateSchema])
+def get_possible_duplicates(
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    include_total: bool = False
+):
+    """Get pending duplicate candidates, best match first"""
+    query = db.query(PossibleDuplicate).filter(
+        PossibleDuplicate.user_id == current_user.id,
+        PossibleDuplicate.status == "pending"
+    )
+
+    candidates, next_cursor = keyset_page(
+        query, [PossibleDuplicate.score, PossibleDuplicate.id], cursor, limit, descending=True
+    )
+    set_page_headers(response, next_cursor, count_rows(query) if include_total else None)
+
+    return candidates
+
+@router.post("/{candidate_id}/dismiss", response_model=PossibleDuplicateSchema)
+def dismiss_duplicate(
+    candidate_id: int,
+    db: Session = Depends(get_write_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Mark a candidate pair as different people so later scans skip it"""
+    candidate = db.query(PossibleDuplicate).filter(
+        PossibleDuplicate.id == candidate_id,
+        PossibleDuplicate.user_id == current_user.id
+    ).first()
+
+    if not candidate:
+        raise HTTPException(status_code=404, detail="Duplicate candidate not found")
+
+    candidate.status = "dismissed"
+    db.commit()
+    db.refresh(candidate)
+
+    return candidate
+
+@router.post("/{candidate_id}/merge", response_model=FamilyMemberSchema)
+def merge_duplicates(
+    candidate_id: int,
+    merge: DuplicateMerge,
+    db: Session = Depends(get_write_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Merge a candidate pair into one member and return the member kept.
+    Children, documents and marriages of the other member move across.
+    """
+    try:
+        member = merge_duplicate(db, current_user.id, candidate_id, merge.keep_id)
+    except LookupError as e:
+        db.rollback()
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    db.commit()
+    db.refresh(member)
+
+    # Children and marriages were re-pointed in bulk; reload the graph
+    pedigree_index.invalidate(current_user.id)
+
+    return member
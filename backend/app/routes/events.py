@@ -0,0 +1,83 @@
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+from typing import Dict, Optional
+import asyncio
+import json
+import os
+
+from ..database import AsyncSessionLocal
+from ..services.events import event_bus
+from ..services.tree_version import tree_state
+from ..utils.auth import get_current_user, get_current_user_for_stream
+from ..utils.token_cache import Principal
+
+router = APIRouter(prefix="/api/events", tags=["events"])
+
+EVENT_HEARTBEAT_SECONDS = float(os.getenv("EVENT_HEARTBEAT_SECONDS", "15"))
+# Browser reconnect delay after a dropped connection
+EVENT_RETRY_MS = 5000
+
+def format_event(name: str, data: Dict, event_id: Optional[int] = None) -> str:
+    lines = [f"event: {name}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+@router.get("")
+async def stream_events(
+    request: Request,
+    current_user: Principal = Depends(get_current_user_for_stream)
+):
+    """
+    Server-Sent Events feed of changes to the current user's tree.
+
+    The first event, `ready`, carries the tree version at connection time;
+    sync from your last known version up to it through /api/sync, then apply
+    each `change` event (new version plus upserted and deleted ids). An
+    `overflow` event means this connection fell too far behind and was
+    closed: reconnect and sync again.
+    """
+    user_id = current_user.id
+    # Subscribe before reading the version, so a write committed in between is
+    # queued rather than lost; events the `ready` version already covers are skipped
+    subscription = event_bus.subscribe(user_id)
+    try:
+        # A short-lived session, so no connection is held for the life of the stream
+        async with AsyncSessionLocal() as db:
+            version = (await db.run_sync(tree_state, user_id)).tree_version or 0
+    except BaseException:
+        event_bus.unsubscribe(subscription)
+        raise
+
+    async def stream():
+        try:
+            yield f"retry: {EVENT_RETRY_MS}\n" + format_event("ready", {"version": version}, version)
+            while True:
+                try:
+                    item = await asyncio.wait_for(subscription.get(), EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                if item is None:
+                    yield format_event("overflow", {"detail": "Too many undelivered events; reconnect and sync"})
+                    break
+                if item["version"] <= version:
+                    continue
+                yield format_event("change", item, item["version"])
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        # Proxies must pass events through as they are written
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/stats")
+def get_event_stats(current_user: Principal = Depends(get_current_user)):
+    """Live listener count and events published or dropped by this process"""
+    return event_bus.stats()
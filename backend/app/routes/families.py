@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.orm import Session
+from typing import List
+
+from ..database import get_db
+from ..schemas import FamilyBatchRequest, MemberFamilies
+from ..services.families import load_families
+from ..services.tree_version import tree_state
+from ..utils.auth import get_current_user
+from ..utils.token_cache import Principal
+from ..utils.conditional import cache_headers, not_modified
+
+router = APIRouter(prefix="/api/families", tags=["families"])
+
+@router.get("/{member_id}", response_model=MemberFamilies)
+def get_families(
+    member_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Every family a member heads: each marriage with the spouse and the
+    couple's children, then co-parents with no recorded marriage, then
+    children whose other parent is unknown.
+    """
+    tree = tree_state(db, current_user.id)
+    cached = not_modified(request, tree)
+    if cached:
+        return cached
+
+    try:
+        families = load_families(db, current_user.id, [member_id])
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Family member not found")
+
+    response.headers.update(cache_headers(tree))
+    return families[0]
+
+@router.post("/batch", response_model=List[MemberFamilies])
+def get_families_batch(
+    request: FamilyBatchRequest,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Families of many members at once (for example a whole generation), in request order"""
+    try:
+        return load_families(db, current_user.id, request.member_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
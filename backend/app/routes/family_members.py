@@ -1,19 +1,45 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+import json
 
-from ..database import get_db
-from ..models import User, FamilyMember
-from ..schemas import FamilyMemberCreate, FamilyMemberUpdate, FamilyMember as FamilyMemberSchema
+from ..database import get_db, get_write_db, SessionLocal
+from ..models import FamilyMember
+from ..schemas import (
+    FamilyMemberCreate,
+    FamilyMemberUpdate,
+    FamilyMember as FamilyMemberSchema,
+    Ancestor as AncestorSchema,
+    Relationship as RelationshipSchema,
+    NameMatch as NameMatchSchema,
+    RelationshipBatchRequest,
+    Implex as ImplexSchema,
+    FamilyMemberBatch,
+    FamilyMemberBatchResult
+)
+from ..services import lineage, name_index, tree_stats
+from ..services.tree import fetch_node_fields, fetch_tree_columns
+from ..services.layout import compute_layout
+from ..services.implex import analyze_implex
+from ..services.member_batch import apply_batch, batch_result, detach_members
+from ..services.duplicates import forget_members
+from ..services.relationships import MAX_RELATIONSHIP_BATCH, describe_relationship, describe_relationships
+from ..services.pedigree_graph import pedigree_index
+from ..services.tree_version import bump_tree_version, tree_state
 from ..utils.auth import get_current_user
+from ..utils.token_cache import Principal
+from ..utils.conditional import cache_headers, not_modified
+from ..utils.pagination import MAX_PAGE_SIZE, count_rows, keyset_page, set_page_headers
 
 router = APIRouter(prefix="/api/family-members", tags=["family_members"])
 
 @router.post("", response_model=FamilyMemberSchema, status_code=status.HTTP_201_CREATED)
 def create_family_member(
     member: FamilyMemberCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_write_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Create a new family member"""
     # Verify parent IDs belong to current user if provided
@@ -35,30 +61,127 @@ def create_family_member(
 
     db_member = FamilyMember(**member.model_dump(), user_id=current_user.id)
     db.add(db_member)
+    db.flush()
+    name_index.index_member(db, db_member)
+    tree_stats.record_changes(db, current_user.id, added=[tree_stats.snapshot(db_member)])
+    version = bump_tree_version(db, current_user.id, upserted={"member": [db_member.id]})
     db.commit()
     db.refresh(db_member)
 
+    pedigree_index.member_saved(current_user.id, db_member, version)
+
     return db_member
 
+@router.post("/batch", response_model=FamilyMemberBatchResult)
+def batch_family_members(
+    batch: FamilyMemberBatch,
+    db: Session = Depends(get_write_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Create, update and delete many family members in one transaction.
+    New members can name each other as parents through `temp_id`s. Children
+    of deleted members lose that parent and are returned in `detached`.
+    """
+    try:
+        applied = apply_batch(db, current_user.id, batch)
+    except LookupError as e:
+        db.rollback()
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    db.commit()
+    result = batch_result(db, applied)
+
+    pedigree_index.members_saved(
+        current_user.id, result["created"] + result["updated"], result["version"], result["deleted"]
+    )
+
+    return result
+
 @router.get("", response_model=List[FamilyMemberSchema])
 def get_family_members(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-    skip: int = 0,
-    limit: int = 100
+    current_user: Principal = Depends(get_current_user),
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    include_total: bool = False,
+    skip: int = Query(0, ge=0, deprecated=True)
 ):
-    """Get all family members for current user"""
-    members = db.query(FamilyMember).filter(
-        FamilyMember.user_id == current_user.id
-    ).offset(skip).limit(limit).all()
+    """
+    Get family members for current user, ordered by id. The next page's cursor
+    is returned in the X-Next-Cursor header.
+    """
+    tree = tree_state(db, current_user.id)
+    cached = not_modified(request, tree)
+    if cached:
+        return cached
+    response.headers.update(cache_headers(tree))
+
+    query = db.query(FamilyMember).filter(FamilyMember.user_id == current_user.id)
+
+    members, next_cursor = keyset_page(query, [FamilyMember.id], cursor, limit, skip=skip)
+    set_page_headers(response, next_cursor, count_rows(query) if include_total else None)
 
     return members
 
+@router.get("/tree")
+def get_family_tree(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Get the entire tree as parallel arrays (ids, names, years, parent ids,
+    gender codes). Index i of every array describes the same person.
+    """
+    tree = tree_state(db, current_user.id)
+    cached = not_modified(request, tree)
+    if cached:
+        return cached
+    # Returned as a raw JSONResponse to skip per-element encoding of large arrays
+    return JSONResponse(fetch_tree_columns(db, current_user.id), headers=cache_headers(tree))
+
+@router.get("/lookup", response_model=List[NameMatchSchema])
+def lookup_family_members(
+    first_name: Optional[str] = None,
+    last_name: Optional[str] = None,
+    max_distance: Optional[int] = Query(None, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Find family members whose names sound like the given names (Soundex,
+    Daitch-Mokotoff or Double Metaphone), closest spelling first.
+    """
+    try:
+        return name_index.fuzzy_lookup(db, current_user.id, first_name, last_name, max_distance, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/graph-index/stats")
+def get_graph_index_stats(
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Report hit rate and memory footprint of the in-memory pedigree index"""
+    graph = pedigree_index.get(db, current_user.id)
+    with graph.lock:
+        return {
+            **pedigree_index.stats(),
+            "user_members": len(graph),
+            "user_memory_bytes": graph.memory_bytes()
+        }
+
 @router.get("/{member_id}", response_model=FamilyMemberSchema)
 def get_family_member(
     member_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """Get a specific family member"""
     member = db.query(FamilyMember).filter(
@@ -75,8 +198,8 @@ def get_family_member(
 def update_family_member(
     member_id: int,
     member_update: FamilyMemberUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_write_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Update a family member"""
     db_member = db.query(FamilyMember).filter(
@@ -89,21 +212,30 @@ def update_family_member(
 
     # Update fields
     update_data = member_update.model_dump(exclude_unset=True)
+    before = tree_stats.snapshot(db_member)
     for field, value in update_data.items():
         setattr(db_member, field, value)
 
+    if update_data.keys() & set(name_index.NAME_COLUMNS):
+        db.flush()
+        name_index.index_member(db, db_member)
+    if update_data.keys() & set(tree_stats.STAT_COLUMNS):
+        tree_stats.record_changes(db, current_user.id, [before], [tree_stats.snapshot(db_member)])
+    version = bump_tree_version(db, current_user.id, upserted={"member": [member_id]})
     db.commit()
     db.refresh(db_member)
 
+    pedigree_index.member_saved(current_user.id, db_member, version)
+
     return db_member
 
 @router.delete("/{member_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_family_member(
     member_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_write_db),
+    current_user: Principal = Depends(get_current_user)
 ):
-    """Delete a family member"""
+    """Delete a family member; their children lose that parent, documents are unlinked and marriages removed"""
     member = db.query(FamilyMember).filter(
         FamilyMember.id == member_id,
         FamilyMember.user_id == current_user.id
@@ -112,42 +244,100 @@ def delete_family_member(
     if not member:
         raise HTTPException(status_code=404, detail="Family member not found")
 
+    forget_members(db, current_user.id, [member_id])
+    name_index.drop_members(db, current_user.id, [member_id])
+    tree_stats.record_changes(db, current_user.id, removed=[tree_stats.snapshot(member)])
+    detached = detach_members(db, current_user.id, [member_id])
     db.delete(member)
+    version = bump_tree_version(
+        db,
+        current_user.id,
+        upserted={"member": detached["children"], "document": detached["documents"]},
+        deleted={"member": [member_id], "marriage": detached["marriages"]}
+    )
     db.commit()
 
+    pedigree_index.member_deleted(current_user.id, member_id, version)
+
     return None
 
 @router.get("/{member_id}/children", response_model=List[FamilyMemberSchema])
 def get_children(
     member_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """Get children of a family member"""
-    member = db.query(FamilyMember).filter(
-        FamilyMember.id == member_id,
-        FamilyMember.user_id == current_user.id
-    ).first()
+    graph = pedigree_index.get(db, current_user.id)
+    with graph.lock:
+        if member_id not in graph:
+            raise HTTPException(status_code=404, detail="Family member not found")
+        child_ids = graph.children_of(member_id)
 
-    if not member:
-        raise HTTPException(status_code=404, detail="Family member not found")
+    if not child_ids:
+        return []
 
     children = db.query(FamilyMember).filter(
-        ((FamilyMember.father_id == member_id) | (FamilyMember.mother_id == member_id)),
+        FamilyMember.id.in_(child_ids),
         FamilyMember.user_id == current_user.id
     ).all()
 
     return children
 
-@router.get("/{member_id}/ancestors", response_model=List[FamilyMemberSchema])
+@router.get(
+    "/{member_id}/ancestors",
+    response_model=List[AncestorSchema],
+    response_model_exclude_unset=True
+)
 def get_ancestors(
+    request: Request,
+    response: Response,
     member_id: int,
-    generations: int = 3,
+    generations: int = Query(lineage.DEFAULT_ANCESTOR_GENERATIONS, ge=1, le=lineage.MAX_GENERATIONS),
+    fields: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
-    """Get ancestors of a family member up to specified generations"""
-    member = db.query(FamilyMember).filter(
+    """
+    Get ancestors of a family member up to `generations` (default 3).
+    Each ancestor carries its generation and Ahnentafel number. `fields` is a
+    comma-separated list of columns to return.
+    """
+    tree = tree_state(db, current_user.id)
+    cached = not_modified(request, tree)
+    if cached:
+        return cached
+
+    try:
+        requested = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+        ancestors = lineage.get_ancestors(db, current_user.id, member_id, generations, requested)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    response.headers.update(cache_headers(tree))
+    return ancestors
+
+@router.get("/{member_id}/descendants")
+def get_descendants(
+    request: Request,
+    member_id: int,
+    depth: Optional[int] = Query(None, ge=1, le=lineage.MAX_GENERATIONS),
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Stream descendants of a family member as NDJSON, one person per line in
+    generation order, optionally limited to `depth` generations.
+    """
+    tree = tree_state(db, current_user.id)
+    cached = not_modified(request, tree)
+    if cached:
+        return cached
+
+    member = db.query(FamilyMember.id).filter(
         FamilyMember.id == member_id,
         FamilyMember.user_id == current_user.id
     ).first()
@@ -155,28 +345,115 @@ def get_ancestors(
     if not member:
         raise HTTPException(status_code=404, detail="Family member not found")
 
-    ancestors = []
-    current_generation = [member]
-
-    for _ in range(generations):
-        next_generation = []
-        for person in current_generation:
-            if person.father_id:
-                father = db.query(FamilyMember).filter(
-                    FamilyMember.id == person.father_id
-                ).first()
-                if father and father not in ancestors:
-                    ancestors.append(father)
-                    next_generation.append(father)
-
-            if person.mother_id:
-                mother = db.query(FamilyMember).filter(
-                    FamilyMember.id == person.mother_id
-                ).first()
-                if mother and mother not in ancestors:
-                    ancestors.append(mother)
-                    next_generation.append(mother)
-
-        current_generation = next_generation
+    requested = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    try:
+        lineage.resolve_fields(requested)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    return ancestors
+    user_id = current_user.id
+    headers = cache_headers(tree)
+
+    def stream():
+        # The request-scoped session may be closed before the body is sent,
+        # so the stream holds its own session for the lifetime of the cursor.
+        stream_db = SessionLocal()
+        try:
+            for row in lineage.iter_descendants(stream_db, user_id, member_id, depth, requested):
+                yield json.dumps(jsonable_encoder(row)) + "\n"
+        finally:
+            stream_db.close()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson", headers=headers)
+
+@router.get("/{member_id}/layout")
+def get_layout(
+    request: Request,
+    response: Response,
+    member_id: int,
+    chart: str = Query("descendants", pattern="^(descendants|pedigree)$"),
+    generations: Optional[int] = Query(None, ge=1, le=lineage.MAX_GENERATIONS),
+    min_x: Optional[float] = None,
+    max_x: Optional[float] = None,
+    min_y: Optional[float] = None,
+    max_y: Optional[float] = None,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Get x/y positions for a descendant or pedigree chart rooted at a family
+    member. Pass min_x/max_x/min_y/max_y to receive only the nodes and
+    family connectors inside that box; `bounds` always covers the whole chart.
+    Each node carries the member's name, gender and birth and death years.
+    """
+    tree = tree_state(db, current_user.id)
+    cached = not_modified(request, tree)
+    if cached:
+        return cached
+    response.headers.update(cache_headers(tree))
+
+    graph = pedigree_index.get(db, current_user.id)
+    with graph.lock:
+        if member_id not in graph:
+            raise HTTPException(status_code=404, detail="Family member not found")
+        layout = compute_layout(graph, chart, member_id, generations)
+        view = layout.viewport(min_x, max_x, min_y, max_y)
+
+    # Layouts are cached, so the nodes are copied rather than filled in place
+    fields = fetch_node_fields(db, current_user.id, [node["id"] for node in view["nodes"]])
+    view["nodes"] = [{**node, **fields.get(node["id"], {})} for node in view["nodes"]]
+    return view
+
+@router.get("/{member_id}/implex", response_model=ImplexSchema)
+def get_implex(
+    member_id: int,
+    generations: int = Query(10, ge=1, le=lineage.MAX_GENERATIONS),
+    top: int = Query(20, ge=1, le=500, description="Repeated and common ancestors to list"),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Pedigree collapse and Wright's coefficient of inbreeding for a family
+    member over the given number of generations, with the ancestors who
+    appear through more than one line.
+    """
+    graph = pedigree_index.get(db, current_user.id)
+    with graph.lock:
+        if member_id not in graph:
+            raise HTTPException(status_code=404, detail="Family member not found")
+        return analyze_implex(graph, member_id, generations, top)
+
+@router.get("/{member_id}/relationship/{other_id}", response_model=RelationshipSchema)
+def get_relationship(
+    member_id: int,
+    other_id: int,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Describe how one family member is related to another"""
+    graph = pedigree_index.get(db, current_user.id)
+    with graph.lock:
+        if member_id not in graph or other_id not in graph:
+            raise HTTPException(status_code=404, detail="Family member not found")
+        return describe_relationship(graph, member_id, other_id)
+
+@router.post("/{member_id}/relationships", response_model=List[RelationshipSchema])
+def get_relationships(
+    member_id: int,
+    request: RelationshipBatchRequest,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Describe how one family member is related to each of several others (at most 500)"""
+    if len(request.member_ids) > MAX_RELATIONSHIP_BATCH:
+        raise HTTPException(status_code=400, detail=f"Too many members. Max per request: {MAX_RELATIONSHIP_BATCH}")
+
+    graph = pedigree_index.get(db, current_user.id)
+    with graph.lock:
+        missing = [i for i in [member_id, *request.member_ids] if i not in graph]
+        if missing:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Family members not found: {', '.join(map(str, missing))}"
+            )
+        return describe_relationships(graph, member_id, request.member_ids)
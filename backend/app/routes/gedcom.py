@@ -0,0 +1,89 @@
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi.responses import StreamingResponse
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+from ..database import SessionLocal, WriteSessionLocal
+from ..services.gedcom import export_gedcom, import_gedcom
+from ..services.pedigree_graph import pedigree_index
+from ..utils.auth import get_current_user
+from ..utils.rate_limit import rate_limit
+from ..utils.token_cache import Principal
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["gedcom"])
+
+MAX_GEDCOM_SIZE = int(os.getenv("MAX_GEDCOM_SIZE", 209715200))  # 200MB default
+
+@router.post("/api/import/gedcom", dependencies=[Depends(rate_limit("gedcom_import", get_current_user))])
+def upload_gedcom(
+    file: UploadFile = File(...),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Import a GEDCOM file into the current user's tree.
+    Progress is streamed back as NDJSON events. Each event follows a commit,
+    so other writers are never held up for longer than one chunk; if the
+    import fails, the records already reported stay imported.
+    """
+    file.file.seek(0, 2)
+    file_size = file.file.tell()
+    file.file.seek(0)
+
+    if file_size > MAX_GEDCOM_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File too large. Max size: {MAX_GEDCOM_SIZE} bytes"
+        )
+
+    # The upload is closed when the request finishes, which may be before the
+    # stream has been consumed, so spool it to a file the stream owns.
+    spool = tempfile.NamedTemporaryFile(suffix=".ged", delete=False)
+    with spool:
+        shutil.copyfileobj(file.file, spool)
+
+    user_id = current_user.id
+
+    def stream():
+        import_db = WriteSessionLocal()
+        try:
+            with open(spool.name, "rb") as raw:
+                text = io.TextIOWrapper(raw, encoding="utf-8-sig", errors="replace")
+                for event in import_gedcom(import_db, user_id, text):
+                    # Commit before sending, so the write lock is not held while the client reads
+                    import_db.commit()
+                    if event["stage"] == "done":
+                        pedigree_index.invalidate(user_id)
+                    yield json.dumps(event) + "\n"
+        except Exception as e:
+            import_db.rollback()
+            logger.exception(f"GEDCOM import failed for user {user_id}")
+            yield json.dumps({"stage": "error", "detail": str(e)}) + "\n"
+        finally:
+            import_db.close()
+            os.remove(spool.name)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.get("/api/export/gedcom")
+def download_gedcom(current_user: Principal = Depends(get_current_user)):
+    """Export the current user's tree as a GEDCOM 5.5.1 file, streamed as it is generated"""
+    user_id = current_user.id
+
+    def stream():
+        export_db = SessionLocal()
+        try:
+            yield from export_gedcom(export_db, user_id)
+        finally:
+            export_db.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/plain; charset=utf-8",
+        headers={"Content-Disposition": 'attachment; filename="ancestree.ged"'}
+    )
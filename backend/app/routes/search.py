@@ -1,14 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
-from typing import Dict, List
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query, Response
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional
 import os
 
-from ..database import get_db
-from ..models import User, SearchHistory
-from ..schemas import SearchQuery, SearchResult
-from ..utils.auth import get_current_user
+from ..database import AsyncWriteSessionLocal, get_async_db
+from ..sqlite_profile import WriterTimeout
+from ..models import SearchHistory
+from ..schemas import SearchQuery, SearchResult, LocalSearchResult
+from ..utils.auth import get_current_user_async
+from ..utils.token_cache import Principal
+from ..utils.pagination import MAX_PAGE_SIZE, count_rows_async, keyset_page_async, set_page_headers
+from ..utils.rate_limit import rate_limit, rate_limiter
 from ..services.genealogy_scraper import GenealogySearchService
 from ..services.ai_search import AISearchService
+from ..services.fulltext import FullTextUnavailable, search_local
 
 router = APIRouter(prefix="/api/search", tags=["search"])
 
@@ -23,15 +30,14 @@ genealogy_service = GenealogySearchService(config={
 
 ai_service = AISearchService()
 
-def save_search_history(
-    db: Session,
+async def save_search_history(
     user_id: int,
     query: Dict,
     search_type: str,
     results_count: int,
     sources: List[str]
 ):
-    """Save search to history"""
+    """Save search to history. Runs after the response, so it opens its own session."""
     history = SearchHistory(
         user_id=user_id,
         query=str(query),
@@ -39,20 +45,40 @@ def save_search_history(
         results_count=results_count,
         sources_searched=",".join(sources)
     )
-    db.add(history)
-    db.commit()
-
-@router.post("/genealogy", response_model=Dict)
+    try:
+        async with AsyncWriteSessionLocal() as db:
+            db.add(history)
+            await db.commit()
+    except (SQLAlchemyError, WriterTimeout) as e:
+        # History is best-effort; the search itself already succeeded
+        print(f"Could not save search history: {e}")
+
+@router.post("/genealogy", response_model=Dict, dependencies=[Depends(rate_limit("genealogy_search"))])
 async def search_genealogy_records(
     query: SearchQuery,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    response: Response,
+    current_user: Principal = Depends(get_current_user_async)
 ):
     """
     Search genealogy records across multiple sources.
     If use_ai is True, AI will enhance the query and analyze results.
+    AI searches also count against the stricter ai_search limit.
     """
+    if not query.use_ai:
+        return await run_genealogy_search(query, background_tasks, current_user)
+    try:
+        handle = await rate_limiter.acquire("ai_search", current_user.id, response)
+    except HTTPException:
+        # Turned away before any work, so the genealogy_search token goes back
+        await rate_limiter.refund("genealogy_search", current_user.id)
+        raise
+    try:
+        return await run_genealogy_search(query, background_tasks, current_user)
+    finally:
+        await rate_limiter.release("ai_search", handle)
+
+async def run_genealogy_search(query: SearchQuery, background_tasks: BackgroundTasks, current_user: Principal) -> Dict:
     # Convert query to dict
     query_dict = {
         'first_name': query.first_name,
@@ -102,7 +128,6 @@ async def search_genealogy_records(
     # Save to search history in background
     background_tasks.add_task(
         save_search_history,
-        db,
         current_user.id,
         query_dict,
         "ai_assisted" if query.use_ai else "manual",
@@ -123,19 +148,56 @@ async def search_genealogy_records(
     return response
 
 @router.get("/history")
-def get_search_history(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-    skip: int = 0,
-    limit: int = 50
+async def get_search_history(
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user_async),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    include_total: bool = False,
+    skip: int = Query(0, ge=0, deprecated=True)
 ):
-    """Get user's search history"""
-    history = db.query(SearchHistory).filter(
-        SearchHistory.user_id == current_user.id
-    ).order_by(SearchHistory.created_at.desc()).offset(skip).limit(limit).all()
+    """
+    Get user's search history, newest first. The next page's cursor is
+    returned in the X-Next-Cursor header.
+    """
+    query = select(SearchHistory).where(SearchHistory.user_id == current_user.id)
+
+    history, next_cursor = await keyset_page_async(
+        db,
+        query,
+        [SearchHistory.created_at, SearchHistory.id],
+        cursor,
+        limit,
+        descending=True,
+        skip=skip
+    )
+    set_page_headers(response, next_cursor, await count_rows_async(db, query) if include_total else None)
 
     return history
 
+@router.get("/local", response_model=List[LocalSearchResult])
+async def search_local_records(
+    q: str = Query(..., min_length=1),
+    type: Optional[str] = Query(None, pattern="^(member|document)$"),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user_async)
+):
+    """
+    Full-text search of the user's own family members and documents, best
+    match first. `snippet` is HTML-escaped, with matching words wrapped in
+    <mark> tags.
+    """
+    kinds = [type] if type else ["member", "document"]
+    try:
+        return await db.run_sync(search_local, current_user.id, q, kinds, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FullTextUnavailable as e:
+        print(f"Local search unavailable: {e}")
+        raise HTTPException(status_code=503, detail="Full-text search is not available")
+
 @router.get("/sources")
 def get_available_sources():
     """Get list of available genealogy sources"""
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from ..database import get_db, get_write_db
+from ..schemas import TreeStats as TreeStatsSchema, TreeStatsRebuild
+from ..services.tree_stats import get_stats, rebuild_stats
+from ..utils.auth import get_current_user
+from ..utils.token_cache import Principal
+
+router = APIRouter(prefix="/api/stats", tags=["stats"])
+
+@router.get("", response_model=TreeStatsSchema)
+def get_tree_stats(
+    top: int = Query(10, ge=1, le=100, description="Surnames and places to list"),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Summary statistics for the current user's tree, maintained as members change"""
+    return get_stats(db, current_user.id, top)
+
+@router.post("/rebuild", response_model=TreeStatsRebuild)
+def rebuild_tree_stats(
+    db: Session = Depends(get_write_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Recompute the statistics from scratch, for repairs after out-of-band data edits"""
+    members = rebuild_stats(db, current_user.id)
+    db.commit()
+    return {"members": members}
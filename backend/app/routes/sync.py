@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..schemas import SyncResult
+from ..services.tree_version import changes_since, tree_state
+from ..utils.auth import get_current_user
+from ..utils.token_cache import Principal
+
+router = APIRouter(prefix="/api/sync", tags=["sync"])
+
+@router.get("", response_model=SyncResult)
+def sync_tree(
+    since: int = Query(0, ge=0, description="Tree version from the previous sync; 0 for everything"),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Members, documents and marriages created or changed since a tree
+    version, plus the ids of those deleted since. Store the returned
+    `version` and pass it as `since` next time.
+    """
+    version = tree_state(db, current_user.id).tree_version or 0
+    return changes_since(db, current_user.id, version, since)
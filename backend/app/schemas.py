@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import date, datetime
 from enum import Enum
 
@@ -80,6 +80,102 @@ class FamilyMember(FamilyMemberBase):
     class Config:
         from_attributes = True
 
+# Batch Schemas
+class BatchFamilyMemberCreate(FamilyMemberCreate):
+    """A create in a batch; `temp_id` lets other entries in the batch refer to it."""
+    temp_id: Optional[str] = None
+    father_temp_id: Optional[str] = None
+    mother_temp_id: Optional[str] = None
+
+class BatchFamilyMemberUpdate(FamilyMemberUpdate):
+    id: int
+    father_temp_id: Optional[str] = None
+    mother_temp_id: Optional[str] = None
+
+class FamilyMemberBatch(BaseModel):
+    create: List[BatchFamilyMemberCreate] = []
+    update: List[BatchFamilyMemberUpdate] = []
+    delete: List[int] = []
+
+class FamilyMemberBatchResult(BaseModel):
+    created: List[FamilyMember]
+    updated: List[FamilyMember]
+    deleted: List[int]
+    detached: List[FamilyMember] = []  # children who lost a deleted parent
+    temp_ids: Dict[str, int]
+
+class Ancestor(BaseModel):
+    """Family member row annotated with its place in a pedigree.
+
+    Every column is optional so `fields` projections can return a subset.
+    """
+    id: int
+    generation: int
+    ahnentafel: int
+    user_id: Optional[int] = None
+    first_name: Optional[str] = None
+    middle_name: Optional[str] = None
+    last_name: Optional[str] = None
+    maiden_name: Optional[str] = None
+    gender: Optional[Gender] = None
+    birth_date: Optional[date] = None
+    birth_place: Optional[str] = None
+    death_date: Optional[date] = None
+    death_place: Optional[str] = None
+    burial_place: Optional[str] = None
+    occupation: Optional[str] = None
+    biography: Optional[str] = None
+    notes: Optional[str] = None
+    father_id: Optional[int] = None
+    mother_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class CommonAncestor(BaseModel):
+    id: int
+    generations_from_a: int
+    generations_from_b: int
+
+class Relationship(BaseModel):
+    person_a_id: int
+    person_b_id: int
+    related: bool
+    label: Optional[str] = None
+    generations_from_a: Optional[int] = None
+    generations_from_b: Optional[int] = None
+    common_ancestors: List[CommonAncestor] = []
+
+class RelationshipBatchRequest(BaseModel):
+    member_ids: List[int]
+
+class ImplexGeneration(BaseModel):
+    generation: int
+    possible: int  # ancestor slots in a pedigree without collapse
+    known: int  # slots filled by a recorded ancestor
+    distinct: int  # different people filling them
+
+class RepeatedAncestor(BaseModel):
+    id: int
+    appearances: int
+    generations: List[int]
+
+class InbreedingContribution(BaseModel):
+    id: int
+    contribution: float
+
+class Implex(BaseModel):
+    member_id: int
+    generations: int
+    possible_ancestors: int
+    known_ancestors: int
+    distinct_ancestors: int
+    pedigree_collapse: float  # percent of known slots filled by someone already counted
+    by_generation: List[ImplexGeneration]
+    repeated_ancestor_count: int
+    repeated_ancestors: List[RepeatedAncestor]
+    inbreeding_coefficient: float  # Wright's F
+    common_ancestors: List[InbreedingContribution]  # of the parents, by share of F
+
 # Marriage Schemas
 class MarriageBase(BaseModel):
     person1_id: int
@@ -142,3 +238,100 @@ class SearchResult(BaseModel):
     url: Optional[str] = None
     confidence_score: Optional[float] = None
     additional_info: Optional[dict] = None
+
+class NameMatch(BaseModel):
+    member: FamilyMember
+    distance: int  # edit distance between the query and the member's names
+    algorithms: List[str]  # phonetic codes the member shared with the query
+
+class LocalSearchResult(BaseModel):
+    type: str  # member or document
+    id: int
+    family_member_id: Optional[int] = None
+    title: str
+    snippet: Optional[str] = None
+    score: float
+
+# Duplicate Detection Schemas
+class PossibleDuplicate(BaseModel):
+    id: int
+    member1_id: int
+    member2_id: int
+    score: float
+    reasons: Optional[str] = None
+    status: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class DuplicateScanResult(BaseModel):
+    members: int
+    blocks: int
+    comparisons: int
+    candidates: int
+
+class DuplicateMerge(BaseModel):
+    # Member to keep; defaults to the lower id of the pair
+    keep_id: Optional[int] = None
+
+# Tree Statistics Schemas
+class SurnameCount(BaseModel):
+    surname: str
+    count: int
+
+class PlaceCount(BaseModel):
+    place: str
+    count: int
+
+class CenturyCount(BaseModel):
+    century: int
+    count: int
+
+class CenturyLifespan(BaseModel):
+    century: int
+    average_years: float
+    count: int  # members born that century with both dates known
+
+class GenerationStats(BaseModel):
+    depth: int
+    members_per_generation: List[int]  # generation 0 holds members with no recorded parents
+
+class TreeStats(BaseModel):
+    members: int
+    genders: Dict[str, int]
+    top_surnames: List[SurnameCount]
+    top_birth_places: List[PlaceCount]
+    births_by_century: List[CenturyCount]
+    average_lifespan_by_century: List[CenturyLifespan]
+    generations: GenerationStats
+
+class TreeStatsRebuild(BaseModel):
+    members: int
+
+# Sync Schemas
+class SyncDeleted(BaseModel):
+    members: List[int] = []
+    documents: List[int] = []
+    marriages: List[int] = []
+
+class SyncResult(BaseModel):
+    version: int  # pass back as `since` on the next sync
+    full: bool  # the whole tree is included; replace the local copy
+    members: List[FamilyMember]
+    documents: List[Document]
+    marriages: List[Marriage]
+    deleted: SyncDeleted
+
+# Family Unit Schemas
+class FamilyUnit(BaseModel):
+    marriage: Optional[Marriage] = None  # None for co-parents with no recorded marriage
+    spouse: Optional[FamilyMember] = None  # None when the other parent is unknown
+    children: List[FamilyMember]
+
+class MemberFamilies(BaseModel):
+    member: FamilyMember
+    families: List[FamilyUnit]
+
+class FamilyBatchRequest(BaseModel):
+    member_ids: List[int]
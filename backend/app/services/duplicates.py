@@ -0,0 +1,385 @@
+"""
+Duplicate-person detection.
+
+Comparing every pair of members is quadratic, so members are first grouped
+into blocks that share a phonetic surname (Soundex of the last or maiden
+name) and a birth decade. Decades are taken on two grids offset by five
+years, so two births less than five years apart always share a block;
+members without a birth date form their own per-surname block. Only pairs
+inside a block are scored, and large scans spread the blocks over a
+process pool. Its workers are spawned, not forked, since forking a threaded
+server can leave the child holding locks nobody will release.
+
+Each member is reduced to a tuple of pre-normalised features once, so
+scoring a pair is a handful of comparisons with no per-pair string
+normalisation.
+"""
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+import multiprocessing
+import os
+import threading
+
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from ..models import Document, FamilyMember, Gender, Marriage, PossibleDuplicate
+from ..utils.names import jaro_winkler, normalize_name, soundex
+from .name_index import drop_members, index_member
+from .pedigree_graph import GENDER_CODES
+from .tree_stats import record_changes, snapshot
+from .tree_version import bump_tree_version
+
+DUPLICATE_MIN_SCORE = float(os.getenv("DUPLICATE_MIN_SCORE", "0.85"))
+DUPLICATE_WORKERS = int(os.getenv("DUPLICATE_WORKERS", str(os.cpu_count() or 1)))
+
+# Scans with fewer comparisons than this run in-process; a pool costs more to start
+PARALLEL_MIN_COMPARISONS = 200_000
+# Comparisons handed to a worker per task
+TASK_COMPARISONS = 50_000
+# Blocks larger than this are split again by first-name Soundex
+MAX_BLOCK_SIZE = 2000
+
+# Fields copied onto the kept member when it has no value of its own
+MERGE_FIELDS = [
+    "middle_name", "maiden_name", "birth_date", "birth_place", "death_date",
+    "death_place", "burial_place", "occupation", "biography", "notes",
+    "father_id", "mother_id",
+]
+
+# Weight of each comparison in the score; a comparison counts only when both
+# members have the field
+WEIGHTS = {
+    "first_name": 0.30,
+    "last_name": 0.25,
+    "birth_date": 0.25,
+    "birth_place": 0.10,
+    "death_date": 0.10,
+}
+
+OPPOSITE_GENDERS = {GENDER_CODES[Gender.MALE], GENDER_CODES[Gender.FEMALE]}
+
+members = FamilyMember.__table__
+
+FEATURE_COLUMNS = [
+    members.c.id,
+    members.c.first_name,
+    members.c.last_name,
+    members.c.maiden_name,
+    members.c.gender,
+    members.c.birth_date,
+    members.c.birth_place,
+    members.c.death_date,
+    members.c.father_id,
+    members.c.mother_id,
+]
+
+
+class Person(NamedTuple):
+    id: int
+    first: str
+    last: str
+    maiden: str
+    gender: int
+    birth: Optional[date]
+    birth_place: str
+    death: Optional[date]
+    father_id: Optional[int]
+    mother_id: Optional[int]
+
+
+def to_person(row) -> Person:
+    return Person(
+        id=row.id,
+        first=normalize_name(row.first_name),
+        last=normalize_name(row.last_name),
+        maiden=normalize_name(row.maiden_name),
+        gender=GENDER_CODES.get(row.gender, 0),
+        birth=row.birth_date,
+        birth_place=normalize_name(row.birth_place),
+        death=row.death_date,
+        father_id=row.father_id,
+        mother_id=row.mother_id,
+    )
+
+
+def blocking_keys(person: Person) -> List[Tuple]:
+    surnames = {soundex(name) for name in (person.last, person.maiden) if name}
+    if person.birth:
+        year = person.birth.year
+        decades = [("a", year // 10), ("b", (year + 5) // 10)]
+    else:
+        decades = [None]
+    return [(surname, decade) for surname in surnames for decade in decades]
+
+
+def build_blocks(people: Iterable[Person]) -> List[List[Person]]:
+    """Group people by blocking key, dropping singletons and splitting oversized blocks."""
+    blocks: Dict[Tuple, List[Person]] = defaultdict(list)
+    for person in people:
+        for key in blocking_keys(person):
+            blocks[key].append(person)
+
+    result = []
+    for block in blocks.values():
+        if len(block) > MAX_BLOCK_SIZE:
+            by_first_name: Dict[str, List[Person]] = defaultdict(list)
+            for person in block:
+                by_first_name[soundex(person.first)].append(person)
+            result.extend(group for group in by_first_name.values() if len(group) > 1)
+        elif len(block) > 1:
+            result.append(block)
+    return result
+
+
+def _date_similarity(a: date, b: date) -> float:
+    if a == b:
+        return 1.0
+    years = abs(a.year - b.year)
+    if years == 0:
+        # Same year, different day or month: often a transcription slip
+        return 0.8
+    return max(0.0, 1.0 - years / 5)
+
+
+def score_pair(a: Person, b: Person) -> Optional[Tuple[float, List[str]]]:
+    """Weighted similarity of two people over the fields both have, or None if they cannot match."""
+    if {a.gender, b.gender} == OPPOSITE_GENDERS:
+        return None
+    # A parent and child often share a name; never offer them as duplicates
+    if a.id in (b.father_id, b.mother_id) or b.id in (a.father_id, a.mother_id):
+        return None
+    if a.birth and b.birth and abs(a.birth.year - b.birth.year) > 5:
+        return None
+
+    similarities = {
+        "first_name": jaro_winkler(a.first, b.first),
+        "last_name": max(
+            jaro_winkler(x, y) for x in (a.last, a.maiden) for y in (b.last, b.maiden) if x and y
+        ) if (a.last or a.maiden) and (b.last or b.maiden) else None,
+        "birth_date": _date_similarity(a.birth, b.birth) if a.birth and b.birth else None,
+        "birth_place": jaro_winkler(a.birth_place, b.birth_place) if a.birth_place and b.birth_place else None,
+        "death_date": _date_similarity(a.death, b.death) if a.death and b.death else None,
+    }
+
+    total = weight = 0.0
+    reasons = []
+    for field, similarity in similarities.items():
+        if similarity is None:
+            continue
+        total += WEIGHTS[field] * similarity
+        weight += WEIGHTS[field]
+        if similarity >= 0.9:
+            reasons.append(field)
+
+    # Shared parents are strong evidence; different known parents are strong evidence against
+    for parent in ("father_id", "mother_id"):
+        x, y = getattr(a, parent), getattr(b, parent)
+        if x and y:
+            total += 0.2 * (x == y)
+            weight += 0.2
+            if x == y:
+                reasons.append(parent)
+
+    # Names alone are not enough to call two people the same
+    if weight <= WEIGHTS["first_name"] + WEIGHTS["last_name"]:
+        total *= 0.8
+    return total / weight, reasons
+
+
+def score_blocks(blocks: List[List[Person]], min_score: float) -> List[Tuple[int, int, float, str]]:
+    """Score every pair inside each block; returns (low id, high id, score, reasons)."""
+    found = []
+    for block in blocks:
+        for i, a in enumerate(block):
+            for b in block[i + 1:]:
+                result = score_pair(a, b)
+                if result and result[0] >= min_score:
+                    low, high = (a.id, b.id) if a.id < b.id else (b.id, a.id)
+                    found.append((low, high, round(result[0], 4), ",".join(result[1])))
+    return found
+
+
+def _comparisons(block: List[Person]) -> int:
+    return len(block) * (len(block) - 1) // 2
+
+
+def _tasks(blocks: List[List[Person]]) -> List[List[List[Person]]]:
+    """Pack blocks into tasks of roughly TASK_COMPARISONS comparisons each."""
+    tasks, current, size = [], [], 0
+    for block in sorted(blocks, key=_comparisons, reverse=True):
+        current.append(block)
+        size += _comparisons(block)
+        if size >= TASK_COMPARISONS:
+            tasks.append(current)
+            current, size = [], 0
+    if current:
+        tasks.append(current)
+    return tasks
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=DUPLICATE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def find_duplicates(
+    people: List[Person],
+    min_score: float = DUPLICATE_MIN_SCORE
+) -> Tuple[Dict[Tuple[int, int], Tuple[float, str]], Dict]:
+    """Candidate pairs with their best score and reasons, plus scan statistics."""
+    blocks = build_blocks(people)
+    comparisons = sum(_comparisons(block) for block in blocks)
+
+    if comparisons >= PARALLEL_MIN_COMPARISONS and DUPLICATE_WORKERS > 1:
+        tasks = _tasks(blocks)
+        results = _pool().map(score_blocks, tasks, [min_score] * len(tasks))
+    else:
+        results = [score_blocks(blocks, min_score)]
+
+    # A pair can meet in more than one block; keep its best score
+    pairs: Dict[Tuple[int, int], Tuple[float, str]] = {}
+    for found in results:
+        for low, high, score, reasons in found:
+            if (low, high) not in pairs or pairs[(low, high)][0] < score:
+                pairs[(low, high)] = (score, reasons)
+
+    return pairs, {"members": len(people), "blocks": len(blocks), "comparisons": comparisons}
+
+
+def scan_duplicates(db: Session, user_id: int) -> Tuple[Dict[Tuple[int, int], Tuple[float, str]], Dict]:
+    """
+    Score the user's members for likely duplicates. Only reads, so it can
+    run on a read session; store the pairs with `replace_candidates`.
+    """
+    people = [to_person(row) for row in db.execute(select(*FEATURE_COLUMNS).where(members.c.user_id == user_id))]
+    return find_duplicates(people)
+
+
+def replace_candidates(db: Session, user_id: int, pairs: Dict[Tuple[int, int], Tuple[float, str]]) -> int:
+    """
+    Replace the user's pending candidates with `pairs` from a scan. Pairs the
+    user already dismissed are not suggested again. Returns the number of
+    candidates stored. Does not commit.
+    """
+    dismissed = set(db.execute(
+        select(PossibleDuplicate.member1_id, PossibleDuplicate.member2_id)
+        .where(PossibleDuplicate.user_id == user_id, PossibleDuplicate.status == "dismissed")
+    ).tuples())
+
+    db.execute(
+        delete(PossibleDuplicate)
+        .where(PossibleDuplicate.user_id == user_id, PossibleDuplicate.status == "pending")
+    )
+    rows = [
+        {"user_id": user_id, "member1_id": low, "member2_id": high, "score": score, "reasons": reasons}
+        for (low, high), (score, reasons) in pairs.items()
+        if (low, high) not in dismissed
+    ]
+    if rows:
+        db.execute(insert(PossibleDuplicate), rows)
+    return len(rows)
+
+
+def forget_members_statement(user_id: int, member_ids: List[int]):
+    return delete(PossibleDuplicate).where(
+        PossibleDuplicate.user_id == user_id,
+        or_(PossibleDuplicate.member1_id.in_(member_ids), PossibleDuplicate.member2_id.in_(member_ids))
+    )
+
+
+def forget_members(db: Session, user_id: int, member_ids: List[int]) -> None:
+    """Drop candidates naming members that are about to be deleted. Does not commit."""
+    db.execute(forget_members_statement(user_id, member_ids))
+
+
+def merge_duplicate(db: Session, user_id: int, candidate_id: int, keep_id: Optional[int] = None) -> FamilyMember:
+    """
+    Merge a candidate pair into one member. Empty fields on the kept member
+    are filled from the other, whose children, documents and marriages move
+    across before it is deleted. Raises LookupError for an unknown candidate
+    and ValueError for a bad keep_id.
+    """
+    candidate = db.query(PossibleDuplicate).filter(
+        PossibleDuplicate.id == candidate_id,
+        PossibleDuplicate.user_id == user_id,
+        PossibleDuplicate.status == "pending"
+    ).first()
+    if not candidate:
+        raise LookupError("Duplicate candidate not found")
+
+    pair = (candidate.member1_id, candidate.member2_id)
+    keep_id = keep_id or candidate.member1_id
+    if keep_id not in pair:
+        raise ValueError("keep_id must be one of the candidate pair")
+    drop_id = pair[1] if keep_id == pair[0] else pair[0]
+
+    keep = db.get(FamilyMember, keep_id)
+    drop = db.get(FamilyMember, drop_id)
+    stats_before = [snapshot(keep), snapshot(drop)]
+
+    for field in MERGE_FIELDS:
+        if getattr(keep, field) is None and getattr(drop, field) is not None:
+            setattr(keep, field, getattr(drop, field))
+    # Neither member of the pair can end up as the kept member's parent
+    for parent in ("father_id", "mother_id"):
+        if getattr(keep, parent) in pair:
+            setattr(keep, parent, None)
+
+    # Ids of every row that changes, for the sync change log
+    moved_children = [keep_id]
+    for parent in (FamilyMember.father_id, FamilyMember.mother_id):
+        moved_children.extend(db.scalars(
+            update(FamilyMember)
+            .where(FamilyMember.user_id == user_id, parent == drop_id, FamilyMember.id != keep_id)
+            .values({parent: keep_id})
+            .returning(FamilyMember.id)
+        ))
+    moved_documents = list(db.scalars(
+        update(Document)
+        .where(Document.user_id == user_id, Document.family_member_id == drop_id)
+        .values(family_member_id=keep_id)
+        .returning(Document.id)
+    ))
+    # A marriage between the pair itself would become a self-marriage, and one
+    # to someone the kept member is already married to would be recorded twice
+    spouses = {keep_id}
+    for person, spouse in ((Marriage.person1_id, Marriage.person2_id), (Marriage.person2_id, Marriage.person1_id)):
+        spouses.update(db.scalars(select(spouse).where(person == keep_id)))
+    removed_marriages = list(db.scalars(
+        delete(Marriage).where(
+            or_(
+                (Marriage.person1_id == drop_id) & Marriage.person2_id.in_(spouses),
+                (Marriage.person2_id == drop_id) & Marriage.person1_id.in_(spouses),
+            )
+        ).returning(Marriage.id)
+    ))
+    moved_marriages = []
+    for person in (Marriage.person1_id, Marriage.person2_id):
+        moved_marriages.extend(db.scalars(
+            update(Marriage).where(person == drop_id).values({person: keep_id}).returning(Marriage.id)
+        ))
+
+    forget_members(db, user_id, [drop_id])
+    drop_members(db, user_id, [drop_id])
+    db.delete(drop)
+    db.flush()
+    index_member(db, keep)
+    record_changes(db, user_id, stats_before, [snapshot(keep)])
+    bump_tree_version(
+        db, user_id,
+        upserted={"member": moved_children, "document": moved_documents, "marriage": moved_marriages},
+        deleted={"member": [drop_id], "marriage": removed_marriages}
+    )
+    return keep
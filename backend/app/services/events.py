@@ -0,0 +1,175 @@
+"""
+Live change feed for each user's tree.
+
+Every committed write that advanced the tree version is published as one
+event: the new version plus the member, document and marriage ids created,
+edited or deleted. `bump_tree_version` queues the event on the session and
+it is published only once that session commits, so listeners never hear
+about rolled-back writes.
+
+The default bus fans events out in-process. Each subscriber has a bounded
+queue; one that falls `EVENT_QUEUE_SIZE` events behind is dropped and told
+to resynchronise through /api/sync, instead of buffering without limit.
+With several worker processes, set EVENT_BUS_URL to a Redis URL (needs the
+`redis` package) so a write handled by one worker reaches listeners
+connected to another.
+"""
+from typing import Dict, List, Optional, Set
+import asyncio
+import json
+import logging
+import os
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+EVENT_BUS_URL = os.getenv("EVENT_BUS_URL", "")
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))
+
+# Session.info key holding events waiting for their transaction to commit
+PENDING_KEY = "tree_events"
+
+REDIS_CHANNEL_PREFIX = "ancestree:tree:"
+
+
+class Subscription:
+    """One listener's bounded queue, fed from any thread and read on its event loop."""
+
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop, size: int):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+        self.overflowed = False
+
+    def _put(self, item: Dict) -> None:
+        # Runs on the subscriber's loop, so the full check and put cannot race the reader
+        if self.overflowed:
+            return
+        if self.queue.full():
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            return
+        self.queue.put_nowait(item)
+
+    def deliver(self, item: Dict) -> None:
+        try:
+            self.loop.call_soon_threadsafe(self._put, item)
+        except RuntimeError:
+            # Loop already closed; the listener is gone
+            pass
+
+    async def get(self) -> Optional[Dict]:
+        """Next event, or None once this subscriber has been dropped for falling behind."""
+        return await self.queue.get()
+
+
+class InMemoryEventBus:
+    """Fan-out to the subscribers in this process."""
+
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.subscribers: Dict[int, Set[Subscription]] = {}
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, user_id: int) -> Subscription:
+        """Register a listener; call from the event loop that will read it."""
+        subscription = Subscription(user_id, asyncio.get_running_loop(), self.queue_size)
+        with self.lock:
+            self.subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self.lock:
+            listeners = self.subscribers.get(subscription.user_id)
+            if listeners:
+                listeners.discard(subscription)
+                if not listeners:
+                    del self.subscribers[subscription.user_id]
+            if subscription.overflowed:
+                self.dropped += 1
+
+    def publish(self, user_id: int, item: Dict) -> None:
+        with self.lock:
+            listeners = list(self.subscribers.get(user_id, ()))
+            self.published += 1
+        for subscription in listeners:
+            subscription.deliver(item)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "backend": "memory",
+                "subscribers": sum(len(listeners) for listeners in self.subscribers.values()),
+                "published": self.published,
+                "dropped": self.dropped,
+            }
+
+
+class RedisEventBus(InMemoryEventBus):
+    """
+    Publishes through Redis pub/sub; a listener thread relays every message
+    to the subscribers in this process.
+    """
+
+    def __init__(self, url: str, queue_size: int = EVENT_QUEUE_SIZE):
+        super().__init__(queue_size)
+        import redis
+
+        self.redis = redis.Redis.from_url(url)
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.psubscribe(f"{REDIS_CHANNEL_PREFIX}*")
+        self.listener = threading.Thread(target=self._listen, name="event-bus-redis", daemon=True)
+        self.listener.start()
+
+    def _listen(self) -> None:
+        for message in self.pubsub.listen():
+            try:
+                user_id = int(message["channel"].decode()[len(REDIS_CHANNEL_PREFIX):])
+                super().publish(user_id, json.loads(message["data"]))
+            except (ValueError, KeyError) as e:
+                logger.warning(f"Ignoring malformed event bus message: {e}")
+
+    def publish(self, user_id: int, item: Dict) -> None:
+        self.redis.publish(f"{REDIS_CHANNEL_PREFIX}{user_id}", json.dumps(item))
+
+    def stats(self) -> Dict:
+        return {**super().stats(), "backend": "redis"}
+
+
+def create_event_bus(url: str = EVENT_BUS_URL) -> InMemoryEventBus:
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisEventBus(url)
+    if url:
+        raise ValueError(f"Unsupported EVENT_BUS_URL: {url}")
+    return InMemoryEventBus()
+
+
+event_bus = create_event_bus()
+
+
+def queue_event(db: Session, user_id: int, item: Dict) -> None:
+    """Publish `item` to the user's listeners once `db` commits."""
+    db.info.setdefault(PENDING_KEY, []).append((user_id, item))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session: Session) -> None:
+    pending: List = session.info.pop(PENDING_KEY, [])
+    for user_id, item in pending:
+        try:
+            event_bus.publish(user_id, item)
+        except Exception as e:
+            # The write is already committed; listeners catch up through /api/sync
+            logger.warning(f"Could not publish tree event for user {user_id}: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session: Session) -> None:
+    session.info.pop(PENDING_KEY, None)
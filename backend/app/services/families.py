@@ -0,0 +1,122 @@
+"""
+Family units: a person's marriages, each with the spouse and the children of
+that couple.
+
+A whole batch of people is loaded with a fixed number of queries (the
+people, their marriages with both partners eager-loaded, their children,
+then any co-parents not already loaded), so rendering a generation costs
+the same handful of round trips as rendering one person.
+"""
+from datetime import date
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session, selectinload
+
+from ..models import FamilyMember, Marriage
+
+MAX_FAMILY_BATCH = 500
+
+
+def _child_order(child: FamilyMember):
+    return (child.birth_date is None, child.birth_date or date.min, child.id)
+
+
+def _units(
+    member: FamilyMember,
+    marriages: List[Marriage],
+    children: List[FamilyMember],
+    people: Dict[int, FamilyMember]
+) -> List[Dict]:
+    """Marriages first, then co-parents never recorded as married, then children with no known other parent."""
+    by_other: Dict[Optional[int], List[FamilyMember]] = {}
+    for child in children:
+        other = child.mother_id if child.father_id == member.id else child.father_id
+        by_other.setdefault(other, []).append(child)
+
+    units = []
+    for marriage in sorted(marriages, key=lambda m: (m.marriage_date is None, m.marriage_date or date.min, m.id)):
+        spouse_id = marriage.person2_id if marriage.person1_id == member.id else marriage.person1_id
+        units.append({
+            "marriage": marriage,
+            "spouse": people.get(spouse_id),
+            "children": sorted(by_other.pop(spouse_id, []), key=_child_order),
+        })
+
+    unknown = by_other.pop(None, [])
+    for other_id in sorted(by_other):
+        units.append({"marriage": None, "spouse": people.get(other_id), "children": sorted(by_other[other_id], key=_child_order)})
+    if unknown:
+        units.append({"marriage": None, "spouse": None, "children": sorted(unknown, key=_child_order)})
+    return units
+
+
+def marriages_statement(member_ids: List[int]):
+    return select(Marriage).where(or_(Marriage.person1_id.in_(member_ids), Marriage.person2_id.in_(member_ids)))
+
+
+def children_statement(user_id: int, member_ids: List[int]):
+    return select(FamilyMember).where(
+        FamilyMember.user_id == user_id,
+        or_(FamilyMember.father_id.in_(member_ids), FamilyMember.mother_id.in_(member_ids))
+    )
+
+
+def load_families(db: Session, user_id: int, member_ids: List[int]) -> List[Dict]:
+    """
+    Family units for each requested member, in request order. Raises
+    ValueError for an oversized batch and LookupError for ids the user
+    does not own.
+    """
+    ids = list(dict.fromkeys(member_ids))
+    if len(ids) > MAX_FAMILY_BATCH:
+        raise ValueError(f"Too many members. Max per request: {MAX_FAMILY_BATCH}")
+
+    people = {
+        member.id: member
+        for member in db.scalars(
+            select(FamilyMember).where(FamilyMember.user_id == user_id, FamilyMember.id.in_(ids))
+        )
+    }
+    missing = [i for i in ids if i not in people]
+    if missing:
+        raise LookupError(f"Family members not found: {', '.join(map(str, missing))}")
+
+    marriages = list(db.scalars(
+        marriages_statement(ids).options(selectinload(Marriage.person1), selectinload(Marriage.person2))
+    ))
+    for marriage in marriages:
+        for spouse in (marriage.person1, marriage.person2):
+            if spouse is not None and spouse.user_id == user_id:
+                people.setdefault(spouse.id, spouse)
+
+    children = list(db.scalars(children_statement(user_id, ids)))
+
+    co_parents: Set[int] = {
+        parent for child in children for parent in (child.father_id, child.mother_id)
+        if parent is not None and parent not in people
+    }
+    if co_parents:
+        people.update(
+            (member.id, member)
+            for member in db.scalars(
+                select(FamilyMember).where(FamilyMember.user_id == user_id, FamilyMember.id.in_(co_parents))
+            )
+        )
+
+    marriages_of: Dict[int, List[Marriage]] = {}
+    for marriage in marriages:
+        for person in {marriage.person1_id, marriage.person2_id}:
+            marriages_of.setdefault(person, []).append(marriage)
+    children_of: Dict[int, List[FamilyMember]] = {}
+    for child in children:
+        for parent in {child.father_id, child.mother_id} - {None}:
+            children_of.setdefault(parent, []).append(child)
+
+    return [
+        {
+            "member": people[member_id],
+            "families": _units(people[member_id], marriages_of.get(member_id, []), children_of.get(member_id, []), people),
+        }
+        for member_id in ids
+    ]
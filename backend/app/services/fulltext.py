@@ -0,0 +1,242 @@
+"""
+Full-text search over family members and documents.
+
+On SQLite each table gets an external-content FTS5 index kept in sync by
+triggers; on PostgreSQL each table gets a weighted, generated tsvector
+column with a GIN index. Both are created by `install_fulltext_search`,
+which runs as a schema upgrade step on startup, so writes from any code
+path (routes, batch endpoints, GEDCOM import) are indexed without the
+application having to remember to.
+"""
+from typing import Dict, List, Optional
+import html
+import logging
+import re
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+WORD = re.compile(r"\w+", re.UNICODE)
+
+SNIPPET_START = "<mark>"
+SNIPPET_END = "</mark>"
+SNIPPET_WORDS = 12
+
+# The database marks matches with control characters, which survive escaping
+# and are swapped for the tags only once the text around them is escaped
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+# Indexed columns per table with their relative weight in ranking. Weights
+# map to bm25 column weights on SQLite and to tsvector labels on PostgreSQL.
+FTS_TABLES = {
+    "family_members": {
+        "first_name": "A",
+        "middle_name": "B",
+        "last_name": "A",
+        "maiden_name": "A",
+        "birth_place": "B",
+        "death_place": "B",
+        "burial_place": "C",
+        "occupation": "B",
+        "biography": "D",
+        "notes": "D",
+    },
+    "documents": {
+        "title": "A",
+        "description": "C",
+        "document_type": "B",
+        "source": "D",
+    },
+}
+
+BM25_WEIGHTS = {"A": 10.0, "B": 4.0, "C": 2.0, "D": 1.0}
+
+
+class FullTextUnavailable(RuntimeError):
+    """The database has no full-text index (for example SQLite built without FTS5)."""
+
+
+def _install_sqlite(connection: Connection, table: str, columns: List[str]) -> None:
+    fts = f"{table}_fts"
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,)
+    ).first()
+    if exists:
+        return
+
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+
+    connection.exec_driver_sql(
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({column_list}, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    connection.exec_driver_sql(
+        f"CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+    )
+    connection.exec_driver_sql(
+        f"CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END"
+    )
+    # Only text edits touch the index; parent links and timestamps do not
+    connection.exec_driver_sql(
+        f"CREATE TRIGGER {fts}_update AFTER UPDATE OF {column_list} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+    )
+    connection.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    logger.info(f"Created full-text index {fts}")
+
+
+def _install_postgres(connection: Connection, table: str, weights: Dict[str, str]) -> None:
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = 'search_vector'",
+        (table,)
+    ).first()
+    if exists:
+        return
+
+    vector = " || ".join(
+        f"setweight(to_tsvector('english', coalesce({column}, '')), '{weight}')"
+        for column, weight in weights.items()
+    )
+    connection.exec_driver_sql(
+        f"ALTER TABLE {table} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({vector}) STORED"
+    )
+    connection.exec_driver_sql(f"CREATE INDEX ix_{table}_search_vector ON {table} USING gin (search_vector)")
+    logger.info(f"Created full-text index on {table}.search_vector")
+
+
+def install_fulltext_search(connection: Connection) -> None:
+    """Schema upgrade step: create any missing full-text indexes and their triggers."""
+    for table, weights in FTS_TABLES.items():
+        if connection.dialect.name == "sqlite":
+            try:
+                _install_sqlite(connection, table, list(weights))
+            except OperationalError as e:
+                logger.warning(f"Full-text search disabled, SQLite lacks FTS5: {e}")
+                return
+        elif connection.dialect.name == "postgresql":
+            _install_postgres(connection, table, weights)
+
+
+def _sqlite_query(words: List[str]) -> str:
+    # Quote every word so user input cannot use FTS5 operators; last word is a prefix
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _postgres_query(words: List[str]) -> str:
+    terms = list(words)
+    terms[-1] += ":*"
+    return " & ".join(terms)
+
+
+# CROSS JOIN pins the join order in SQLite: run the MATCH once, then look up
+# each hit by primary key, rather than probing the index once per member
+SQLITE_SEARCH = {
+    "member": """
+        SELECT m.id, m.id AS family_member_id, m.first_name || ' ' || m.last_name AS title,
+               snippet(family_members_fts, -1, :start, :end, '…', :words) AS snippet,
+               -bm25(family_members_fts, {weights}) AS score
+        FROM family_members_fts
+        CROSS JOIN family_members m ON m.id = family_members_fts.rowid
+        WHERE family_members_fts MATCH :query AND m.user_id = :user_id
+        ORDER BY score DESC
+        LIMIT :limit
+    """,
+    "document": """
+        SELECT d.id, d.family_member_id, d.title,
+               snippet(documents_fts, -1, :start, :end, '…', :words) AS snippet,
+               -bm25(documents_fts, {weights}) AS score
+        FROM documents_fts
+        CROSS JOIN documents d ON d.id = documents_fts.rowid
+        WHERE documents_fts MATCH :query AND d.user_id = :user_id
+        ORDER BY score DESC
+        LIMIT :limit
+    """,
+}
+
+POSTGRES_SEARCH = {
+    "member": """
+        SELECT m.id, m.id AS family_member_id, m.first_name || ' ' || m.last_name AS title,
+               ts_headline('english', concat_ws(' ', {columns}), q, :options) AS snippet,
+               ts_rank_cd(m.search_vector, q) AS score
+        FROM family_members m, to_tsquery('english', :query) q
+        WHERE m.user_id = :user_id AND m.search_vector @@ q
+        ORDER BY score DESC
+        LIMIT :limit
+    """,
+    "document": """
+        SELECT d.id, d.family_member_id, d.title,
+               ts_headline('english', concat_ws(' ', {columns}), q, :options) AS snippet,
+               ts_rank_cd(d.search_vector, q) AS score
+        FROM documents d, to_tsquery('english', :query) q
+        WHERE d.user_id = :user_id AND d.search_vector @@ q
+        ORDER BY score DESC
+        LIMIT :limit
+    """,
+}
+
+RESULT_TABLES = {"member": "family_members", "document": "documents"}
+
+
+def _snippet(raw: Optional[str]) -> Optional[str]:
+    """HTML-escape a database snippet, keeping only our own <mark> tags."""
+    if raw is None:
+        return None
+    return html.escape(raw).replace(MATCH_START, SNIPPET_START).replace(MATCH_END, SNIPPET_END)
+
+
+def search_local(
+    db: Session,
+    user_id: int,
+    query: str,
+    kinds: List[str],
+    limit: int = 20
+) -> List[Dict]:
+    """
+    Ranked matches for `query` among the user's members and/or documents.
+    Every word must match; the last one may be a prefix, for search-as-you-type.
+    Raises ValueError for a query without words and FullTextUnavailable when
+    the database has no full-text index.
+    """
+    words = WORD.findall(query.lower())
+    if not words:
+        raise ValueError("Search query must contain at least one word")
+
+    dialect = db.get_bind().dialect.name
+    results = []
+    for kind in kinds:
+        table = RESULT_TABLES[kind]
+        weights = FTS_TABLES[table]
+        if dialect == "sqlite":
+            sql = SQLITE_SEARCH[kind].format(
+                weights=", ".join(str(BM25_WEIGHTS[weight]) for weight in weights.values())
+            )
+            params = {"query": _sqlite_query(words), "start": MATCH_START, "end": MATCH_END, "words": SNIPPET_WORDS}
+        elif dialect == "postgresql":
+            alias = table[0]
+            sql = POSTGRES_SEARCH[kind].format(columns=", ".join(f"{alias}.{column}" for column in weights))
+            options = f'StartSel="{MATCH_START}", StopSel="{MATCH_END}", MaxWords={SNIPPET_WORDS}, MinWords=4'
+            params = {"query": _postgres_query(words), "options": options}
+        else:
+            raise FullTextUnavailable(f"Full-text search is not supported on {dialect}")
+
+        try:
+            rows = db.execute(text(sql), {**params, "user_id": user_id, "limit": limit}).mappings()
+        except OperationalError as e:
+            raise FullTextUnavailable(str(e))
+        results.extend({"type": kind, **row, "snippet": _snippet(row["snippet"])} for row in rows)
+
+    # Both tables are ranked by the same function, so interleave them by score
+    results.sort(key=lambda result: result["score"], reverse=True)
+    return results[:limit]
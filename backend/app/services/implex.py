@@ -0,0 +1,176 @@
+"""
+Pedigree collapse (implex) and inbreeding over the cached pedigree graph.
+
+Both come from counting paths through the ancestry DAG rather than walking
+them: the number of paths reaching each ancestor is propagated once per
+ancestor, so endogamous trees whose path count explodes stay cheap.
+
+Wright's coefficient of inbreeding is
+
+    F = sum over common ancestors A of the parents, and over pairs of paths
+        (father to A, mother to A) sharing no one but A, of
+        (1/2) ** (n1 + n2 + 1) * (1 + F_A)
+
+Every pair of paths to A has a unique youngest shared member B, so the
+weighted pairs meeting first at A are all pairs to A minus, for each common
+ancestor B below A, the pairs meeting first at B times the squared path
+weight from B to A. Processing common ancestors youngest first gives each of
+them in one pass.
+"""
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from .pedigree_graph import NO_PARENT, PedigreeGraph
+
+# Rounding guard for the pair subtraction
+EPSILON = 1e-15
+
+
+class _Pedigree:
+    """A member's ancestry cut off at `generations`, as slots with parent edges."""
+
+    def __init__(self, graph: PedigreeGraph, slot: int, generations: int):
+        self.graph = graph
+        self.root = slot
+        self.parents: Dict[int, Tuple[int, ...]] = {}
+        depth = {slot: 0}
+        frontier = [slot]
+        for generation in range(1, generations + 1):
+            next_frontier = []
+            for node in frontier:
+                parents = tuple(p for p in (graph.father[node], graph.mother[node]) if p != NO_PARENT)
+                self.parents[node] = parents
+                for parent in parents:
+                    if parent not in depth:
+                        depth[parent] = generation
+                        next_frontier.append(parent)
+            frontier = next_frontier
+        # Ancestors in the last generation are treated as founders
+        for node in frontier:
+            self.parents[node] = ()
+
+        self.order = self._children_first()
+        self.position = {node: i for i, node in enumerate(self.order)}
+
+    def _children_first(self) -> List[int]:
+        """Topological order with every member before their parents."""
+        order = []
+        seen = {self.root}
+        stack = [(self.root, iter(self.parents[self.root]))]
+        while stack:
+            node, parents = stack[-1]
+            for parent in parents:
+                # An in-progress parent means a (bad data) cycle; skip the edge
+                if parent not in seen:
+                    seen.add(parent)
+                    stack.append((parent, iter(self.parents[parent])))
+                    break
+            else:
+                stack.pop()
+                order.append(node)
+        order.reverse()
+        return order
+
+    def path_weights(self, start: int) -> Dict[int, float]:
+        """Sum of (1/2) ** length over all paths from `start` up to each of its ancestors."""
+        weights = {start: 1.0}
+        for node in self.order[self.position[start]:]:
+            weight = weights.get(node)
+            if weight:
+                for parent in self.parents[node]:
+                    weights[parent] = weights.get(parent, 0.0) + weight / 2
+        return weights
+
+
+def _inbreeding(pedigree: _Pedigree, slot: int, memo: Dict[int, Tuple[float, Dict[int, float]]]):
+    """(F, contribution per common ancestor slot) for one member of the pedigree."""
+    if slot in memo:
+        return memo[slot]
+
+    parents = pedigree.parents.get(slot, ())
+    if len(parents) < 2:
+        memo[slot] = (0.0, {})
+        return memo[slot]
+
+    from_father = pedigree.path_weights(parents[0])
+    from_mother = pedigree.path_weights(parents[1])
+    common = sorted((a for a in from_father if a in from_mother), key=pedigree.position.__getitem__)
+    pairs = {a: from_father[a] * from_mother[a] for a in common}
+
+    contributions = {}
+    for ancestor in common:
+        first_meeting = pairs[ancestor]
+        if first_meeting <= EPSILON:
+            continue
+        for older, weight in pedigree.path_weights(ancestor).items():
+            if older != ancestor and older in pairs:
+                pairs[older] -= first_meeting * weight * weight
+        ancestor_f = _inbreeding(pedigree, ancestor, memo)[0]
+        contributions[ancestor] = first_meeting / 2 * (1 + ancestor_f)
+
+    memo[slot] = (sum(contributions.values()), contributions)
+    return memo[slot]
+
+
+def analyze_implex(graph: PedigreeGraph, member_id: int, generations: int, top: int = 20) -> Dict:
+    """
+    Pedigree collapse and inbreeding for a member over `generations`.
+
+    Collapse compares the distinct ancestors found with the ancestor slots
+    that are filled (a slot is one Ahnentafel position); ancestors filling
+    several slots are listed with the generations they appear in. Hold the
+    index lock while calling.
+    """
+    pedigree = _Pedigree(graph, graph.slot_of[member_id], generations)
+
+    # Paths of each exact length: one entry per (generation, ancestor), not per path
+    appearances: Dict[int, Dict[int, int]] = defaultdict(dict)
+    by_generation = []
+    paths = {pedigree.root: 1}
+    for generation in range(1, generations + 1):
+        next_paths: Dict[int, int] = defaultdict(int)
+        for node, count in paths.items():
+            for parent in pedigree.parents.get(node, ()):
+                next_paths[parent] += count
+        if not next_paths:
+            break
+        for node, count in next_paths.items():
+            appearances[node][generation] = count
+        by_generation.append({
+            "generation": generation,
+            "possible": 2 ** generation,
+            "known": sum(next_paths.values()),
+            "distinct": len(next_paths),
+        })
+        paths = next_paths
+
+    known = sum(row["known"] for row in by_generation)
+    ids = graph.ids
+    repeated = sorted(
+        (
+            {"id": ids[node], "appearances": sum(seen.values()), "generations": sorted(seen)}
+            for node, seen in appearances.items()
+            if sum(seen.values()) > 1
+        ),
+        key=lambda row: (-row["appearances"], min(row["generations"]), row["id"])
+    )
+
+    coefficient, contributions = _inbreeding(pedigree, pedigree.root, {})
+    common = sorted(
+        ({"id": ids[node], "contribution": value} for node, value in contributions.items()),
+        key=lambda row: (-row["contribution"], row["id"])
+    )
+
+    return {
+        "member_id": member_id,
+        "generations": generations,
+        "possible_ancestors": 2 ** (generations + 1) - 2,
+        "known_ancestors": known,
+        "distinct_ancestors": len(appearances),
+        "pedigree_collapse": round(100 * (1 - len(appearances) / known), 4) if known else 0.0,
+        "by_generation": by_generation,
+        "repeated_ancestor_count": len(repeated),
+        "repeated_ancestors": repeated[:top],
+        "inbreeding_coefficient": coefficient,
+        "common_ancestors": common[:top],
+    }
@@ -0,0 +1,239 @@
+"""
+Chart layouts computed from the cached pedigree graph.
+
+A descendant chart places the root at generation 0 and each generation of
+children one row further down, with partners drawn next to the member they
+had children with (or married). A pedigree chart places the root at
+generation 0 and each generation of parents one row further up. Positions
+are in abstract units: one unit of x is one node width and y is the
+generation, so the client picks its own spacing.
+
+Subtrees are laid out left to right, each parent centred over the children
+it contributed; when a parent has to move right to clear its neighbours its
+whole subtree moves with it. A member reached twice (through both parents,
+or through pedigree collapse) is placed once and the second family simply
+points at the existing node.
+"""
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from .lineage import MAX_GENERATIONS
+from .pedigree_graph import NO_PARENT, PedigreeGraph
+
+CHARTS = ("descendants", "pedigree")
+
+# Layouts kept per graph before the cache is reset
+LAYOUT_CACHE_SIZE = 64
+
+
+class TreeLayout:
+    """Placed nodes sorted by x, with the families that connect them."""
+
+    def __init__(self, chart: str, root_id: int, version: int, nodes: List[Dict], families: List[Dict]):
+        self.chart = chart
+        self.root_id = root_id
+        self.version = version
+        self.nodes = sorted(nodes, key=lambda node: (node["x"], node["y"]))
+        self.xs = [node["x"] for node in self.nodes]
+        self.families = families
+        position = {node["id"]: (node["x"], node["y"]) for node in self.nodes}
+        self.family_bounds = [self._bounds(family, position) for family in families]
+        self.bounds = {
+            "min_x": self.xs[0],
+            "max_x": self.xs[-1],
+            "min_y": min(node["y"] for node in self.nodes),
+            "max_y": max(node["y"] for node in self.nodes),
+        }
+
+    @staticmethod
+    def _bounds(family: Dict, position: Dict[int, Tuple[float, int]]) -> Tuple[float, float, float, float]:
+        xs, ys = zip(*(position[i] for i in family["parents"] + family["children"]))
+        return min(xs), max(xs), min(ys), max(ys)
+
+    def viewport(
+        self,
+        min_x: Optional[float] = None,
+        max_x: Optional[float] = None,
+        min_y: Optional[float] = None,
+        max_y: Optional[float] = None
+    ) -> Dict:
+        """
+        Nodes inside the box, plus every family whose connector crosses it so
+        lines into off-screen members still draw. Missing edges are unbounded.
+        """
+        lo = bisect_left(self.xs, min_x) if min_x is not None else 0
+        hi = bisect_right(self.xs, max_x) if max_x is not None else len(self.xs)
+        nodes = [
+            node for node in self.nodes[lo:hi]
+            if (min_y is None or node["y"] >= min_y) and (max_y is None or node["y"] <= max_y)
+        ]
+        families = [
+            family for family, (fx0, fx1, fy0, fy1) in zip(self.families, self.family_bounds)
+            if (min_x is None or fx1 >= min_x) and (max_x is None or fx0 <= max_x)
+            and (min_y is None or fy1 >= min_y) and (max_y is None or fy0 <= max_y)
+        ]
+        return {
+            "chart": self.chart,
+            "root_id": self.root_id,
+            "version": self.version,
+            "bounds": self.bounds,
+            "node_count": len(self.nodes),
+            "nodes": nodes,
+            "families": families,
+        }
+
+
+class _Placer:
+    """Left-to-right slot allocation per generation with subtree shifting."""
+
+    def __init__(self, graph: PedigreeGraph):
+        self.graph = graph
+        self.next_free: Dict[int, float] = defaultdict(float)
+        self.placed: Dict[int, Dict] = {}
+        self.order: List[int] = []
+        self.families: List[Dict] = []
+        self.family_of: Dict[Tuple[int, ...], Dict] = {}
+
+    def place(self, slot: int, generation: int, x: float, role: str) -> None:
+        self.placed[slot] = {
+            "id": self.graph.ids[slot],
+            "x": x,
+            "y": generation,
+            "generation": generation,
+            "role": role,
+        }
+        self.order.append(slot)
+        self.next_free[generation] = x + 1
+
+    def block_x(self, generation: int, width: int, centre: Optional[float]) -> float:
+        """Leftmost free x for a block of `width` nodes, as close to `centre` as allowed."""
+        free = self.next_free[generation]
+        if centre is None:
+            return free
+        return max(free, centre - (width - 1) / 2)
+
+    def shift(self, start: int, delta: float) -> None:
+        """Move every node placed since `start` right by `delta`."""
+        if delta <= 0:
+            return
+        generations = set()
+        for slot in self.order[start:]:
+            node = self.placed[slot]
+            node["x"] += delta
+            generations.add(node["generation"])
+        # Nodes placed since `start` are the rightmost ones in each generation they touch
+        for generation in generations:
+            self.next_free[generation] += delta
+
+    def family(self, parents: List[int], children: List[int]) -> None:
+        """Record a couple (or single parent) and their placed children, merging repeats."""
+        children = [child for child in children if child in self.placed]
+        if len(parents) == 1 and not children:
+            return
+        ids = self.graph.ids
+        key = tuple(sorted(parents))
+        family = self.family_of.get(key)
+        if family is None:
+            family = {"parents": [ids[slot] for slot in parents], "children": []}
+            self.family_of[key] = family
+            self.families.append(family)
+        for child in children:
+            if ids[child] not in family["children"]:
+                family["children"].append(ids[child])
+
+    def nodes(self) -> List[Dict]:
+        return list(self.placed.values())
+
+
+def _family_units(graph: PedigreeGraph, slot: int) -> List[Tuple[Optional[int], List[int]]]:
+    """Group a member's children by the other parent, spouses first."""
+    units: Dict[Optional[int], List[int]] = {spouse: [] for spouse in graph.spouses[slot]}
+    for child in graph.children[slot]:
+        other = graph.mother[child] if graph.father[child] == slot else graph.father[child]
+        units.setdefault(other if other != NO_PARENT else None, []).append(child)
+    # Children with an unknown other parent go last
+    unknown = units.pop(None, None)
+    ordered = list(units.items())
+    if unknown:
+        ordered.append((None, unknown))
+    return ordered
+
+
+def _place_descendants(placer: _Placer, slot: int, generation: int, depth: int, role: str) -> float:
+    start = len(placer.order)
+    units = _family_units(placer.graph, slot)
+    if generation >= depth:
+        units = [(partner, []) for partner, _ in units if partner is not None]
+
+    child_xs = [
+        _place_descendants(placer, child, generation + 1, depth, "descendant")
+        for _, children in units
+        for child in children
+        if child not in placer.placed
+    ]
+
+    partners = [partner for partner, _ in units if partner is not None and partner not in placer.placed]
+    width = 1 + len(partners)
+    centre = sum(child_xs) / len(child_xs) if child_xs else None
+    x = placer.block_x(generation, width, centre)
+    if centre is not None:
+        # Parent had to move right to clear its neighbours; bring the children along
+        placer.shift(start, x - (centre - (width - 1) / 2))
+
+    placer.place(slot, generation, x, role)
+    for offset, partner in enumerate(partners, start=1):
+        placer.place(partner, generation, x + offset, "partner")
+
+    for partner, children in units:
+        parents = [slot] if partner is None else [slot, partner]
+        placer.family(parents, children)
+    return x
+
+
+def _place_ancestors(placer: _Placer, slot: int, generation: int, depth: int, role: str) -> float:
+    graph = placer.graph
+    start = len(placer.order)
+    parents = [p for p in (graph.father[slot], graph.mother[slot]) if p != NO_PARENT] if generation < depth else []
+
+    parent_xs = [
+        _place_ancestors(placer, parent, generation + 1, depth, "ancestor")
+        for parent in parents
+        if parent not in placer.placed
+    ]
+
+    centre = sum(parent_xs) / len(parent_xs) if parent_xs else None
+    x = placer.block_x(generation, 1, centre)
+    if centre is not None:
+        placer.shift(start, x - centre)
+
+    placer.place(slot, generation, x, role)
+    if parents:
+        placer.family(parents, [slot])
+    return x
+
+
+def compute_layout(graph: PedigreeGraph, chart: str, root_id: int, generations: Optional[int] = None) -> TreeLayout:
+    """
+    Lay out a descendant or pedigree chart rooted at `root_id`, reusing the
+    layout cached on the graph until the graph next changes. Hold the graph's
+    lock while calling.
+    """
+    if chart not in CHARTS:
+        raise ValueError(f"Unknown chart: {chart}. Use one of: {', '.join(CHARTS)}")
+    depth = min(generations or MAX_GENERATIONS, MAX_GENERATIONS)
+
+    key = (chart, root_id, depth)
+    layout = graph.layouts.get(key)
+    if layout is not None:
+        return layout
+
+    placer = _Placer(graph)
+    place = _place_descendants if chart == "descendants" else _place_ancestors
+    place(placer, graph.slot_of[root_id], 0, depth, "root")
+    layout = TreeLayout(chart, root_id, graph.tree_version, placer.nodes(), placer.families)
+
+    if len(graph.layouts) >= LAYOUT_CACHE_SIZE:
+        graph.layouts.clear()
+    graph.layouts[key] = layout
+    return layout
@@ -0,0 +1,238 @@
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from sqlalchemy import func, literal, select
+from sqlalchemy.orm import Session
+
+from ..models import FamilyMember
+
+# Ahnentafel numbers double every generation, so anything deeper than this
+# would overflow a 64-bit integer. It also guards against parent cycles in
+# hand-entered data.
+MAX_GENERATIONS = 60
+
+# Generations returned when the caller does not ask for a depth
+DEFAULT_ANCESTOR_GENERATIONS = 3
+
+# Rows fetched from the database cursor at a time when streaming
+STREAM_BATCH_SIZE = 500
+
+members = FamilyMember.__table__
+
+# Columns that may be requested through a `fields` projection
+PROJECTABLE_FIELDS = [column.name for column in members.columns]
+
+
+def resolve_fields(fields: Optional[Sequence[str]]) -> List[str]:
+    """
+    Validate a requested column projection. `id` is always included.
+    Raises ValueError for unknown column names.
+    """
+    if not fields:
+        return list(PROJECTABLE_FIELDS)
+
+    unknown = [name for name in fields if name not in PROJECTABLE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+    return ["id"] + [name for name in dict.fromkeys(fields) if name != "id"]
+
+
+def ancestor_lineage_cte(user_id: int, member_id: int, generations: Optional[int] = None):
+    """
+    Build the recursive CTE walking from a member up through father_id/mother_id.
+
+    Each row is (id, father_id, mother_id, generation); the root member is
+    generation 0. The CTE uses UNION, so an ancestor reached through several
+    lines appears once per generation rather than once per path, and a
+    collapsed pedigree stays linear in size instead of doubling with every
+    cousin marriage.
+    """
+    max_generation = min(generations or DEFAULT_ANCESTOR_GENERATIONS, MAX_GENERATIONS)
+
+    lineage = (
+        select(
+            members.c.id,
+            members.c.father_id,
+            members.c.mother_id,
+            literal(0).label("generation"),
+        )
+        .where(members.c.id == member_id, members.c.user_id == user_id)
+        .cte("lineage", recursive=True)
+    )
+
+    parent = members.alias("parent")
+    lineage = lineage.union(
+        select(
+            parent.c.id,
+            parent.c.father_id,
+            parent.c.mother_id,
+            (lineage.c.generation + 1).label("generation"),
+        )
+        .join(
+            lineage,
+            (parent.c.id == lineage.c.father_id) | (parent.c.id == lineage.c.mother_id),
+        )
+        .where(parent.c.user_id == user_id, lineage.c.generation < max_generation)
+    )
+
+    return lineage
+
+
+def _ahnentafel_numbers(root_id: int, parents: Dict[int, tuple]) -> Dict[int, int]:
+    """
+    Lowest Ahnentafel number of each ancestor, walking up one generation at a
+    time. A person's closest generation always holds their lowest number, so
+    each person is expanded once, the first time they are reached.
+    """
+    numbers = {root_id: 1}
+    level = {root_id: 1}
+    while level:
+        reached: Dict[int, int] = {}
+        for person_id, number in level.items():
+            father_id, mother_id = parents.get(person_id, (None, None))
+            for parent_id, parent_number in ((father_id, 2 * number), (mother_id, 2 * number + 1)):
+                if parent_id in parents and parent_id not in numbers:
+                    reached[parent_id] = min(parent_number, reached.get(parent_id, parent_number))
+        numbers.update(reached)
+        level = reached
+    return numbers
+
+
+def ancestors_statement(
+    user_id: int,
+    member_id: int,
+    generations: Optional[int] = None,
+    fields: Optional[Sequence[str]] = None,
+):
+    """
+    The root member and their ancestors, one row each with the requested
+    fields, their closest generation and the parent ids (as `_father_id` and
+    `_mother_id`) used to number them.
+    """
+    lineage = ancestor_lineage_cte(user_id, member_id, generations)
+
+    ranked = (
+        select(
+            lineage.c.id,
+            func.min(lineage.c.generation).label("generation"),
+        )
+        .group_by(lineage.c.id)
+        .subquery("ranked")
+    )
+
+    requested = resolve_fields(fields)
+    return (
+        select(
+            *(members.c[name] for name in requested),
+            members.c.father_id.label("_father_id"),
+            members.c.mother_id.label("_mother_id"),
+            ranked.c.generation,
+        )
+        .join(ranked, members.c.id == ranked.c.id)
+    )
+
+
+def get_ancestors(
+    db: Session,
+    user_id: int,
+    member_id: int,
+    generations: Optional[int] = None,
+    fields: Optional[Sequence[str]] = None,
+) -> List[Dict]:
+    """
+    Fetch the root member and their ancestors in a single statement, then
+    return the ancestors ordered by Ahnentafel number. Raises LookupError if
+    the member does not exist in the user's tree.
+
+    Ancestors reached through several paths (pedigree collapse) are returned
+    once, with their closest generation and lowest Ahnentafel number.
+    Defaults to DEFAULT_ANCESTOR_GENERATIONS generations.
+    """
+    stmt = ancestors_statement(user_id, member_id, generations, fields)
+
+    rows = [dict(row._mapping) for row in db.execute(stmt)]
+    if not any(row["id"] == member_id for row in rows):
+        raise LookupError("Family member not found")
+
+    numbers = _ahnentafel_numbers(
+        member_id, {row["id"]: (row.pop("_father_id"), row.pop("_mother_id")) for row in rows}
+    )
+    ancestors = [row for row in rows if row["id"] != member_id]
+    for row in ancestors:
+        row["ahnentafel"] = numbers[row["id"]]
+    return sorted(ancestors, key=lambda row: row["ahnentafel"])
+
+
+def descendant_lineage_cte(user_id: int, member_id: int, depth: Optional[int] = None):
+    """
+    Build the recursive CTE walking from a member down through children that
+    name them as father_id or mother_id. Each row is (id, generation); the
+    root member is generation 0.
+    """
+    max_generation = min(depth or MAX_GENERATIONS, MAX_GENERATIONS)
+
+    lineage = (
+        select(members.c.id, literal(0).label("generation"))
+        .where(members.c.id == member_id, members.c.user_id == user_id)
+        .cte("descent", recursive=True)
+    )
+
+    child = members.alias("child")
+    lineage = lineage.union(
+        select(child.c.id, (lineage.c.generation + 1).label("generation"))
+        .join(
+            lineage,
+            (child.c.father_id == lineage.c.id) | (child.c.mother_id == lineage.c.id),
+        )
+        # `+ 0` keeps SQLite from preferring the user_id index (a scan of the
+        # whole tree per step) over the father_id/mother_id indexes
+        .where(child.c.user_id + 0 == user_id, lineage.c.generation < max_generation)
+    )
+
+    return lineage
+
+
+def descendants_statement(
+    user_id: int,
+    member_id: int,
+    depth: Optional[int] = None,
+    fields: Optional[Sequence[str]] = None,
+):
+    """Descendants of a member with the requested fields, in generation order, each at their closest generation."""
+    lineage = descendant_lineage_cte(user_id, member_id, depth)
+
+    ranked = (
+        select(lineage.c.id, func.min(lineage.c.generation).label("generation"))
+        .where(lineage.c.generation > 0)
+        .group_by(lineage.c.id)
+        .subquery("ranked")
+    )
+
+    columns = [members.c[name] for name in resolve_fields(fields)]
+    return (
+        select(*columns, ranked.c.generation)
+        .join(ranked, members.c.id == ranked.c.id)
+        .order_by(ranked.c.generation, members.c.id)
+    )
+
+
+def iter_descendants(
+    db: Session,
+    user_id: int,
+    member_id: int,
+    depth: Optional[int] = None,
+    fields: Optional[Sequence[str]] = None,
+    batch_size: int = STREAM_BATCH_SIZE,
+) -> Iterator[Dict]:
+    """
+    Yield every descendant of a member in generation order.
+
+    Rows are pulled from the cursor in batches of `batch_size` so memory stays
+    bounded however large the clan is. Descendants reachable through both
+    parents' lines are yielded once, at their closest generation.
+    """
+    stmt = descendants_statement(user_id, member_id, depth, fields).execution_options(yield_per=batch_size)
+
+    for partition in db.execute(stmt).partitions():
+        for row in partition:
+            yield dict(row._mapping)
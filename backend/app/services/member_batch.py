@@ -0,0 +1,220 @@
+from datetime import datetime
+from typing import Dict, List, Set
+
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from ..models import Document, FamilyMember, Marriage
+from ..schemas import FamilyMemberBatch
+from .duplicates import forget_members
+from .name_index import NAME_COLUMNS, drop_members, reindex_members
+from .tree_stats import STAT_COLUMNS, record_changes
+from .tree_version import bump_tree_version
+
+MAX_BATCH_OPERATIONS = 1000
+
+TEMP_REF_FIELDS = {"father_temp_id": "father_id", "mother_temp_id": "mother_id"}
+
+
+def _check_refs(batch: FamilyMemberBatch) -> Set[str]:
+    """Validate temp ids and references; returns the set of declared temp ids."""
+    temp_ids = [entry.temp_id for entry in batch.create if entry.temp_id]
+    if len(temp_ids) != len(set(temp_ids)):
+        raise ValueError("Duplicate temp_id in batch")
+    declared = set(temp_ids)
+
+    for entry in [*batch.create, *batch.update]:
+        for ref_field, id_field in TEMP_REF_FIELDS.items():
+            ref = getattr(entry, ref_field)
+            if ref is None:
+                continue
+            if getattr(entry, id_field) is not None:
+                raise ValueError(f"Give either {id_field} or {ref_field}, not both")
+            if ref not in declared:
+                raise ValueError(f"Unknown temp_id: {ref}")
+            if getattr(entry, "temp_id", None) == ref:
+                raise ValueError(f"Member {ref} cannot be their own parent")
+
+    return declared
+
+
+def _stat_values(db: Session, user_id: int, member_ids: Set[int]) -> List[Dict]:
+    if not member_ids:
+        return []
+    return list(db.execute(
+        select(*(FamilyMember.__table__.c[column] for column in STAT_COLUMNS))
+        .where(FamilyMember.user_id == user_id, FamilyMember.id.in_(member_ids))
+    ).mappings())
+
+
+def _check_ownership(db: Session, user_id: int, batch: FamilyMemberBatch) -> None:
+    """Verify every existing id the batch touches belongs to the user, in one query."""
+    referenced = {entry.id for entry in batch.update} | set(batch.delete)
+    for entry in [*batch.create, *batch.update]:
+        referenced.update(i for i in (entry.father_id, entry.mother_id) if i)
+
+    if not referenced:
+        return
+
+    owned = set(db.scalars(
+        select(FamilyMember.id).where(FamilyMember.user_id == user_id, FamilyMember.id.in_(referenced))
+    ))
+    missing = sorted(referenced - owned)
+    if missing:
+        raise LookupError(f"Family members not found: {', '.join(map(str, missing))}")
+
+
+def references_statements(user_id: int, member_ids: List[int]) -> Dict:
+    """Ids of the other members' children, the documents and the marriages that reference `member_ids`."""
+    return {
+        "children": select(FamilyMember.id).where(
+            FamilyMember.user_id == user_id,
+            or_(FamilyMember.father_id.in_(member_ids), FamilyMember.mother_id.in_(member_ids)),
+            FamilyMember.id.not_in(member_ids)
+        ),
+        "documents": select(Document.id).where(Document.user_id == user_id, Document.family_member_id.in_(member_ids)),
+        "marriages": select(Marriage.id).where(
+            or_(Marriage.person1_id.in_(member_ids), Marriage.person2_id.in_(member_ids))
+        ),
+    }
+
+
+def detach_members(db: Session, user_id: int, member_ids: List[int]) -> Dict[str, List[int]]:
+    """
+    Clear every reference to members that are about to be deleted: their
+    children lose that parent, their documents are unlinked and their
+    marriages are removed. Returns the ids of children and documents changed
+    and marriages removed, for the change log. Does not commit.
+    """
+    ids = list(member_ids)
+    references = references_statements(user_id, ids)
+    children = list(db.scalars(references["children"]))
+    for column in ("father_id", "mother_id"):
+        db.execute(
+            update(FamilyMember)
+            .where(FamilyMember.user_id == user_id, getattr(FamilyMember, column).in_(ids))
+            .values({column: None})
+        )
+
+    documents = list(db.scalars(references["documents"]))
+    if documents:
+        db.execute(update(Document).where(Document.id.in_(documents)).values(family_member_id=None))
+
+    marriages = list(db.scalars(references["marriages"]))
+    if marriages:
+        db.execute(delete(Marriage).where(Marriage.id.in_(marriages)))
+
+    return {"children": children, "documents": documents, "marriages": marriages}
+
+
+def apply_batch(db: Session, user_id: int, batch: FamilyMemberBatch) -> Dict:
+    """
+    Apply creates, updates and deletes in the caller's transaction, which
+    the caller commits before loading the response with `batch_result`.
+
+    Creates are written with a single multi-row INSERT; parent links that
+    point at other new members (via temp ids) are filled in afterwards with
+    one bulk UPDATE, so references may appear in any order. Deletes clear
+    references to the deleted members first, as a single delete does.
+    Raises ValueError for a malformed batch and LookupError for ids the user
+    does not own.
+    """
+    operations = len(batch.create) + len(batch.update) + len(batch.delete)
+    if operations > MAX_BATCH_OPERATIONS:
+        raise ValueError(f"Batch too large. Max operations: {MAX_BATCH_OPERATIONS}")
+
+    _check_refs(batch)
+    _check_ownership(db, user_id, batch)
+
+    exclude = {"temp_id", *TEMP_REF_FIELDS}
+
+    # Statistics see the touched members before and after the batch
+    restated = {entry.id for entry in batch.update if entry.model_fields_set & set(STAT_COLUMNS)}
+    stats_before = _stat_values(db, user_id, restated | set(batch.delete))
+
+    temp_ids: Dict[str, int] = {}
+    created: List[int] = []
+    new_rows = [{**entry.model_dump(exclude=exclude), "user_id": user_id} for entry in batch.create]
+    if new_rows:
+        created = list(db.scalars(
+            insert(FamilyMember).returning(FamilyMember.id, sort_by_parameter_order=True),
+            new_rows
+        ))
+        temp_ids = {
+            entry.temp_id: member_id
+            for entry, member_id in zip(batch.create, created)
+            if entry.temp_id
+        }
+
+    now = datetime.utcnow()
+    updates = []
+    for entry, member_id in zip(batch.create, created):
+        links = {
+            id_field: temp_ids[getattr(entry, ref_field)]
+            for ref_field, id_field in TEMP_REF_FIELDS.items()
+            if getattr(entry, ref_field)
+        }
+        if links:
+            updates.append({"id": member_id, **links})
+
+    for entry in batch.update:
+        values = entry.model_dump(exclude_unset=True, exclude=exclude)
+        for ref_field, id_field in TEMP_REF_FIELDS.items():
+            if getattr(entry, ref_field):
+                values[id_field] = temp_ids[getattr(entry, ref_field)]
+        updates.append({**values, "updated_at": now})
+
+    if updates:
+        db.execute(update(FamilyMember), updates)
+
+    renamed = [
+        entry.id for entry in batch.update
+        if entry.model_fields_set & set(NAME_COLUMNS) and entry.id not in batch.delete
+    ]
+    reindex_members(db, user_id, created + renamed)
+
+    detached = {"children": [], "documents": [], "marriages": []}
+    if batch.delete:
+        forget_members(db, user_id, batch.delete)
+        drop_members(db, user_id, batch.delete)
+        detached = detach_members(db, user_id, batch.delete)
+        db.execute(
+            delete(FamilyMember).where(FamilyMember.user_id == user_id, FamilyMember.id.in_(batch.delete))
+        )
+
+    stats_after = _stat_values(db, user_id, restated - set(batch.delete))
+    record_changes(db, user_id, stats_before, new_rows + stats_after)
+    updated = [entry.id for entry in batch.update if entry.id not in batch.delete]
+    version = bump_tree_version(
+        db,
+        user_id,
+        upserted={"member": created + updated + detached["children"], "document": detached["documents"]},
+        deleted={"member": batch.delete, "marriage": detached["marriages"]}
+    )
+
+    return {
+        "created": created,
+        "updated": updated,
+        "deleted": list(batch.delete),
+        "detached": detached["children"],
+        "temp_ids": temp_ids,
+        "version": version,
+    }
+
+
+def batch_result(db: Session, applied: Dict) -> Dict:
+    """The response for a committed batch, with created and updated members loaded in one query."""
+    ids = applied["created"] + applied["updated"] + applied["detached"]
+    members = {
+        member.id: member
+        for member in db.scalars(select(FamilyMember).where(FamilyMember.id.in_(ids)))
+    } if ids else {}
+
+    return {
+        "created": [members[i] for i in applied["created"]],
+        "updated": [members[i] for i in applied["updated"]],
+        "deleted": applied["deleted"],
+        "detached": [members[i] for i in applied["detached"]],
+        "temp_ids": applied["temp_ids"],
+        "version": applied["version"],
+    }
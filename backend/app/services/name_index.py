@@ -0,0 +1,185 @@
+"""
+Phonetic name index for fuzzy member lookup.
+
+Every member's given name and surnames (last and maiden) are stored as
+Soundex, Daitch-Mokotoff and Double Metaphone codes in `name_codes`, one row
+per code, so "Smith", "Smyth" and "Schmidt" meet on an indexed equality
+lookup. A fuzzy search looks up the codes of the query name to find
+candidates, then ranks only those by edit distance.
+
+Codes are written in the same transaction as the member, by whichever code
+path creates, renames or deletes members.
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import logging
+
+from sqlalchemy import and_, delete, exists, insert, or_, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from ..models import FamilyMember, NameCode
+from ..utils.names import daitch_mokotoff, double_metaphone, levenshtein, normalize_name, soundex
+
+logger = logging.getLogger(__name__)
+
+# Member columns feeding each indexed field
+NAME_FIELDS = {"given": ("first_name",), "surname": ("last_name", "maiden_name")}
+NAME_COLUMNS = [column for columns in NAME_FIELDS.values() for column in columns]
+
+# Candidates fetched for ranking; common surnames are capped rather than loaded whole
+MAX_CANDIDATES = 2000
+BACKFILL_CHUNK_SIZE = 1000
+
+members = FamilyMember.__table__
+name_codes = NameCode.__table__
+
+
+def phonetic_codes(name: Optional[str]) -> Set[Tuple[str, str]]:
+    """(algorithm, code) pairs for one name."""
+    if not name:
+        return set()
+    codes = {("soundex", soundex(name))}
+    codes.update(("daitch_mokotoff", code) for code in daitch_mokotoff(name))
+    codes.update(("metaphone", code) for code in double_metaphone(name))
+    return {(algorithm, code) for algorithm, code in codes if code}
+
+
+def code_rows(user_id: int, member_id: int, names: Dict[str, Optional[str]]) -> List[Dict]:
+    rows = []
+    for field, columns in NAME_FIELDS.items():
+        codes = set().union(*(phonetic_codes(names.get(column)) for column in columns))
+        rows.extend(
+            {"user_id": user_id, "member_id": member_id, "field": field, "algorithm": algorithm, "code": code}
+            for algorithm, code in sorted(codes)
+        )
+    return rows
+
+
+def index_names(db: Session, user_id: int, rows: Iterable[Dict]) -> None:
+    """Insert codes for new members; each row needs id, first_name, last_name and maiden_name."""
+    values = [entry for row in rows for entry in code_rows(user_id, row["id"], row)]
+    if values:
+        db.execute(insert(name_codes), values)
+
+
+def drop_members_statement(user_id: int, member_ids: List[int]):
+    return delete(name_codes).where(name_codes.c.user_id == user_id, name_codes.c.member_id.in_(member_ids))
+
+
+def drop_members(db: Session, user_id: int, member_ids: List[int]) -> None:
+    db.execute(drop_members_statement(user_id, member_ids))
+
+
+def index_member(db: Session, member: FamilyMember) -> None:
+    """Replace one member's codes from its current (flushed) names. Does not commit."""
+    drop_members(db, member.user_id, [member.id])
+    index_names(db, member.user_id, [{"id": member.id, **{column: getattr(member, column) for column in NAME_COLUMNS}}])
+
+
+def reindex_members(db: Session, user_id: int, member_ids: List[int]) -> None:
+    """Recompute codes for members whose names may have changed. Does not commit."""
+    if not member_ids:
+        return
+    drop_members(db, user_id, member_ids)
+    rows = db.execute(
+        select(members.c.id, *(members.c[column] for column in NAME_COLUMNS))
+        .where(members.c.user_id == user_id, members.c.id.in_(member_ids))
+    ).mappings()
+    index_names(db, user_id, rows)
+
+
+def backfill_name_codes(connection: Connection) -> None:
+    """Schema upgrade step: index members that have no phonetic codes yet."""
+    missing = connection.execute(
+        select(members.c.id, members.c.user_id, *(members.c[column] for column in NAME_COLUMNS))
+        .where(~exists().where(name_codes.c.member_id == members.c.id))
+        .execution_options(yield_per=BACKFILL_CHUNK_SIZE)
+    ).mappings()
+
+    indexed = 0
+    for chunk in missing.partitions():
+        values = [entry for row in chunk for entry in code_rows(row["user_id"], row["id"], row)]
+        if values:
+            connection.execute(insert(name_codes), values)
+        indexed += len(chunk)
+    if indexed:
+        logger.info(f"Indexed phonetic codes for {indexed} members")
+
+
+def candidates_statement(user_id: int, field: str, name: str):
+    """Member ids and algorithms sharing a phonetic code with `name`, or None if it has no codes."""
+    by_algorithm: Dict[str, List[str]] = {}
+    for algorithm, code in phonetic_codes(name):
+        by_algorithm.setdefault(algorithm, []).append(code)
+    if not by_algorithm:
+        return None
+
+    return (
+        select(name_codes.c.member_id, name_codes.c.algorithm).distinct()
+        .where(
+            name_codes.c.user_id == user_id,
+            name_codes.c.field == field,
+            or_(*(
+                and_(name_codes.c.algorithm == algorithm, name_codes.c.code.in_(codes))
+                for algorithm, codes in by_algorithm.items()
+            ))
+        )
+    )
+
+
+def _candidates(db: Session, user_id: int, field: str, name: str) -> Dict[int, Set[str]]:
+    """Member ids sharing any phonetic code with `name`, with the algorithms that matched."""
+    stmt = candidates_statement(user_id, field, name)
+    if stmt is None:
+        return {}
+
+    rows = db.execute(stmt)
+    found: Dict[int, Set[str]] = {}
+    for member_id, algorithm in rows:
+        found.setdefault(member_id, set()).add(algorithm)
+    return found
+
+
+def _distance(query: str, names: Iterable[Optional[str]]) -> int:
+    return min(levenshtein(query, normalize_name(name)) for name in names if name)
+
+
+def fuzzy_lookup(
+    db: Session,
+    user_id: int,
+    first_name: Optional[str] = None,
+    last_name: Optional[str] = None,
+    max_distance: Optional[int] = None,
+    limit: int = 20
+) -> List[Dict]:
+    """
+    Members whose names sound like the query, closest spelling first.
+    Candidates come from the surname codes when a surname is given (the given
+    name only ranks them), otherwise from the given-name codes. Raises
+    ValueError when neither name is given.
+    """
+    if not normalize_name(first_name) and not normalize_name(last_name):
+        raise ValueError("Give a first_name or last_name to look up")
+
+    if normalize_name(last_name):
+        candidates = _candidates(db, user_id, "surname", last_name)
+    else:
+        candidates = _candidates(db, user_id, "given", first_name)
+    if not candidates:
+        return []
+
+    # Prefer members matched by more algorithms when the candidate set is capped
+    ids = sorted(candidates, key=lambda member_id: (-len(candidates[member_id]), member_id))[:MAX_CANDIDATES]
+    matches = []
+    for member in db.query(FamilyMember).filter(FamilyMember.id.in_(ids)):
+        distance = 0
+        if normalize_name(last_name):
+            distance += _distance(normalize_name(last_name), [member.last_name, member.maiden_name])
+        if normalize_name(first_name):
+            distance += levenshtein(normalize_name(first_name), normalize_name(member.first_name))
+        if max_distance is not None and distance > max_distance:
+            continue
+        matches.append({"member": member, "distance": distance, "algorithms": sorted(candidates[member.id])})
+
+    matches.sort(key=lambda match: (match["distance"], -len(match["algorithms"]), match["member"].id))
+    return matches[:limit]
@@ -0,0 +1,121 @@
+"""
+Password hashing off the request path.
+
+bcrypt is slow on purpose: a few hundred milliseconds of CPU per hash at the
+default cost. Run inline, a burst of logins would hold the threadpool and
+the GIL and stall every other route. `password_hasher` sends the work to a
+process pool of PASSWORD_WORKERS processes instead. At most
+PASSWORD_QUEUE_LIMIT operations may be queued or running at once. Beyond
+that, callers get PasswordPoolSaturated at once, which routes answer with
+503 and Retry-After, rather than piling up until they time out.
+
+Workers are spawned rather than forked: the server has threads running, and
+a forked child inherits whatever locks they held at that moment.
+
+BCRYPT_ROUNDS sets the cost of new hashes. A stored hash with any other cost
+(`needs_rehash`) is replaced at the next successful login.
+"""
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional
+import asyncio
+import multiprocessing
+import os
+import threading
+
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "2"))
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", "16"))
+# Seconds a rejected client is told to wait before retrying
+PASSWORD_RETRY_AFTER = int(os.getenv("PASSWORD_RETRY_AFTER", "1"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class PasswordPoolSaturated(Exception):
+    pass
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return pwd_context.verify(password, hashed)
+
+
+def needs_rehash(hashed: str) -> bool:
+    """True for a hash from a deprecated scheme or made with a cost other than BCRYPT_ROUNDS."""
+    if pwd_context.needs_update(hashed):
+        return True
+    return pwd_context.handler("bcrypt").from_string(hashed).rounds != BCRYPT_ROUNDS
+
+
+class PasswordHasher:
+    """A process pool with a cap on queued work."""
+
+    def __init__(self, workers: int = PASSWORD_WORKERS, limit: int = PASSWORD_QUEUE_LIMIT):
+        self.workers = workers
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _done(self, future: Future) -> None:
+        with self.lock:
+            self.pending -= 1
+            error = None if future.cancelled() else future.exception()
+            if future.cancelled() or error is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+            if isinstance(error, BrokenProcessPool):
+                # A worker died; start a fresh pool on the next call
+                self.executor = None
+
+    def submit(self, fn: Callable, *args) -> Future:
+        with self.lock:
+            if self.pending >= self.limit:
+                self.rejected += 1
+                raise PasswordPoolSaturated(f"{self.pending} password operations already in progress")
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            self.pending += 1
+            executor = self.executor
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            with self.lock:
+                self.pending -= 1
+                self.executor = None
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    async def hash(self, password: str) -> str:
+        return await asyncio.wrap_future(self.submit(_hash, password))
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await asyncio.wrap_future(self.submit(_verify, password, hashed))
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "queue_limit": self.limit,
+                "pending": self.pending,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "bcrypt_rounds": BCRYPT_ROUNDS,
+            }
+
+
+password_hasher = PasswordHasher()
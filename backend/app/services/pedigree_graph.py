@@ -0,0 +1,415 @@
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import os
+import sys
+import threading
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..models import FamilyMember, Gender, Marriage, User
+
+PEDIGREE_CACHE_MAX_USERS = int(os.getenv("PEDIGREE_CACHE_MAX_USERS", "64"))
+
+# Marker for "no parent" in the parent arrays
+NO_PARENT = -1
+
+# Compact gender codes stored per member
+GENDER_CODES = {Gender.UNKNOWN: 0, Gender.MALE: 1, Gender.FEMALE: 2, Gender.OTHER: 3}
+GENDERS = {code: gender for gender, code in GENDER_CODES.items()}
+
+# Memoized ancestor maps kept per graph before the memo is reset
+ANCESTOR_MEMO_SIZE = 4096
+
+members = FamilyMember.__table__
+marriages = Marriage.__table__
+users = User.__table__
+
+
+class PedigreeGraph:
+    """
+    Parent/child adjacency for one user's tree.
+
+    Member ids are mapped to dense slots; `father` and `mother` hold the slot
+    of each parent (or NO_PARENT), `children` holds one array of child
+    slots per member and `spouses` one array of spouse slots. Slots freed by
+    deletes are reused. `version` increases on every write, and `layouts`
+    caches chart layouts computed against the current version.
+    `tree_version` is the user's persisted tree version the graph reflects.
+    Hold `lock` while reading or patching the graph.
+    """
+
+    def __init__(self, tree_version: int = 0):
+        self.lock = threading.RLock()
+        self.tree_version = tree_version
+        self.slot_of: Dict[int, int] = {}
+        self.ids = array("q")
+        self.father = array("q")
+        self.mother = array("q")
+        self.gender = array("b")
+        self.children: List[array] = []
+        self.spouses: List[array] = []
+        self.free_slots: List[int] = []
+        self.ancestor_memo: Dict[int, Dict[int, int]] = {}
+        self.version = 0
+        self.layouts: Dict[Tuple, object] = {}
+        self.generation_memo: Optional[List[int]] = None
+
+    @classmethod
+    def from_rows(
+        cls,
+        rows: Iterable[Tuple[int, Optional[int], Optional[int], Optional[Gender]]],
+        couples: Iterable[Tuple[int, int]] = (),
+        tree_version: int = 0
+    ) -> "PedigreeGraph":
+        graph = cls(tree_version)
+        rows = list(rows)
+        for member_id, _, _, gender in rows:
+            graph.gender[graph._allocate(member_id)] = GENDER_CODES.get(gender, 0)
+        for member_id, father_id, mother_id, _ in rows:
+            graph._link(graph.slot_of[member_id], father_id, mother_id)
+        for person1_id, person2_id in couples:
+            graph.add_couple(person1_id, person2_id)
+        return graph
+
+    def __contains__(self, member_id: int) -> bool:
+        return member_id in self.slot_of
+
+    def __len__(self) -> int:
+        return len(self.slot_of)
+
+    def _allocate(self, member_id: int) -> int:
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            self.ids[slot] = member_id
+            self.father[slot] = NO_PARENT
+            self.mother[slot] = NO_PARENT
+            self.gender[slot] = 0
+            self.children[slot] = array("q")
+            self.spouses[slot] = array("q")
+        else:
+            slot = len(self.ids)
+            self.ids.append(member_id)
+            self.father.append(NO_PARENT)
+            self.mother.append(NO_PARENT)
+            self.gender.append(0)
+            self.children.append(array("q"))
+            self.spouses.append(array("q"))
+        self.slot_of[member_id] = slot
+        return slot
+
+    def _link(self, slot: int, father_id: Optional[int], mother_id: Optional[int]) -> None:
+        for parents, parent_id in ((self.father, father_id), (self.mother, mother_id)):
+            old = parents[slot]
+            new = self.slot_of.get(parent_id, NO_PARENT) if parent_id else NO_PARENT
+            if old == new:
+                continue
+            if old != NO_PARENT:
+                self.children[old].remove(slot)
+            if new != NO_PARENT:
+                self.children[new].append(slot)
+            parents[slot] = new
+
+    def _touch(self) -> None:
+        """Drop everything derived from the previous version of the graph."""
+        self.ancestor_memo.clear()
+        self.layouts.clear()
+        self.generation_memo = None
+        self.version += 1
+
+    def upsert(
+        self,
+        member_id: int,
+        father_id: Optional[int],
+        mother_id: Optional[int],
+        gender: Optional[Gender] = None
+    ) -> None:
+        """Add a member or move them under new parents."""
+        self.upsert_many([(member_id, father_id, mother_id, gender)])
+
+    def upsert_many(self, rows: Iterable[Tuple[int, Optional[int], Optional[int], Optional[Gender]]]) -> None:
+        """Upsert several members; they may name each other as parents."""
+        self._touch()
+        rows = list(rows)
+        for member_id, _, _, _ in rows:
+            if member_id not in self.slot_of:
+                self._allocate(member_id)
+        for member_id, father_id, mother_id, gender in rows:
+            slot = self.slot_of[member_id]
+            self.gender[slot] = GENDER_CODES.get(gender, 0)
+            self._link(slot, father_id, mother_id)
+
+    def remove(self, member_id: int) -> None:
+        """Drop a member; children that pointed at them lose that parent."""
+        self._touch()
+        slot = self.slot_of.pop(member_id, None)
+        if slot is None:
+            return
+        self._link(slot, None, None)
+        for spouse in self.spouses[slot]:
+            self.spouses[spouse].remove(slot)
+        self.spouses[slot] = array("q")
+        for child in self.children[slot]:
+            if self.father[child] == slot:
+                self.father[child] = NO_PARENT
+            if self.mother[child] == slot:
+                self.mother[child] = NO_PARENT
+        self.children[slot] = array("q")
+        self.ids[slot] = 0
+        self.free_slots.append(slot)
+
+    def parents(self, member_id: int) -> Tuple[Optional[int], Optional[int]]:
+        slot = self.slot_of[member_id]
+        father, mother = self.father[slot], self.mother[slot]
+        return (
+            self.ids[father] if father != NO_PARENT else None,
+            self.ids[mother] if mother != NO_PARENT else None,
+        )
+
+    def children_of(self, member_id: int) -> List[int]:
+        return [self.ids[child] for child in self.children[self.slot_of[member_id]]]
+
+    def add_couple(self, person1_id: int, person2_id: int) -> None:
+        """Record a marriage; members outside this tree are ignored."""
+        first, second = self.slot_of.get(person1_id), self.slot_of.get(person2_id)
+        if first is None or second is None or first == second or second in self.spouses[first]:
+            return
+        self._touch()
+        self.spouses[first].append(second)
+        self.spouses[second].append(first)
+
+    def spouses_of(self, member_id: int) -> List[int]:
+        return [self.ids[spouse] for spouse in self.spouses[self.slot_of[member_id]]]
+
+    def gender_of(self, member_id: int) -> Gender:
+        return GENDERS[self.gender[self.slot_of[member_id]]]
+
+    def ancestor_depths(self, member_id: int) -> Dict[int, int]:
+        """
+        Memoized map of the member and all their ancestors to the closest
+        generation distance (the member itself is 0). Reset on every write.
+        """
+        depths = self.ancestor_memo.get(member_id)
+        if depths is None:
+            if len(self.ancestor_memo) >= ANCESTOR_MEMO_SIZE:
+                self.ancestor_memo.clear()
+            depths = {member_id: 0, **self.ancestors(member_id)}
+            self.ancestor_memo[member_id] = depths
+        return depths
+
+    def ancestors(self, member_id: int, generations: Optional[int] = None) -> Dict[int, int]:
+        """Map each ancestor id to the closest generation it appears in."""
+        found: Dict[int, int] = {}
+        frontier = [self.slot_of[member_id]]
+        generation = 0
+        while frontier and (generations is None or generation < generations):
+            generation += 1
+            next_frontier = []
+            for slot in frontier:
+                for parent in (self.father[slot], self.mother[slot]):
+                    if parent != NO_PARENT and self.ids[parent] not in found:
+                        found[self.ids[parent]] = generation
+                        next_frontier.append(parent)
+            frontier = next_frontier
+        return found
+
+    def descendants(self, member_id: int, depth: Optional[int] = None) -> Dict[int, int]:
+        """Map each descendant id to the closest generation it appears in."""
+        found: Dict[int, int] = {}
+        frontier = [self.slot_of[member_id]]
+        generation = 0
+        while frontier and (depth is None or generation < depth):
+            generation += 1
+            next_frontier = []
+            for slot in frontier:
+                for child in self.children[slot]:
+                    if self.ids[child] not in found:
+                        found[self.ids[child]] = generation
+                        next_frontier.append(child)
+            frontier = next_frontier
+        return found
+
+    def generation_counts(self) -> List[int]:
+        """
+        Number of members in each generation, where a member's generation is
+        the length of their longest chain of recorded ancestors (people with
+        no recorded parents are generation 0). Memoized until the next write.
+        """
+        if self.generation_memo is not None:
+            return self.generation_memo
+
+        generation = {}
+        waiting = {}
+        ready = []
+        for slot in self.slot_of.values():
+            parents = sum(parent != NO_PARENT for parent in (self.father[slot], self.mother[slot]))
+            if parents:
+                waiting[slot] = parents
+            else:
+                generation[slot] = 0
+                ready.append(slot)
+
+        # Parents before children; members caught in a (bad data) cycle are never ready and are left out
+        while ready:
+            slot = ready.pop()
+            for child in self.children[slot]:
+                generation[child] = max(generation.get(child, 0), generation[slot] + 1)
+                waiting[child] -= 1
+                if not waiting[child]:
+                    ready.append(child)
+
+        counts = [0] * (max(generation.values()) + 1 if generation else 0)
+        for value in generation.values():
+            counts[value] += 1
+        self.generation_memo = counts
+        return counts
+
+    def memory_bytes(self) -> int:
+        return (
+            sys.getsizeof(self.slot_of)
+            + sys.getsizeof(self.ids)
+            + sys.getsizeof(self.father)
+            + sys.getsizeof(self.mother)
+            + sys.getsizeof(self.gender)
+            + sys.getsizeof(self.children)
+            + sum(sys.getsizeof(children) for children in self.children)
+            + sys.getsizeof(self.spouses)
+            + sum(sys.getsizeof(spouses) for spouses in self.spouses)
+            + sys.getsizeof(self.free_slots)
+        )
+
+
+def graph_statements(user_id: int):
+    """The (id, father_id, mother_id, gender) rows and (person1_id, person2_id) couples a graph is built from."""
+    rows = (
+        select(members.c.id, members.c.father_id, members.c.mother_id, members.c.gender)
+        .where(members.c.user_id == user_id)
+    )
+    couples = (
+        select(marriages.c.person1_id, marriages.c.person2_id)
+        .join(members, members.c.id == marriages.c.person1_id)
+        .where(members.c.user_id == user_id)
+    )
+    return rows, couples
+
+
+class PedigreeGraphIndex:
+    """
+    LRU of per-user PedigreeGraphs.
+
+    Whole user graphs are loaded on first use and evicted least-recently-used
+    first. Each graph records the persisted `users.tree_version` it reflects,
+    and `get` compares that with the database on every call, reloading a
+    graph that is behind, so writes made by other worker processes show up
+    on the next request. Route handlers patch loaded graphs after each
+    committed write and pass the new version along, so this process's own
+    writes do not force a reload.
+
+    `lock` only guards the LRU. Hold the returned graph's own `lock` while
+    traversing it; different users' graphs are read in parallel.
+    """
+
+    def __init__(self, max_users: int = PEDIGREE_CACHE_MAX_USERS):
+        self.max_users = max_users
+        self.graphs: "OrderedDict[int, PedigreeGraph]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    def get(self, db: Session, user_id: int) -> PedigreeGraph:
+        # Read the version before the rows, so a graph is never stamped newer than its contents
+        tree_version = db.execute(select(users.c.tree_version).where(users.c.id == user_id)).scalar_one()
+
+        with self.lock:
+            graph = self.graphs.get(user_id)
+            if graph is not None and graph.tree_version == tree_version:
+                self.graphs.move_to_end(user_id)
+                self.hits += 1
+                return graph
+            if graph is None:
+                self.misses += 1
+            else:
+                self.reloads += 1
+
+        rows_stmt, couples_stmt = graph_statements(user_id)
+        graph = PedigreeGraph.from_rows(db.execute(rows_stmt), db.execute(couples_stmt), tree_version)
+
+        with self.lock:
+            # Another request may have loaded or patched a newer copy meanwhile
+            cached = self.graphs.get(user_id)
+            if cached is not None and cached.tree_version >= tree_version:
+                self.graphs.move_to_end(user_id)
+                return cached
+            self.graphs[user_id] = graph
+            self.graphs.move_to_end(user_id)
+            while len(self.graphs) > self.max_users:
+                self.graphs.popitem(last=False)
+                self.evictions += 1
+            return graph
+
+    def _patch(self, user_id: int, tree_version: int, apply: Callable[[PedigreeGraph], None]) -> None:
+        """Apply a committed write to a cached graph that was current just before it."""
+        with self.lock:
+            graph = self.graphs.get(user_id)
+        if graph is None:
+            return
+        with graph.lock:
+            # A graph that missed another write is left behind; `get` reloads it
+            if graph.tree_version == tree_version - 1:
+                apply(graph)
+                graph.tree_version = tree_version
+
+    def members_saved(
+        self,
+        user_id: int,
+        saved: Iterable[FamilyMember],
+        tree_version: int,
+        deleted: Iterable[int] = ()
+    ) -> None:
+        """Patch in members created, edited or deleted by the commit that reached `tree_version`."""
+        rows = [(member.id, member.father_id, member.mother_id, member.gender) for member in saved]
+        deleted = list(deleted)
+
+        def apply(graph: PedigreeGraph) -> None:
+            if rows:
+                graph.upsert_many(rows)
+            for member_id in deleted:
+                graph.remove(member_id)
+
+        self._patch(user_id, tree_version, apply)
+
+    def member_saved(self, user_id: int, member: FamilyMember, tree_version: int) -> None:
+        self.members_saved(user_id, [member], tree_version)
+
+    def member_deleted(self, user_id: int, member_id: int, tree_version: int) -> None:
+        self.members_saved(user_id, [], tree_version, [member_id])
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        with self.lock:
+            if user_id is None:
+                self.graphs.clear()
+            else:
+                self.graphs.pop(user_id, None)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            graphs = list(self.graphs.values())
+            lookups = self.hits + self.misses + self.reloads
+            stats = {
+                "users_cached": len(graphs),
+                "max_users": self.max_users,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+        stats["members_cached"] = sum(len(graph) for graph in graphs)
+        stats["memory_bytes"] = sum(graph.memory_bytes() for graph in graphs)
+        return stats
+
+
+pedigree_index = PedigreeGraphIndex()
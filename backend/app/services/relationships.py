@@ -0,0 +1,148 @@
+from typing import Dict, List
+
+from ..models import Gender
+from .pedigree_graph import PedigreeGraph
+
+ORDINALS = ["first", "second", "third", "fourth", "fifth", "sixth", "seventh", "eighth", "ninth", "tenth"]
+REMOVALS = {1: "once", 2: "twice", 3: "three times"}
+SUFFIXES = {1: "st", 2: "nd", 3: "rd"}
+
+# Others accepted by one batch relationship request
+MAX_RELATIONSHIP_BATCH = 500
+
+NOUNS = {
+    "parent": {Gender.MALE: "father", Gender.FEMALE: "mother"},
+    "child": {Gender.MALE: "son", Gender.FEMALE: "daughter"},
+    "sibling": {Gender.MALE: "brother", Gender.FEMALE: "sister"},
+    "grandparent": {Gender.MALE: "grandfather", Gender.FEMALE: "grandmother"},
+    "grandchild": {Gender.MALE: "grandson", Gender.FEMALE: "granddaughter"},
+    "aunt or uncle": {Gender.MALE: "uncle", Gender.FEMALE: "aunt"},
+    "niece or nephew": {Gender.MALE: "nephew", Gender.FEMALE: "niece"},
+}
+
+
+def _noun(kind: str, gender: Gender) -> str:
+    return NOUNS[kind].get(gender, kind)
+
+
+def _ordinal(n: int) -> str:
+    if n <= len(ORDINALS):
+        return ORDINALS[n - 1]
+    if n % 100 in (11, 12, 13):
+        return f"{n}th"
+    return f"{n}{SUFFIXES.get(n % 10, 'th')}"
+
+
+def relationship_label(from_a: int, from_b: int, gender: Gender = Gender.UNKNOWN, half: bool = False) -> str:
+    """
+    Name what A is to B, given the generations from A and from B up to their
+    closest common ancestor.
+    """
+    if from_a == 0 and from_b == 0:
+        return "self"
+
+    if from_a == 0 or from_b == 0:
+        distance = from_a + from_b
+        kind = "parent" if from_a == 0 else "child"
+        if distance == 1:
+            return _noun(kind, gender)
+        return "great-" * (distance - 2) + _noun("grand" + kind, gender)
+
+    prefix = "half-" if half else ""
+
+    if from_a == 1 and from_b == 1:
+        return prefix + _noun("sibling", gender)
+
+    if from_a == 1 or from_b == 1:
+        distance = max(from_a, from_b)
+        kind = "aunt or uncle" if from_a == 1 else "niece or nephew"
+        return prefix + "great-" * (distance - 2) + _noun(kind, gender)
+
+    degree = min(from_a, from_b) - 1
+    removed = abs(from_a - from_b)
+    label = f"{'half ' if half else ''}{_ordinal(degree)} cousin"
+    if removed:
+        label += f" {REMOVALS.get(removed, f'{removed} times')} removed"
+    return label
+
+
+def _is_half(graph: PedigreeGraph, ancestor: int, depths_a: Dict[int, int], depths_b: Dict[int, int]) -> bool:
+    """
+    Whether A and B descend from `ancestor` through half siblings: the
+    ancestor's children on each line must both have two recorded parents,
+    and the parent other than the ancestor must differ. A missing parent
+    could be the shared one, so it never makes a relationship half.
+    """
+    line_a = [child for child in graph.children_of(ancestor) if depths_a.get(child) == depths_a[ancestor] - 1]
+    line_b = [child for child in graph.children_of(ancestor) if depths_b.get(child) == depths_b[ancestor] - 1]
+    if not line_a or not line_b:
+        return False
+    for child_a in line_a:
+        parents_a = graph.parents(child_a)
+        for child_b in line_b:
+            parents_b = graph.parents(child_b)
+            if None in parents_a or None in parents_b or set(parents_a) == set(parents_b):
+                return False
+    return True
+
+
+def describe_relationship(graph: PedigreeGraph, person_a: int, person_b: int) -> Dict:
+    """
+    Work out how A is related to B by blood.
+
+    Uses the graph's memoized ancestor maps, so the cost is bounded by the two
+    pedigrees rather than the size of the tree. The lowest common ancestors are
+    those none of whose children are also common ancestors; the closest of them
+    determines the label.
+    """
+    depths_a = graph.ancestor_depths(person_a)
+    depths_b = graph.ancestor_depths(person_b)
+
+    common = depths_a.keys() & depths_b.keys()
+    lowest = [
+        ancestor for ancestor in common
+        if not any(child in common for child in graph.children_of(ancestor))
+    ]
+    lowest.sort(key=lambda ancestor: (depths_a[ancestor] + depths_b[ancestor], ancestor))
+
+    result = {
+        "person_a_id": person_a,
+        "person_b_id": person_b,
+        "related": bool(lowest),
+        "label": None,
+        "generations_from_a": None,
+        "generations_from_b": None,
+        "common_ancestors": [
+            {
+                "id": ancestor,
+                "generations_from_a": depths_a[ancestor],
+                "generations_from_b": depths_b[ancestor],
+            }
+            for ancestor in lowest
+        ],
+    }
+
+    if not lowest:
+        return result
+
+    from_a, from_b = depths_a[lowest[0]], depths_b[lowest[0]]
+    # Full relatives share a couple at the closest generation; half relatives only one person of it
+    sharing = sum(1 for ancestor in lowest if (depths_a[ancestor], depths_b[ancestor]) == (from_a, from_b))
+    half = sharing == 1 and _is_half(graph, lowest[0], depths_a, depths_b)
+
+    result.update({
+        "label": relationship_label(from_a, from_b, graph.gender_of(person_a), half=half),
+        "generations_from_a": from_a,
+        "generations_from_b": from_b,
+    })
+    return result
+
+
+def describe_relationships(graph: PedigreeGraph, person_a: int, others: List[int]) -> List[Dict]:
+    """
+    Relationships from one person to many; A's ancestor map is computed once.
+    Raises ValueError for more than MAX_RELATIONSHIP_BATCH others.
+    """
+    if len(others) > MAX_RELATIONSHIP_BATCH:
+        raise ValueError(f"Too many members. Max per request: {MAX_RELATIONSHIP_BATCH}")
+    return [describe_relationship(graph, person_a, other) for other in others]
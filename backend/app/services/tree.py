@@ -0,0 +1,83 @@
+from typing import Dict, List
+
+from sqlalchemy import Integer, case, cast, extract, select
+from sqlalchemy.orm import Session
+
+from ..models import FamilyMember
+from .pedigree_graph import GENDER_CODES
+
+members = FamilyMember.__table__
+
+
+def _year(column):
+    # EXTRACT returns numeric on PostgreSQL 14+, which arrives as Decimal
+    return cast(extract("year", column), Integer)
+
+
+# Column name in the payload -> SQL expression. Years and gender codes are
+# computed by the database so rows come back as plain scalars.
+TREE_COLUMNS = {
+    "ids": members.c.id,
+    "first_names": members.c.first_name,
+    "last_names": members.c.last_name,
+    "birth_years": _year(members.c.birth_date),
+    "death_years": _year(members.c.death_date),
+    "father_ids": members.c.father_id,
+    "mother_ids": members.c.mother_id,
+    "genders": case(
+        *((members.c.gender == gender, code) for gender, code in GENDER_CODES.items() if code),
+        else_=0
+    ),
+}
+
+# Member fields attached to each chart node, so a client can draw a layout
+# without holding the member list; looked up a chunk of ids at a time
+NODE_COLUMNS = {
+    "first_name": members.c.first_name,
+    "last_name": members.c.last_name,
+    "gender": members.c.gender,
+    "birth_year": _year(members.c.birth_date),
+    "death_year": _year(members.c.death_date),
+}
+NODE_LOOKUP_CHUNK = 500
+
+
+def tree_columns_statement(user_id: int):
+    return (
+        select(*(expr.label(name) for name, expr in TREE_COLUMNS.items()))
+        .where(members.c.user_id == user_id)
+        .order_by(members.c.id)
+    )
+
+
+def fetch_tree_columns(db: Session, user_id: int) -> Dict[str, List]:
+    """
+    Fetch a user's whole tree as parallel arrays, one per column.
+
+    Uses a Core projection so no ORM objects are built, and transposes the
+    rows with zip rather than serializing one object per person.
+    """
+    rows = db.execute(tree_columns_statement(user_id)).all()
+
+    columns = list(zip(*rows)) if rows else [()] * len(TREE_COLUMNS)
+    payload = {name: list(values) for name, values in zip(TREE_COLUMNS, columns)}
+    payload["count"] = len(rows)
+    payload["gender_codes"] = {code: gender.value for gender, code in GENDER_CODES.items()}
+    return payload
+
+
+def node_fields_statement(user_id: int, member_ids: List[int]):
+    return (
+        select(members.c.id, *(expr.label(name) for name, expr in NODE_COLUMNS.items()))
+        .where(members.c.user_id == user_id, members.c.id.in_(member_ids))
+    )
+
+
+def fetch_node_fields(db: Session, user_id: int, member_ids: List[int]) -> Dict[int, Dict]:
+    """NODE_COLUMNS for each of the given members, keyed by id."""
+    fields = {}
+    for start in range(0, len(member_ids), NODE_LOOKUP_CHUNK):
+        chunk = member_ids[start:start + NODE_LOOKUP_CHUNK]
+        for row in db.execute(node_fields_statement(user_id, chunk)).mappings():
+            fields[row["id"]] = {name: row[name] for name in NODE_COLUMNS}
+    return fields
@@ -0,0 +1,216 @@
+"""
+Per-user tree statistics kept as running counters.
+
+Each member contributes to a handful of (metric, bucket) counters in
+`tree_stats`: one for the member total, one for their surname, gender,
+birth place and birth century, and a lifespan sum for their birth century.
+Write handlers pass the before and after values of the members they touch
+to `record_changes`, which applies the difference as one upsert, so reading
+statistics never scans `family_members`.
+
+Generation depth is a longest-path property that a single parent edit can
+change for a whole subtree, so it comes from the cached pedigree graph
+instead of a counter.
+
+Existing trees are counted by a schema upgrade step on startup. If the
+counters ever drift, rebuild them from the members table:
+
+    python -m app.services.tree_stats [user_id ...]
+"""
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple, Union
+import logging
+import sys
+
+from sqlalchemy import delete, exists, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from ..models import FamilyMember, Gender, TreeStat
+from ..utils.upsert import dialect_insert
+from .pedigree_graph import pedigree_index
+
+logger = logging.getLogger(__name__)
+
+# Member columns that feed the counters; other edits leave statistics unchanged
+STAT_COLUMNS = ("last_name", "gender", "birth_date", "birth_place", "death_date")
+
+DAYS_PER_YEAR = 365.2425
+REBUILD_BATCH_SIZE = 1000
+
+members = FamilyMember.__table__
+tree_stats = TreeStat.__table__
+
+
+def snapshot(member) -> Dict:
+    """The statistic-relevant values of a member object."""
+    return {column: getattr(member, column) for column in STAT_COLUMNS}
+
+
+def contributions(values: Mapping) -> List[Tuple[str, str, float]]:
+    """(metric, bucket, measured value) counters a member with these values adds to."""
+    items = [("members", "", 0.0)]
+
+    surname = (values.get("last_name") or "").strip()
+    if surname:
+        items.append(("surname", surname, 0.0))
+
+    gender = values.get("gender") or Gender.UNKNOWN
+    items.append(("gender", getattr(gender, "value", gender), 0.0))
+
+    place = (values.get("birth_place") or "").strip()
+    if place:
+        items.append(("birth_place", place, 0.0))
+
+    birth: Optional[date] = values.get("birth_date")
+    death: Optional[date] = values.get("death_date")
+    if birth:
+        century = str(birth.year // 100 * 100)
+        items.append(("birth_century", century, 0.0))
+        if death and death >= birth:
+            items.append(("lifespan_century", century, (death - birth).days / DAYS_PER_YEAR))
+    return items
+
+
+def _deltas(removed: Iterable[Mapping], added: Iterable[Mapping]) -> Dict[Tuple[str, str], List]:
+    deltas: Dict[Tuple[str, str], List] = defaultdict(lambda: [0, 0.0])
+    for sign, group in ((-1, removed), (1, added)):
+        for values in group:
+            for metric, bucket, measured in contributions(values):
+                delta = deltas[(metric, bucket)]
+                delta[0] += sign
+                delta[1] += sign * measured
+    return deltas
+
+
+def _upsert(db: Union[Session, Connection], rows: List[Dict]) -> None:
+    stmt = dialect_insert(db, tree_stats)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "metric", "bucket"],
+        set_={"count": tree_stats.c.count + stmt.excluded.count, "total": tree_stats.c.total + stmt.excluded.total}
+    )
+    db.execute(stmt, rows)
+
+
+def record_changes(
+    db: Session,
+    user_id: int,
+    removed: Iterable[Mapping] = (),
+    added: Iterable[Mapping] = ()
+) -> None:
+    """
+    Apply member changes to the counters: `removed` holds values that no
+    longer exist (deleted members, or members before an edit) and `added`
+    the values that now do. Does not commit.
+    """
+    rows = [
+        {"user_id": user_id, "metric": metric, "bucket": bucket, "count": count, "total": total}
+        for (metric, bucket), (count, total) in _deltas(removed, added).items()
+        if count or total
+    ]
+    if rows:
+        _upsert(db, rows)
+
+
+def stat_rows_statement(user_id: int):
+    return select(*(members.c[column] for column in STAT_COLUMNS)).where(members.c.user_id == user_id)
+
+
+def rebuild_stats(db: Union[Session, Connection], user_id: int) -> int:
+    """Recompute a user's counters from scratch; returns the number of members counted. Does not commit."""
+    db.execute(delete(tree_stats).where(tree_stats.c.user_id == user_id))
+
+    result = db.execute(
+        stat_rows_statement(user_id).execution_options(yield_per=REBUILD_BATCH_SIZE)
+    ).mappings()
+    deltas: Dict[Tuple[str, str], List] = defaultdict(lambda: [0, 0.0])
+    counted = 0
+    for chunk in result.partitions():
+        for key, (count, total) in _deltas((), chunk).items():
+            deltas[key][0] += count
+            deltas[key][1] += total
+        counted += len(chunk)
+
+    rows = [
+        {"user_id": user_id, "metric": metric, "bucket": bucket, "count": count, "total": total}
+        for (metric, bucket), (count, total) in deltas.items()
+    ]
+    if rows:
+        _upsert(db, rows)
+    return counted
+
+
+def backfill_tree_stats(connection: Connection) -> None:
+    """Schema upgrade step: count the trees of users who have members but no statistics yet."""
+    user_ids = list(connection.scalars(
+        select(members.c.user_id).distinct()
+        .where(~exists().where(tree_stats.c.user_id == members.c.user_id))
+    ))
+    for user_id in user_ids:
+        counted = rebuild_stats(connection, user_id)
+        logger.info(f"Counted statistics for user {user_id} ({counted} members)")
+
+
+def buckets_statement(user_id: int, metric: str, limit: Optional[int] = None):
+    query = (
+        select(tree_stats.c.bucket, tree_stats.c.count, tree_stats.c.total)
+        .where(tree_stats.c.user_id == user_id, tree_stats.c.metric == metric, tree_stats.c.count > 0)
+        .order_by(tree_stats.c.count.desc(), tree_stats.c.bucket)
+    )
+    if limit:
+        query = query.limit(limit)
+    return query
+
+
+def _buckets(db: Session, user_id: int, metric: str, limit: Optional[int] = None) -> List:
+    return db.execute(buckets_statement(user_id, metric, limit)).all()
+
+
+def get_stats(db: Session, user_id: int, top: int = 10) -> Dict:
+    """Dashboard statistics for a user's tree, read from the counters and the pedigree graph."""
+    total = _buckets(db, user_id, "members")
+    lifespans = sorted(_buckets(db, user_id, "lifespan_century"), key=lambda row: int(row.bucket))
+    births = sorted(_buckets(db, user_id, "birth_century"), key=lambda row: int(row.bucket))
+
+    graph = pedigree_index.get(db, user_id)
+    with graph.lock:
+        generations = list(graph.generation_counts())
+
+    return {
+        "members": total[0].count if total else 0,
+        "genders": {row.bucket: row.count for row in _buckets(db, user_id, "gender")},
+        "top_surnames": [
+            {"surname": row.bucket, "count": row.count} for row in _buckets(db, user_id, "surname", top)
+        ],
+        "top_birth_places": [
+            {"place": row.bucket, "count": row.count} for row in _buckets(db, user_id, "birth_place", top)
+        ],
+        "births_by_century": [{"century": int(row.bucket), "count": row.count} for row in births],
+        "average_lifespan_by_century": [
+            {"century": int(row.bucket), "average_years": round(row.total / row.count, 1), "count": row.count}
+            for row in lifespans
+        ],
+        "generations": {"depth": len(generations), "members_per_generation": generations},
+    }
+
+
+def main(argv: List[str]) -> int:
+    from ..database import SessionLocal, init_db
+    from ..models import User
+
+    init_db()
+    db = SessionLocal()
+    try:
+        user_ids = [int(arg) for arg in argv] or list(db.scalars(select(User.id)))
+        for user_id in user_ids:
+            counted = rebuild_stats(db, user_id)
+            db.commit()
+            print(f"Rebuilt statistics for user {user_id} ({counted} members)")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,159 @@
+"""
+Per-user tree version and change log.
+
+`users.tree_version` goes up by one in the same transaction as every change
+to a user's members, marriages or documents, and `users.tree_modified_at`
+records when. Read endpoints turn the pair into ETag and Last-Modified
+validators (see `app/utils/conditional.py`), so an unchanged tree is
+answered with 304 before any tree query runs.
+
+The same call records which rows changed in `tree_changes`, one row per
+member, document or marriage holding the version of its latest change.
+Deleted rows leave a tombstone there, so `changes_since` can tell a client
+exactly what to upsert and remove to catch up from any earlier version.
+The same ids go out on the live change feed once the write commits.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from ..models import Document, FamilyMember, Marriage, TreeChange, User
+from ..utils.upsert import dialect_insert
+from .events import queue_event
+
+ENTITY_MODELS = {"member": FamilyMember, "document": Document, "marriage": Marriage}
+
+# Change rows written per statement, to stay under bound-parameter limits
+CHANGE_CHUNK_SIZE = 1000
+
+users = User.__table__
+tree_changes = TreeChange.__table__
+
+
+def _record(db: Session, user_id: int, version: int, entity: str, ids: List[int], deleted: bool) -> None:
+    now = datetime.utcnow()
+    rows = [
+        {"user_id": user_id, "entity": entity, "entity_id": entity_id, "version": version, "deleted": deleted, "changed_at": now}
+        for entity_id in ids
+    ]
+    for start in range(0, len(rows), CHANGE_CHUNK_SIZE):
+        stmt = dialect_insert(db, tree_changes)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "entity", "entity_id"],
+            set_={"version": stmt.excluded.version, "deleted": stmt.excluded.deleted, "changed_at": stmt.excluded.changed_at}
+        )
+        db.execute(stmt, rows[start:start + CHANGE_CHUNK_SIZE])
+
+
+def bump_tree_version(
+    db: Session,
+    user_id: int,
+    upserted: Optional[Mapping[str, Iterable[int]]] = None,
+    deleted: Optional[Mapping[str, Iterable[int]]] = None
+) -> int:
+    """
+    Advance the user's tree version and log the rows created, edited
+    (`upserted`) and removed (`deleted`), keyed by entity name. Returns the
+    new version. Does not commit. The row lock taken by the UPDATE serialises
+    concurrent writers, so versions are never reused and commit in order.
+    """
+    version = db.execute(
+        update(users)
+        .where(users.c.id == user_id)
+        .values(tree_version=users.c.tree_version + 1, tree_modified_at=datetime.utcnow())
+        .returning(users.c.tree_version)
+    ).scalar_one()
+
+    upserted = {entity: list(dict.fromkeys(ids)) for entity, ids in (upserted or {}).items()}
+    deleted = {entity: list(dict.fromkeys(ids)) for entity, ids in (deleted or {}).items()}
+    for entity, ids in upserted.items():
+        _record(db, user_id, version, entity, ids, deleted=False)
+    for entity, ids in deleted.items():
+        _record(db, user_id, version, entity, ids, deleted=True)
+
+    queue_event(db, user_id, {
+        "version": version,
+        "upserted": {f"{entity}s": ids for entity, ids in upserted.items() if ids},
+        "deleted": {f"{entity}s": ids for entity, ids in deleted.items() if ids},
+    })
+    return version
+
+
+def tree_state_statement(user_id: int):
+    return select(users.c.id, users.c.tree_version, users.c.tree_modified_at).where(users.c.id == user_id)
+
+
+def tree_state(db: Session, user_id: int):
+    """
+    The user's id, tree version and last modification time, read fresh for
+    validators and sync (the cached principal does not carry them).
+    """
+    return db.execute(tree_state_statement(user_id)).one()
+
+
+def changed_rows_statement(user_id: int, entity: str, since: int):
+    """Rows of `entity` upserted after version `since`."""
+    model = ENTITY_MODELS[entity]
+    return (
+        select(model)
+        .join(TreeChange, TreeChange.entity_id == model.id)
+        .where(
+            TreeChange.user_id == user_id,
+            TreeChange.version > since,
+            TreeChange.entity == entity,
+            TreeChange.deleted.is_(False)
+        )
+        .order_by(model.id)
+    )
+
+
+def all_rows_statement(user_id: int, entity: str):
+    """Every row of `entity` in the user's tree."""
+    if entity == "marriage":
+        return (
+            select(Marriage)
+            .join(FamilyMember, FamilyMember.id == Marriage.person1_id)
+            .where(FamilyMember.user_id == user_id)
+            .order_by(Marriage.id)
+        )
+    model = ENTITY_MODELS[entity]
+    return select(model).where(model.user_id == user_id).order_by(model.id)
+
+
+def tombstones_statement(user_id: int, since: int):
+    """Entities deleted after version `since`."""
+    return (
+        select(TreeChange.entity, TreeChange.entity_id)
+        .where(TreeChange.user_id == user_id, TreeChange.version > since, TreeChange.deleted.is_(True))
+        .order_by(TreeChange.entity_id)
+    )
+
+
+def _changed_rows(db: Session, user_id: int, entity: str, since: int) -> List:
+    return list(db.scalars(changed_rows_statement(user_id, entity, since)))
+
+
+def _all_rows(db: Session, user_id: int, entity: str) -> List:
+    return list(db.scalars(all_rows_statement(user_id, entity)))
+
+
+def changes_since(db: Session, user_id: int, version: int, since: int) -> Dict:
+    """
+    Rows to upsert and ids to delete for a client holding the tree as of
+    `since`, up to at least `version` (the current version, read before the
+    rows so nothing committed in between is missed; a row may be sent twice).
+    A client with no copy (`since` 0) or one from a version this database
+    never reached gets the whole tree with `full` set, and should replace its copy.
+    """
+    full = since <= 0 or since > version
+    result = {"version": version, "full": full, "deleted": {"members": [], "documents": [], "marriages": []}}
+    for entity in ENTITY_MODELS:
+        key = f"{entity}s"
+        result[key] = _all_rows(db, user_id, entity) if full else _changed_rows(db, user_id, entity, since)
+
+    if not full:
+        for entity, entity_id in db.execute(tombstones_statement(user_id, since)):
+            result["deleted"][f"{entity}s"].append(entity_id)
+    return result
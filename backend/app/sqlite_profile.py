@@ -0,0 +1,283 @@
+"""
+SQLite production profile.
+
+Every new SQLite connection is tuned with PRAGMAs: WAL journaling, so readers
+never wait for the writer; synchronous=NORMAL, which is durable under WAL
+except for the last commits before a power loss; a busy timeout; a memory
+map; a larger page cache; and in-memory temporary tables.
+
+WAL still allows only one writer at a time. A deferred transaction that reads
+before it writes fails with "database is locked" as soon as another writer
+commits in between, and no busy timeout helps. Write sessions
+(`WriteSessionLocal`, `get_write_db` and their async counterparts in
+`app/database.py`) therefore take turns through `writer_queue`, in arrival
+order. Each transaction waits for its turn, opens with BEGIN IMMEDIATE so
+the write lock is held from the first statement, and passes the turn on once
+it has committed or rolled back. Read sessions are not queued.
+
+A turn lasts the whole transaction, so write sessions should do their slow
+work (reading large sets, saving files, streaming) outside it and commit
+promptly; long jobs commit in chunks. A writer still waiting after
+SQLITE_WRITER_TIMEOUT seconds raises WriterTimeout, which the app answers
+with 503 and Retry-After.
+
+Turns are per process. With several worker processes, the busy timeout
+arbitrates between them.
+"""
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+import asyncio
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine, make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util import await_only
+
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", "268435456")),
+    # Negative sizes are in KiB: 64 MiB of page cache per connection
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+}
+SQLITE_SERIALIZE_WRITES = os.getenv("SQLITE_SERIALIZE_WRITES", "1") != "0"
+# How long a write transaction waits for its turn before giving up, and the
+# Retry-After sent with the 503 that follows
+SQLITE_WRITER_TIMEOUT = float(os.getenv("SQLITE_WRITER_TIMEOUT", "10"))
+SQLITE_WRITER_RETRY_AFTER = int(os.getenv("SQLITE_WRITER_RETRY_AFTER", "2"))
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Execution option marking the connections of write sessions
+WRITER_OPTION = "sqlite_writer"
+# Connection.info key set while a transaction holds a writer turn
+TURN_KEY = "sqlite_writer_turn"
+
+
+class WriterTimeout(TimeoutError):
+    pass
+
+
+class WriterQueue:
+    """
+    First-come, first-served turns for write transactions, shared by
+    threads and event loops. A finished writer hands its turn straight to
+    the next waiter, so nobody waits in SQLite's busy loop.
+    """
+
+    def __init__(self, timeout: float = SQLITE_WRITER_TIMEOUT):
+        self.timeout = timeout
+        self._mutex = threading.Lock()
+        self._held = False
+        self._waiters: Deque[Callable[[], None]] = deque()
+        self.acquisitions = 0
+        self.contended = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _try_acquire(self) -> bool:
+        if self._held:
+            return False
+        self._held = True
+        self.acquisitions += 1
+        return True
+
+    def _granted(self, waited: float) -> None:
+        with self._mutex:
+            self.acquisitions += 1
+            self.contended += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def _timed_out(self, grant: Callable[[], None]) -> bool:
+        """Withdraw from the queue; False if the turn was granted meanwhile."""
+        with self._mutex:
+            try:
+                self._waiters.remove(grant)
+            except ValueError:
+                return False
+            self.timeouts += 1
+            return True
+
+    def acquire(self) -> None:
+        """Block the calling thread until it is this writer's turn."""
+        with self._mutex:
+            if self._try_acquire():
+                return
+            turn = threading.Event()
+            self._waiters.append(turn.set)
+        start = time.perf_counter()
+        if not turn.wait(self.timeout) and self._timed_out(turn.set):
+            raise WriterTimeout(f"Timed out after {self.timeout:g}s waiting to write to the database")
+        self._granted(time.perf_counter() - start)
+
+    async def acquire_async(self) -> None:
+        """Wait on the running event loop until it is this writer's turn."""
+        loop = asyncio.get_running_loop()
+        with self._mutex:
+            if self._try_acquire():
+                return
+            future = loop.create_future()
+
+            def grant() -> None:
+                try:
+                    loop.call_soon_threadsafe(self._resolve, future)
+                except RuntimeError:
+                    # The waiter's loop is closed; pass the turn on
+                    self.release()
+
+            self._waiters.append(grant)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            if self._timed_out(grant):
+                future.cancel()
+                raise WriterTimeout(f"Timed out after {self.timeout:g}s waiting to write to the database")
+            await future
+        except asyncio.CancelledError:
+            # Cancelled after the turn arrived: release it; before: _resolve will
+            future.cancel()
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        self._granted(time.perf_counter() - start)
+
+    def _resolve(self, future: asyncio.Future) -> None:
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+    def release(self) -> None:
+        with self._mutex:
+            if self._waiters:
+                grant = self._waiters.popleft()
+            else:
+                self._held = False
+                return
+        grant()
+
+    def stats(self) -> Dict:
+        with self._mutex:
+            return {
+                "held": self._held,
+                "waiting": len(self._waiters),
+                "acquisitions": self.acquisitions,
+                "contended": self.contended,
+                "timeouts": self.timeouts,
+                "average_wait_ms": round(1000 * self.wait_seconds / self.contended, 3) if self.contended else 0.0,
+                "max_wait_ms": round(1000 * self.max_wait_seconds, 3),
+            }
+
+
+writer_queue = WriterQueue()
+
+# "database is locked" / "database is busy" errors seen by any engine
+lock_errors = 0
+
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def is_memory_database(url: str) -> bool:
+    return is_sqlite(url) and make_url(url).database in (None, "", ":memory:")
+
+
+def pool_options(url: str) -> Dict:
+    """create_engine pool arguments; in-memory SQLite keeps its single-connection pool."""
+    if is_memory_database(url):
+        return {}
+    options = {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT}
+    if make_url(url).get_driver_name() == "aiosqlite":
+        # aiosqlite defaults to opening a connection (and its thread) per checkout
+        options["poolclass"] = AsyncAdaptedQueuePool
+    return options
+
+
+def _finish(connection: Connection, end: str) -> None:
+    if not connection.info.pop(TURN_KEY, False):
+        return
+    try:
+        # End the transaction here so the next writer's BEGIN IMMEDIATE never
+        # meets it; the driver's own commit or rollback that follows is a no-op
+        getattr(connection.connection.dbapi_connection, end)()
+    finally:
+        writer_queue.release()
+
+
+def apply_sqlite_profile(engine: Engine) -> None:
+    """Install the profile on a sync engine (pass `async_engine.sync_engine` for an async one)."""
+
+    @event.listens_for(engine, "connect")
+    def _tune(dbapi_connection, connection_record):
+        # Take transaction control from the driver so write sessions can BEGIN IMMEDIATE
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _begin(connection: Connection):
+        if not connection.get_execution_options().get(WRITER_OPTION):
+            connection.exec_driver_sql("BEGIN")
+            return
+        if SQLITE_SERIALIZE_WRITES:
+            if connection.dialect.is_async:
+                # Runs inside the async session's greenlet, so it can wait without blocking the loop
+                await_only(writer_queue.acquire_async())
+            else:
+                writer_queue.acquire()
+            connection.info[TURN_KEY] = True
+        try:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+        except Exception:
+            _finish(connection, "rollback")
+            raise
+
+    @event.listens_for(engine, "commit")
+    def _commit(connection: Connection):
+        _finish(connection, "commit")
+
+    @event.listens_for(engine, "rollback")
+    def _rollback(connection: Connection):
+        _finish(connection, "rollback")
+
+    @event.listens_for(engine, "handle_error")
+    def _count_lock_errors(context):
+        global lock_errors
+        message = str(context.original_exception)
+        if "database is locked" in message or "database is busy" in message:
+            lock_errors += 1
+
+
+def pool_stats(engine: Engine) -> Dict:
+    pool = engine.pool
+    stats: Dict[str, Optional[int]] = {"class": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        stats[name] = method() if callable(method) else None
+    return stats
+
+
+def database_stats(engine: Engine, async_engine) -> Dict:
+    """Connection pool usage for both engines, writer queue and lock-error counts."""
+    stats = {
+        "backend": engine.dialect.name,
+        "pools": {"sync": pool_stats(engine), "async": pool_stats(async_engine.sync_engine)},
+    }
+    if engine.dialect.name == "sqlite":
+        stats["pragmas"] = SQLITE_PRAGMAS
+        stats["writer"] = {"serialized": SQLITE_SERIALIZE_WRITES, **writer_queue.stats()}
+        stats["lock_errors"] = lock_errors
+    return stats
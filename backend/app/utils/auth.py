@@ -1,15 +1,18 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 import os
 from dotenv import load_dotenv
 
-from ..database import get_db
+from ..database import get_async_db, get_db
 from ..models import User
+from ..services.passwords import pwd_context
+from .token_cache import Principal, token_cache
 
 load_dotenv()
 
@@ -17,8 +20,8 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login", auto_error=False)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -36,21 +39,58 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _token_claims(token: str) -> Dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
+        if payload.get("sub") is None:
+            raise _credentials_exception()
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+    return payload
+
+def _active(principal: Principal) -> Principal:
+    if not principal.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User account is inactive")
+    return principal
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    """The token's user, from the token cache when possible (see app/utils/token_cache.py)."""
+    principal = token_cache.get(token)
+    if principal is None:
+        claims = _token_claims(token)
+        user = db.query(User).filter(User.username == claims["sub"]).first()
+        if user is None:
+            raise _credentials_exception()
+        principal = Principal.from_user(user, claims)
+        token_cache.put(token, principal)
+    return _active(principal)
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> Principal:
+    """get_current_user for async routes; shares the route's AsyncSession."""
+    principal = token_cache.get(token)
+    if principal is None:
+        claims = _token_claims(token)
+        user = await db.scalar(select(User).where(User.username == claims["sub"]))
+        if user is None:
+            raise _credentials_exception()
+        principal = Principal.from_user(user, claims)
+        token_cache.put(token, principal)
+    return _active(principal)
 
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
-        raise credentials_exception
-    return user
+def get_current_user_for_stream(
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    access_token: Optional[str] = Query(None),
+    db: Session = Depends(get_db)
+) -> Principal:
+    """
+    Like get_current_user, but also accepts the token as ?access_token=,
+    because browser EventSource connections cannot send an Authorization header.
+    """
+    return get_current_user(token or access_token or "", db)
@@ -0,0 +1,131 @@
+"""
+Mixed-load benchmark for a running API server.
+
+Registers a throwaway user, then keeps `--concurrency` clients busy for
+`--seconds` with a mix of genealogy searches (no external sources, so only
+the server's own work is measured), search history and member/document
+listing, member creation and small document uploads. Prints throughput and
+latency percentiles per operation:
+
+    python -m app.utils.benchmark --url http://localhost:8000 --concurrency 50
+
+Run it against two builds to compare them; numbers are only comparable on
+the same machine, database and worker count.
+
+All requests come from one user, so start the server with RATE_LIMIT_ENABLED=0
+or the search limits turn most searches into 429 errors.
+"""
+from typing import Dict, List
+import argparse
+import asyncio
+import random
+import sys
+import time
+import uuid
+
+import httpx
+
+# Relative weight of each operation in the mix
+MIX = {
+    "search": 30,
+    "search_history": 10,
+    "list_members": 25,
+    "list_documents": 15,
+    "create_member": 10,
+    "upload_document": 10,
+}
+
+
+async def _register(client: httpx.AsyncClient) -> Dict[str, str]:
+    name = f"bench_{uuid.uuid4().hex[:12]}"
+    await client.post("/api/auth/register", json={"email": f"{name}@example.com", "username": name, "password": name})
+    response = await client.post("/api/auth/login", data={"username": name, "password": name})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def _operation(client: httpx.AsyncClient, name: str, headers: Dict[str, str]) -> httpx.Response:
+    if name == "search":
+        return await client.post("/api/search/genealogy", json={"last_name": "Smith", "sources": []}, headers=headers)
+    if name == "search_history":
+        return await client.get("/api/search/history", params={"limit": 20}, headers=headers)
+    if name == "list_members":
+        return await client.get("/api/family-members", params={"limit": 50}, headers=headers)
+    if name == "list_documents":
+        return await client.get("/api/documents", params={"limit": 50}, headers=headers)
+    if name == "create_member":
+        return await client.post("/api/family-members", json={"first_name": "Bench", "last_name": "Mark"}, headers=headers)
+    return await client.post(
+        "/api/documents",
+        data={"title": "Benchmark"},
+        files={"file": ("bench.txt", b"benchmark " * 100, "text/plain")},
+        headers=headers
+    )
+
+
+async def _worker(client, headers, deadline: float, timings: Dict[str, List[float]], errors: Dict[str, int]) -> None:
+    names, weights = zip(*MIX.items())
+    while time.perf_counter() < deadline:
+        name = random.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            response = await _operation(client, name, headers)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            timings[name].append(time.perf_counter() - start)
+        else:
+            errors[name] += 1
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run(url: str, concurrency: int, seconds: float) -> Dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        headers = await _register(client)
+        timings: Dict[str, List[float]] = {name: [] for name in MIX}
+        errors: Dict[str, int] = {name: 0 for name in MIX}
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(*(_worker(client, headers, deadline, timings, errors) for _ in range(concurrency)))
+
+    total = sum(len(values) for values in timings.values())
+    return {
+        "requests": total,
+        "throughput": total / seconds,
+        "operations": {
+            name: {
+                "count": len(values),
+                "errors": errors[name],
+                "p50_ms": 1000 * _percentile(values, 0.5) if values else None,
+                "p95_ms": 1000 * _percentile(values, 0.95) if values else None,
+                "p99_ms": 1000 * _percentile(values, 0.99) if values else None,
+            }
+            for name, values in timings.items()
+        },
+    }
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=20)
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args.url, args.concurrency, args.seconds))
+    print(f"{report['requests']} requests in {args.seconds:g}s, {report['throughput']:.1f} req/s "
+          f"with {args.concurrency} concurrent clients")
+    print(f"{'operation':<16} {'count':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, row in report["operations"].items():
+        cells = [f"{row[key]:9.1f}" if row[key] is not None else f"{'-':>9}" for key in ("p50_ms", "p95_ms", "p99_ms")]
+        print(f"{name:<16} {row['count']:>7} {row['errors']:>7} {' '.join(cells)}")
+    return 0 if report["requests"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
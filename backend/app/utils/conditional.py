@@ -0,0 +1,53 @@
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+from sqlalchemy.engine import Row
+
+
+def cache_headers(tree: Row) -> Dict[str, str]:
+    """Validators for anything derived from a user's tree, given its `tree_state`."""
+    headers = {
+        "ETag": f'"{tree.id}-{tree.tree_version or 0}"',
+        # Cached copies must be revalidated and never shared between users
+        "Cache-Control": "private, no-cache",
+        "Vary": "Authorization",
+    }
+    if tree.tree_modified_at:
+        headers["Last-Modified"] = format_datetime(tree.tree_modified_at.replace(tzinfo=timezone.utc), usegmt=True)
+    return headers
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def _unmodified_since(header: str, tree: Row) -> bool:
+    if not tree.tree_modified_at:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates have whole-second precision
+    return tree.tree_modified_at.replace(microsecond=0, tzinfo=timezone.utc) <= since
+
+
+def not_modified(request: Request, tree: Row) -> Optional[Response]:
+    """
+    A 304 response when the client's copy matches the tree version in `tree`,
+    otherwise None. If-None-Match takes precedence over If-Modified-Since.
+    """
+    headers = cache_headers(tree)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        fresh = _etag_matches(if_none_match, headers["ETag"])
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        fresh = if_modified_since is not None and _unmodified_since(if_modified_since, tree)
+    return Response(status_code=304, headers=headers) if fresh else None
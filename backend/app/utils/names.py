@@ -0,0 +1,536 @@
+"""
+Name normalisation, phonetic codes and string similarity for matching
+people whose names were spelled or transcribed differently.
+"""
+from typing import List, Optional, Tuple
+import re
+import unicodedata
+
+NON_LETTERS = re.compile(r"[^a-z]")
+
+SOUNDEX_CODES = {
+    **dict.fromkeys("bfpv", "1"),
+    **dict.fromkeys("cgjkqsxz", "2"),
+    **dict.fromkeys("dt", "3"),
+    "l": "4",
+    **dict.fromkeys("mn", "5"),
+    "r": "6",
+}
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase ASCII letters only: accents stripped, spaces and punctuation dropped."""
+    if not name:
+        return ""
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    return NON_LETTERS.sub("", ascii_name.lower())
+
+
+def soundex(name: str) -> str:
+    """American Soundex code (e.g. "Robert" -> "R163"); empty for names without letters."""
+    letters = normalize_name(name)
+    if not letters:
+        return ""
+
+    code = letters[0].upper()
+    previous = SOUNDEX_CODES.get(letters[0], "")
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES.get(letter, "")
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # H and W do not separate letters with the same code; vowels do
+        if letter not in "hw":
+            previous = digit
+    return code.ljust(4, "0")
+
+
+def jaro_winkler(a: str, b: str) -> float:
+    """Jaro-Winkler similarity between two normalised strings, from 0.0 to 1.0."""
+    if a == b:
+        return 1.0 if a else 0.0
+    if not a or not b:
+        return 0.0
+
+    window = max(max(len(a), len(b)) // 2 - 1, 0)
+    a_matched = [False] * len(a)
+    b_matched = [False] * len(b)
+    matches = 0
+    for i, char in enumerate(a):
+        for j in range(max(0, i - window), min(len(b), i + window + 1)):
+            if not b_matched[j] and b[j] == char:
+                a_matched[i] = b_matched[j] = True
+                matches += 1
+                break
+    if not matches:
+        return 0.0
+
+    a_chars = [char for char, matched in zip(a, a_matched) if matched]
+    b_chars = [char for char, matched in zip(b, b_matched) if matched]
+    transpositions = sum(x != y for x, y in zip(a_chars, b_chars)) / 2
+
+    jaro = (matches / len(a) + matches / len(b) + (matches - transpositions) / matches) / 3
+
+    prefix = 0
+    for x, y in zip(a[:4], b[:4]):
+        if x != y:
+            break
+        prefix += 1
+    return jaro + prefix * 0.1 * (1 - jaro)
+
+
+def levenshtein(a: str, b: str, limit: Optional[int] = None) -> int:
+    """
+    Edit distance between two strings. With `limit`, stops early and returns
+    limit + 1 once the distance is known to exceed it.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+# Daitch-Mokotoff Soundex
+
+DM_VOWELS = set("aeiou")
+
+# pattern: one or more (at start, before a vowel, elsewhere) codes; None means not coded.
+# Patterns with two code sets are ambiguous and produce both branches.
+DM_RULES = {
+    "schtsch": [("2", "4", "4")], "schtsh": [("2", "4", "4")], "schtch": [("2", "4", "4")],
+    "shtch": [("2", "4", "4")], "shtsh": [("2", "4", "4")], "stsch": [("2", "4", "4")],
+    "ttsch": [("4", "4", "4")], "zhdzh": [("2", "4", "4")],
+    "shch": [("2", "4", "4")], "scht": [("2", "43", "43")], "schd": [("2", "43", "43")],
+    "stch": [("2", "4", "4")], "strz": [("2", "4", "4")], "strs": [("2", "4", "4")],
+    "stsh": [("2", "4", "4")], "szcz": [("2", "4", "4")], "szcs": [("2", "4", "4")],
+    "ttch": [("4", "4", "4")], "tsch": [("4", "4", "4")], "ttsz": [("4", "4", "4")],
+    "zdzh": [("2", "4", "4")], "zsch": [("4", "4", "4")],
+    "chs": [("5", "54", "54")], "csz": [("4", "4", "4")], "czs": [("4", "4", "4")],
+    "drz": [("4", "4", "4")], "drs": [("4", "4", "4")], "dsh": [("4", "4", "4")],
+    "dsz": [("4", "4", "4")], "dzh": [("4", "4", "4")], "dzs": [("4", "4", "4")],
+    "sch": [("4", "4", "4")], "sht": [("2", "43", "43")], "szt": [("2", "43", "43")],
+    "shd": [("2", "43", "43")], "szd": [("2", "43", "43")], "tch": [("4", "4", "4")],
+    "trz": [("4", "4", "4")], "trs": [("4", "4", "4")], "tsh": [("4", "4", "4")],
+    "tts": [("4", "4", "4")], "ttz": [("4", "4", "4")], "tzs": [("4", "4", "4")],
+    "tsz": [("4", "4", "4")], "zdz": [("2", "4", "4")], "zhd": [("2", "43", "43")],
+    "zsh": [("4", "4", "4")],
+    "ai": [("0", "1", None)], "aj": [("0", "1", None)], "ay": [("0", "1", None)],
+    "au": [("0", "7", None)], "ch": [("5", "5", "5"), ("4", "4", "4")],
+    "ck": [("5", "5", "5"), ("45", "45", "45")], "cz": [("4", "4", "4")], "cs": [("4", "4", "4")],
+    "ds": [("4", "4", "4")], "dz": [("4", "4", "4")], "dt": [("3", "3", "3")],
+    "ei": [("0", "1", None)], "ej": [("0", "1", None)], "ey": [("0", "1", None)],
+    "eu": [("1", "1", None)], "fb": [("7", "7", "7")],
+    "ia": [("1", None, None)], "ie": [("1", None, None)], "io": [("1", None, None)], "iu": [("1", None, None)],
+    "ks": [("5", "54", "54")], "kh": [("5", "5", "5")], "mn": [("66", "66", "66")], "nm": [("66", "66", "66")],
+    "oi": [("0", "1", None)], "oj": [("0", "1", None)], "oy": [("0", "1", None)],
+    "pf": [("7", "7", "7")], "ph": [("7", "7", "7")],
+    "rz": [("94", "94", "94"), ("4", "4", "4")], "rs": [("94", "94", "94"), ("4", "4", "4")],
+    "sh": [("4", "4", "4")], "sc": [("2", "4", "4")], "st": [("2", "43", "43")],
+    "sz": [("4", "4", "4")], "sd": [("2", "43", "43")], "th": [("3", "3", "3")],
+    "ts": [("4", "4", "4")], "tc": [("4", "4", "4")], "tz": [("4", "4", "4")],
+    "ui": [("0", "1", None)], "uj": [("0", "1", None)], "uy": [("0", "1", None)],
+    "ue": [("0", None, None)], "zd": [("2", "43", "43")], "zh": [("4", "4", "4")], "zs": [("4", "4", "4")],
+    "a": [("0", None, None)], "b": [("7", "7", "7")], "c": [("5", "5", "5"), ("4", "4", "4")],
+    "d": [("3", "3", "3")], "e": [("0", None, None)], "f": [("7", "7", "7")], "g": [("5", "5", "5")],
+    "h": [("5", "5", None)], "i": [("0", None, None)], "j": [("1", "1", "1"), ("4", "4", "4")],
+    "k": [("5", "5", "5")], "l": [("8", "8", "8")], "m": [("6", "6", "6")], "n": [("6", "6", "6")],
+    "o": [("0", None, None)], "p": [("7", "7", "7")], "q": [("5", "5", "5")], "r": [("9", "9", "9")],
+    "s": [("4", "4", "4")], "t": [("3", "3", "3")], "u": [("0", None, None)], "v": [("7", "7", "7")],
+    "w": [("7", "7", "7")], "x": [("5", "54", "54")], "y": [("1", None, None)], "z": [("4", "4", "4")],
+}
+DM_LONGEST = max(len(pattern) for pattern in DM_RULES)
+DM_LENGTH = 6
+
+
+def daitch_mokotoff(name: str) -> List[str]:
+    """
+    Daitch-Mokotoff Soundex codes for a name. Ambiguous letters (e.g. "ch",
+    "rz") give more than one code, so the result is a sorted list.
+    """
+    letters = normalize_name(name)
+    if not letters:
+        return []
+
+    # Each branch is (code so far, last code emitted)
+    branches = [("", None)]
+    i = 0
+    while i < len(letters):
+        for size in range(min(DM_LONGEST, len(letters) - i), 0, -1):
+            options = DM_RULES.get(letters[i:i + size])
+            if options:
+                break
+        following = letters[i + size:i + size + 1]
+        position = 0 if i == 0 else 1 if following in DM_VOWELS and following else 2
+
+        next_branches = []
+        for code, last in branches:
+            for option in options:
+                digits = option[position] or ""
+                # Repeated codes collapse, except M/N pairs which are coded as 66
+                if digits and (digits != last or digits == "66"):
+                    next_branches.append((code + digits, digits))
+                else:
+                    next_branches.append((code, digits))
+        branches = list(dict.fromkeys(next_branches))
+        i += size
+
+    return sorted({(code + "0" * DM_LENGTH)[:DM_LENGTH] for code, _ in branches})
+
+
+# Double Metaphone (Lawrence Philips), returning (primary, alternate) keys
+
+SLAVO_GERMANIC = ("W", "K", "CZ", "WITZ")
+METAPHONE_VOWELS = set("AEIOUY")
+METAPHONE_LENGTH = 4
+
+
+def double_metaphone(name: str) -> Tuple[str, str]:
+    """Primary and alternate Double Metaphone keys, e.g. "Schmidt" -> ("XMT", "SMT")."""
+    word = normalize_name((name or "").replace("ç", "s").replace("Ç", "S").replace("ñ", "n").replace("Ñ", "N")).upper()
+    if not word:
+        return "", ""
+
+    length = len(word)
+    last = length - 1
+    padded = word + "     "
+    slavo_germanic = any(marker in word for marker in SLAVO_GERMANIC)
+    primary: List[str] = []
+    alternate: List[str] = []
+
+    def at(start: int, *patterns: str) -> bool:
+        return start >= 0 and any(padded[start:start + len(p)] == p for p in patterns)
+
+    def vowel(index: int) -> bool:
+        return 0 <= index < length and word[index] in METAPHONE_VOWELS
+
+    def add(main: str, alt: Optional[str] = None) -> None:
+        primary.append(main)
+        alternate.append(main if alt is None else alt)
+
+    i = 0
+    if at(0, "GN", "KN", "PN", "WR", "PS"):
+        i = 1
+    if word[0] == "X":
+        add("S")
+        i = 1
+
+    while i < length and (len("".join(primary)) < METAPHONE_LENGTH or len("".join(alternate)) < METAPHONE_LENGTH):
+        char = word[i]
+        next_char = padded[i + 1]
+
+        if char in METAPHONE_VOWELS:
+            if i == 0:
+                add("A")
+            i += 1
+
+        elif char == "B":
+            add("P")
+            i += 2 if next_char == "B" else 1
+
+        elif char == "C":
+            if (i > 1 and not vowel(i - 2) and at(i - 1, "ACH") and padded[i + 2] != "I"
+                    and (padded[i + 2] != "E" or at(i - 2, "BACHER", "MACHER"))):
+                add("K")
+                i += 2
+            elif i == 0 and at(i, "CAESAR"):
+                add("S")
+                i += 2
+            elif at(i, "CHIA"):
+                add("K")
+                i += 2
+            elif at(i, "CH"):
+                if i > 0 and at(i, "CHAE"):
+                    add("K", "X")
+                elif (i == 0 and (at(i + 1, "HARAC", "HARIS") or at(i + 1, "HOR", "HYM", "HIA", "HEM"))
+                        and not at(0, "CHORE")):
+                    add("K")
+                elif (at(0, "VAN ", "VON ", "SCH") or at(i - 2, "ORCHES", "ARCHIT", "ORCHID")
+                        or at(i + 2, "T", "S")
+                        or ((at(i - 1, "A", "O", "U", "E") or i == 0)
+                            and at(i + 2, "L", "R", "N", "M", "B", "H", "F", "V", "W", " "))):
+                    add("K")
+                elif i > 0:
+                    if at(0, "MC"):
+                        add("K")
+                    else:
+                        add("X", "K")
+                else:
+                    add("X")
+                i += 2
+            elif at(i, "CZ") and not at(i - 2, "WICZ"):
+                add("S", "X")
+                i += 2
+            elif at(i + 1, "CIA"):
+                add("X")
+                i += 3
+            elif at(i, "CC") and not (i == 1 and word[0] == "M"):
+                if at(i + 2, "I", "E", "H") and not at(i + 2, "HU"):
+                    if (i == 1 and word[0] == "A") or at(i - 1, "UCCEE", "UCCES"):
+                        add("KS")
+                    else:
+                        add("X")
+                    i += 3
+                else:
+                    add("K")
+                    i += 2
+            elif at(i, "CK", "CG", "CQ"):
+                add("K")
+                i += 2
+            elif at(i, "CI", "CE", "CY"):
+                if at(i, "CIO", "CIE", "CIA"):
+                    add("S", "X")
+                else:
+                    add("S")
+                i += 2
+            else:
+                add("K")
+                if at(i + 1, "C", "K", "Q") and not at(i + 1, "CE", "CI"):
+                    i += 2
+                else:
+                    i += 1
+
+        elif char == "D":
+            if at(i, "DG"):
+                if at(i + 2, "I", "E", "Y"):
+                    add("J")
+                    i += 3
+                else:
+                    add("TK")
+                    i += 2
+            else:
+                add("T")
+                i += 2 if at(i, "DT", "DD") else 1
+
+        elif char == "F":
+            add("F")
+            i += 2 if next_char == "F" else 1
+
+        elif char == "G":
+            if next_char == "H":
+                if i > 0 and not vowel(i - 1):
+                    add("K")
+                elif i == 0:
+                    if padded[i + 2] == "I":
+                        add("J")
+                    else:
+                        add("K")
+                elif ((i > 1 and at(i - 2, "B", "H", "D")) or (i > 2 and at(i - 3, "B", "H", "D"))
+                        or (i > 3 and at(i - 4, "B", "H"))):
+                    pass
+                elif i > 2 and word[i - 1] == "U" and at(i - 3, "C", "G", "L", "R", "T"):
+                    add("F")
+                elif word[i - 1] != "I":
+                    add("K")
+                i += 2
+            elif next_char == "N":
+                if i == 1 and vowel(0) and not slavo_germanic:
+                    add("KN", "N")
+                elif not at(i + 2, "EY") and not slavo_germanic:
+                    add("N", "KN")
+                else:
+                    add("KN")
+                i += 2
+            elif at(i + 1, "LI") and not slavo_germanic:
+                add("KL", "L")
+                i += 2
+            elif i == 0 and (next_char == "Y" or at(i + 1, "ES", "EP", "EB", "EL", "EY", "IB", "IL", "IN", "IE", "EI", "ER")):
+                add("K", "J")
+                i += 2
+            elif ((at(i + 1, "ER") or next_char == "Y") and not at(0, "DANGER", "RANGER", "MANGER")
+                    and not at(i - 1, "E", "I") and not at(i - 1, "RGY", "OGY")):
+                add("K", "J")
+                i += 2
+            elif at(i + 1, "E", "I", "Y") or at(i - 1, "AGGI", "OGGI"):
+                if at(0, "VAN ", "VON ", "SCH") or at(i + 1, "ET"):
+                    add("K")
+                elif at(i + 1, "IER "):
+                    add("J")
+                else:
+                    add("J", "K")
+                i += 2
+            else:
+                add("K")
+                i += 2 if next_char == "G" else 1
+
+        elif char == "H":
+            if (i == 0 or vowel(i - 1)) and vowel(i + 1):
+                add("H")
+                i += 2
+            else:
+                i += 1
+
+        elif char == "J":
+            if at(i, "JOSE"):
+                if i == 0 and padded[i + 4] == " ":
+                    add("H")
+                else:
+                    add("J", "H")
+            elif i == 0:
+                add("J", "A")
+            elif vowel(i - 1) and not slavo_germanic and next_char in "AO":
+                add("J", "H")
+            elif i == last:
+                add("J", "")
+            elif not at(i + 1, "L", "T", "K", "S", "N", "M", "B", "Z") and not at(i - 1, "S", "K", "L"):
+                add("J")
+            i += 2 if next_char == "J" else 1
+
+        elif char == "K":
+            add("K")
+            i += 2 if next_char == "K" else 1
+
+        elif char == "L":
+            if next_char == "L":
+                if ((i == length - 3 and at(i - 1, "ILLO", "ILLA", "ALLE"))
+                        or ((at(last - 1, "AS", "OS") or at(last, "A", "O")) and at(i - 1, "ALLE"))):
+                    add("L", "")
+                else:
+                    add("L")
+                i += 2
+            else:
+                add("L")
+                i += 1
+
+        elif char == "M":
+            add("M")
+            i += 2 if (at(i - 1, "UMB") and (i + 1 == last or at(i + 2, "ER"))) or next_char == "M" else 1
+
+        elif char == "N":
+            add("N")
+            i += 2 if next_char == "N" else 1
+
+        elif char == "P":
+            if next_char == "H":
+                add("F")
+                i += 2
+            else:
+                add("P")
+                i += 2 if at(i + 1, "P", "B") else 1
+
+        elif char == "Q":
+            add("K")
+            i += 2 if next_char == "Q" else 1
+
+        elif char == "R":
+            if i == last and not slavo_germanic and at(i - 2, "IE") and not at(i - 4, "ME", "MA"):
+                add("", "R")
+            else:
+                add("R")
+            i += 2 if next_char == "R" else 1
+
+        elif char == "S":
+            if at(i - 1, "ISL", "YSL"):
+                i += 1
+            elif i == 0 and at(i, "SUGAR"):
+                add("X", "S")
+                i += 1
+            elif at(i, "SH"):
+                if at(i + 1, "HEIM", "HOEK", "HOLM", "HOLZ"):
+                    add("S")
+                else:
+                    add("X")
+                i += 2
+            elif at(i, "SIO", "SIA"):
+                if slavo_germanic:
+                    add("S")
+                else:
+                    add("S", "X")
+                i += 3
+            elif (i == 0 and at(i + 1, "M", "N", "L", "W")) or at(i + 1, "Z"):
+                add("S", "X")
+                i += 2 if at(i + 1, "Z") else 1
+            elif at(i, "SC"):
+                if padded[i + 2] == "H":
+                    if at(i + 3, "OO", "ER", "EN", "UY", "ED", "EM"):
+                        if at(i + 3, "ER", "EN"):
+                            add("X", "SK")
+                        else:
+                            add("SK")
+                    elif i == 0 and not vowel(3) and padded[3] != "W":
+                        add("X", "S")
+                    else:
+                        add("X")
+                elif at(i + 2, "I", "E", "Y"):
+                    add("S")
+                else:
+                    add("SK")
+                i += 3
+            else:
+                if i == last and at(i - 2, "AI", "OI"):
+                    add("", "S")
+                else:
+                    add("S")
+                i += 2 if at(i + 1, "S", "Z") else 1
+
+        elif char == "T":
+            if at(i, "TION", "TIA", "TCH"):
+                add("X")
+                i += 3
+            elif at(i, "TH", "TTH"):
+                if at(i + 2, "OM", "AM") or at(0, "VAN ", "VON ", "SCH"):
+                    add("T")
+                else:
+                    add("0", "T")
+                i += 2
+            else:
+                add("T")
+                i += 2 if at(i + 1, "T", "D") else 1
+
+        elif char == "V":
+            add("F")
+            i += 2 if next_char == "V" else 1
+
+        elif char == "W":
+            if at(i, "WR"):
+                add("R")
+                i += 2
+                continue
+            if i == 0 and (vowel(i + 1) or at(i, "WH")):
+                if vowel(i + 1):
+                    add("A", "F")
+                else:
+                    add("A")
+            if (i == last and vowel(i - 1)) or at(i - 1, "EWSKI", "EWSKY", "OWSKI", "OWSKY") or at(0, "SCH"):
+                add("", "F")
+                i += 1
+            elif at(i, "WICZ", "WITZ"):
+                add("TS", "FX")
+                i += 4
+            else:
+                i += 1
+
+        elif char == "X":
+            if not (i == last and (at(i - 3, "IAU", "EAU") or at(i - 2, "AU", "OU"))):
+                add("KS")
+            i += 2 if at(i + 1, "C", "X") else 1
+
+        elif char == "Z":
+            if next_char == "H":
+                add("J")
+                i += 2
+            else:
+                if at(i + 1, "ZO", "ZI", "ZA") or (slavo_germanic and i > 0 and word[i - 1] != "T"):
+                    add("S", "TS")
+                else:
+                    add("S")
+                i += 2 if next_char == "Z" else 1
+
+        else:
+            i += 1
+
+    return "".join(primary)[:METAPHONE_LENGTH], "".join(alternate)[:METAPHONE_LENGTH]
@@ -0,0 +1,113 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import base64
+import json
+
+from fastapi import HTTPException, Response
+from sqlalchemy import Select, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Query
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+
+# Largest `limit` a keyset-paged list endpoint accepts
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(values: Dict[str, Any]) -> str:
+    """Pack keyset values into an opaque URL-safe token."""
+    raw = json.dumps(
+        {key: value.isoformat() if isinstance(value, datetime) else value for key, value in values.items()},
+        separators=(",", ":")
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, columns: Sequence) -> Tuple:
+    """Unpack a cursor token into values for `columns`, in order."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        decoded = []
+        for column in columns:
+            value = values[column.key]
+            if column.type.python_type is datetime:
+                value = datetime.fromisoformat(value)
+            decoded.append(value)
+        return tuple(decoded)
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_window(query, columns: Sequence, cursor: Optional[str], limit: int, descending: bool = False, skip: int = 0):
+    """Apply the cursor bound, ordering and limit (one extra row, to detect a next page) to a Query or Select."""
+    if cursor:
+        after = decode_cursor(cursor, columns)
+        key = tuple_(*columns) if len(columns) > 1 else columns[0]
+        bound = tuple_(*after) if len(columns) > 1 else after[0]
+        query = query.filter(key < bound if descending else key > bound)
+
+    order = [column.desc() if descending else column.asc() for column in columns]
+    query = query.order_by(*order)
+    if skip and not cursor:
+        query = query.offset(skip)
+    return query.limit(limit + 1)
+
+
+def _split_page(rows: List, columns: Sequence, limit: int) -> Tuple[List, Optional[str]]:
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor({column.key: getattr(last, column.key) for column in columns})
+
+
+def keyset_page(
+    query: Query,
+    columns: Sequence,
+    cursor: Optional[str],
+    limit: int,
+    descending: bool = False,
+    skip: int = 0
+) -> Tuple[List, Optional[str]]:
+    """
+    Fetch one page ordered by `columns` (which must end in a unique column),
+    starting after `cursor`. Returns the rows and the cursor for the next page,
+    or None on the last page. `skip` is kept for offset-style callers and is
+    ignored once a cursor is given.
+    """
+    rows = keyset_window(query, columns, cursor, limit, descending, skip).all()
+    return _split_page(rows, columns, limit)
+
+
+async def keyset_page_async(
+    db: AsyncSession,
+    stmt: Select,
+    columns: Sequence,
+    cursor: Optional[str],
+    limit: int,
+    descending: bool = False,
+    skip: int = 0
+) -> Tuple[List, Optional[str]]:
+    """keyset_page for a select() of ORM entities run on an AsyncSession."""
+    rows = list((await db.scalars(keyset_window(stmt, columns, cursor, limit, descending, skip))).all())
+    return _split_page(rows, columns, limit)
+
+
+def count_rows(query: Query) -> int:
+    """Total row count for a filtered query, without its ordering or limits."""
+    return query.order_by(None).with_entities(func.count()).scalar()
+
+
+async def count_rows_async(db: AsyncSession, stmt: Select) -> int:
+    """count_rows for a select() run on an AsyncSession."""
+    return await db.scalar(select(func.count()).select_from(stmt.order_by(None).subquery()))
+
+
+def set_page_headers(response: Response, next_cursor: Optional[str], total: Optional[int] = None) -> None:
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    if total is not None:
+        response.headers[TOTAL_COUNT_HEADER] = str(total)
@@ -0,0 +1,159 @@
+"""
+Query-plan regression check for the queries behind the API routes.
+
+Runs EXPLAIN on each statement and reports any full table scan, so a
+dropped or unusable index shows up before it reaches production:
+
+    python -m app.utils.query_plans
+
+Works against SQLite (EXPLAIN QUERY PLAN) and PostgreSQL (EXPLAIN with
+sequential scans disabled, so any remaining Seq Scan has no index path).
+Exits non-zero when a scan is found.
+"""
+from datetime import datetime
+from typing import Dict, List
+import re
+import sys
+
+from sqlalchemy import Table, func, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.sql import Executable
+from sqlalchemy.sql.selectable import Alias
+from sqlalchemy.sql.visitors import iterate
+
+from ..models import Base, Document, FamilyMember, PossibleDuplicate, SearchHistory, User
+from ..services import lineage
+from ..services.duplicates import forget_members_statement
+from ..services.families import children_statement, marriages_statement
+from ..services.gedcom import _families_subquery
+from ..services.member_batch import references_statements
+from ..services.name_index import candidates_statement, drop_members_statement
+from ..services.pedigree_graph import graph_statements
+from ..services.tree import node_fields_statement, tree_columns_statement
+from ..services.tree_stats import buckets_statement, stat_rows_statement
+from ..services.tree_version import (
+    all_rows_statement,
+    changed_rows_statement,
+    tombstones_statement,
+    tree_state_statement,
+)
+from .pagination import encode_cursor, keyset_window
+
+SQLITE_SCAN = re.compile(r"\bSCAN (\w+)")
+POSTGRES_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+def route_queries(user_id: int = 1, member_id: int = 1) -> Dict[str, Executable]:
+    """
+    The statements each route issues, keyed by a readable name. They come
+    from the same builders the services call; only the list endpoints' base
+    filters are restated here, with their ordering, cursor bound and limit
+    applied by the routes' own keyset_window.
+    """
+    ids = [member_id, 2]
+    graph_rows, graph_couples = graph_statements(user_id)
+    references = references_statements(user_id, ids)
+    member_cursor = encode_cursor({"id": 500})
+    history_cursor = encode_cursor({"created_at": datetime(2000, 1, 1), "id": 500})
+
+    members = select(FamilyMember).where(FamilyMember.user_id == user_id)
+    documents = select(Document).where(Document.user_id == user_id)
+    history = select(SearchHistory).where(SearchHistory.user_id == user_id)
+    duplicates = select(PossibleDuplicate).where(
+        PossibleDuplicate.user_id == user_id, PossibleDuplicate.status == "pending"
+    )
+    history_key = [SearchHistory.created_at, SearchHistory.id]
+    duplicates_key = [PossibleDuplicate.score, PossibleDuplicate.id]
+
+    return {
+        "auth.user_by_username": select(User).where(User.username == "someone"),
+        "auth.user_by_email": select(User.id).where(User.email == "someone@example.com"),
+        "tree_version.state": tree_state_statement(user_id),
+        "family_members.list": keyset_window(members, [FamilyMember.id], None, 100),
+        "family_members.list_after_cursor": keyset_window(members, [FamilyMember.id], member_cursor, 100),
+        "family_members.get": select(FamilyMember)
+            .where(FamilyMember.id == member_id, FamilyMember.user_id == user_id),
+        "family_members.ancestors": lineage.ancestors_statement(user_id, member_id, 5),
+        "family_members.descendants": lineage.descendants_statement(user_id, member_id, 5),
+        "family_members.tree": tree_columns_statement(user_id),
+        "family_members.layout_nodes": node_fields_statement(user_id, ids),
+        "family_members.graph_load": graph_rows,
+        "family_members.graph_couples": graph_couples,
+        "family_members.lookup": candidates_statement(user_id, "surname", "Smith"),
+        "family_members.name_codes_delete": drop_members_statement(user_id, ids),
+        "family_members.detach_children": references["children"],
+        "family_members.detach_documents": references["documents"],
+        "family_members.detach_marriages": references["marriages"],
+        "documents.list": keyset_window(documents, [Document.id], None, 100),
+        "documents.list_for_member": keyset_window(
+            documents.where(Document.family_member_id == member_id), [Document.id], None, 100
+        ),
+        "search.history": keyset_window(history, history_key, None, 50, descending=True),
+        "search.history_after_cursor": keyset_window(history, history_key, history_cursor, 50, descending=True),
+        "duplicates.list": keyset_window(duplicates, duplicates_key, None, 50, descending=True),
+        "duplicates.forget": forget_members_statement(user_id, ids),
+        "stats.buckets": buckets_statement(user_id, "surname", 10),
+        "stats.rebuild": stat_rows_statement(user_id),
+        "sync.members": changed_rows_statement(user_id, "member", 10),
+        "sync.tombstones": tombstones_statement(user_id, 10),
+        "sync.full_marriages": all_rows_statement(user_id, "marriage"),
+        "families.marriages": marriages_statement(ids),
+        "families.children": children_statement(user_id, ids),
+        "gedcom.families": select(func.count()).select_from(_families_subquery(user_id)),
+    }
+
+
+def _table_names(stmt: Executable) -> List[str]:
+    """Names under which real tables (not CTEs or subqueries) appear in a plan."""
+    names = set(Base.metadata.tables)
+    for element in iterate(stmt):
+        if isinstance(element, Alias) and isinstance(element.element, Table):
+            names.add(element.name)
+    return sorted(names)
+
+
+def explain(connection: Connection, stmt: Executable) -> List[str]:
+    sql = str(stmt.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+    if connection.dialect.name == "sqlite":
+        return [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+    connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    return [row[0] for row in connection.exec_driver_sql(f"EXPLAIN {sql}")]
+
+
+def full_scans(connection: Connection, stmt: Executable) -> List[str]:
+    """Plan lines that read every row of a real table."""
+    pattern = SQLITE_SCAN if connection.dialect.name == "sqlite" else POSTGRES_SCAN
+    tables = _table_names(stmt)
+    return [
+        line for line in explain(connection, stmt)
+        if any(match.group(1) in tables for match in pattern.finditer(line))
+    ]
+
+
+def check_query_plans(engine: Engine) -> Dict[str, List[str]]:
+    """Map each route query that still does a full scan to its offending plan lines."""
+    failures = {}
+    with engine.connect() as connection:
+        for name, stmt in route_queries().items():
+            with connection.begin():
+                scans = full_scans(connection, stmt)
+            if scans:
+                failures[name] = scans
+    return failures
+
+
+def main() -> int:
+    from ..database import engine, init_db
+
+    init_db()
+    failures = check_query_plans(engine)
+    for name, scans in failures.items():
+        print(f"FULL SCAN in {name}:")
+        for line in scans:
+            print(f"    {line}")
+    print(f"{len(route_queries())} queries checked, {len(failures)} with full scans")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
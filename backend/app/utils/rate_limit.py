@@ -0,0 +1,355 @@
+"""
+Throttling for expensive endpoints.
+
+Each named limit in RATE_LIMITS combines two checks:
+
+- A token bucket per user. It holds up to `burst` requests and refills at
+  `per_minute`. A user with an empty bucket gets 429 with Retry-After set to
+  the time until the next token.
+- A cap on requests in progress on the route, across all users. When
+  `concurrency` requests are already running, the next one gets 503 with
+  Retry-After. It is not queued.
+
+Every value can be overridden per limit, e.g. RATE_LIMIT_GENEALOGY_SEARCH_PER_MINUTE,
+RATE_LIMIT_GENEALOGY_SEARCH_BURST and RATE_LIMIT_GENEALOGY_SEARCH_CONCURRENCY.
+A value of 0 turns that check off.
+
+Buckets and slots live in a store. The default `MemoryStore` is private to
+the process, so each worker enforces the limits on its own. With
+RATE_LIMIT_STORE=sqlite, all workers on the host share one SQLite file at
+RATE_LIMIT_STORE_PATH. That file is separate from the application database.
+"""
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from fastapi import Depends, HTTPException, Response, status
+from fastapi.concurrency import run_in_threadpool
+
+from .auth import get_current_user_async
+from .token_cache import Principal
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")
+RATE_LIMIT_STORE_PATH = os.getenv("RATE_LIMIT_STORE_PATH", "./rate_limits.db")
+# Seconds a rejected client is told to wait when a route is at its concurrency cap
+RATE_LIMIT_BUSY_RETRY_AFTER = int(os.getenv("RATE_LIMIT_BUSY_RETRY_AFTER", "1"))
+# Seconds after which the shared store reclaims a slot its worker never released
+RATE_LIMIT_SLOT_LEASE = float(os.getenv("RATE_LIMIT_SLOT_LEASE", "600"))
+# Idle buckets kept in memory before full ones are swept
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000"))
+
+LIMIT_HEADER = "X-RateLimit-Limit"
+REMAINING_HEADER = "X-RateLimit-Remaining"
+
+
+class Limit(NamedTuple):
+    per_minute: float
+    burst: int
+    concurrency: int
+
+
+def _limit(name: str, per_minute: float, burst: int, concurrency: int) -> Limit:
+    prefix = f"RATE_LIMIT_{name.upper()}"
+    return Limit(
+        float(os.getenv(f"{prefix}_PER_MINUTE", str(per_minute))),
+        int(os.getenv(f"{prefix}_BURST", str(burst))),
+        int(os.getenv(f"{prefix}_CONCURRENCY", str(concurrency))),
+    )
+
+
+RATE_LIMITS: Dict[str, Limit] = {
+    # Up to four external sources per request
+    "genealogy_search": _limit("genealogy_search", 20, 10, 16),
+    # Up to three LLM calls on top, charged in addition to genealogy_search
+    "ai_search": _limit("ai_search", 6, 3, 4),
+    "gedcom_import": _limit("gedcom_import", 2, 2, 2),
+    "duplicate_scan": _limit("duplicate_scan", 6, 3, 4),
+}
+
+
+class MemoryStore:
+    """Buckets and slot counts in this process."""
+
+    blocking = False
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.lock = threading.Lock()
+        # key -> (tokens, updated, time the bucket is full again)
+        self.buckets: Dict[str, Tuple[float, float, float]] = {}
+        self.slots: Dict[str, int] = {}
+        self.max_keys = max_keys
+        self.sweep_at = max_keys
+
+    def _sweep(self, now: float) -> None:
+        # A bucket that has refilled is the same as no bucket
+        for key in [key for key, (_, _, full) in self.buckets.items() if full <= now]:
+            del self.buckets[key]
+        self.sweep_at = max(self.max_keys, 2 * len(self.buckets))
+
+    def take(self, key: str, limit: Limit) -> Tuple[bool, float, float]:
+        """Spend one token: (allowed, tokens left, seconds until the next token)."""
+        rate = limit.per_minute / 60
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated, _ = self.buckets.get(key, (limit.burst, now, now))
+            tokens = min(limit.burst, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now, now + (limit.burst - tokens) / rate)
+            if len(self.buckets) > self.sweep_at:
+                self._sweep(now)
+        return allowed, tokens, 0.0 if allowed else (1 - tokens) / rate
+
+    def refund(self, key: str, limit: Limit) -> None:
+        """Give back a token spent by `take`."""
+        rate = limit.per_minute / 60
+        now = time.monotonic()
+        with self.lock:
+            if key not in self.buckets:
+                return
+            tokens, updated, _ = self.buckets[key]
+            tokens = min(limit.burst, tokens + (now - updated) * rate + 1)
+            self.buckets[key] = (tokens, now, now + (limit.burst - tokens) / rate)
+
+    def acquire(self, key: str, limit: Limit) -> Optional[str]:
+        """Claim a slot; returns a handle for `release`, or None when all are taken."""
+        with self.lock:
+            if self.slots.get(key, 0) >= limit.concurrency:
+                return None
+            self.slots[key] = self.slots.get(key, 0) + 1
+        return key
+
+    def release(self, key: str, handle: str) -> None:
+        with self.lock:
+            self.slots[key] -= 1
+
+    def in_flight(self, key: str) -> int:
+        with self.lock:
+            return self.slots.get(key, 0)
+
+
+class SQLiteStore:
+    """Buckets and slots in a SQLite file shared by the workers on one host."""
+
+    blocking = True
+
+    def __init__(self, path: str = RATE_LIMIT_STORE_PATH, lease: float = RATE_LIMIT_SLOT_LEASE):
+        self.path = path
+        self.lease = lease
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=OFF")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets "
+            "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS rate_slots (handle TEXT PRIMARY KEY, key TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS ix_rate_slots_key ON rate_slots (key, expires)")
+        self.takes = 0
+
+    def _transaction(self, work: Callable[[sqlite3.Connection, float], object]):
+        # Wall-clock time, so every process reads the same clock
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self.connection, time.time())
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+            return result
+
+    def take(self, key: str, limit: Limit) -> Tuple[bool, float, float]:
+        rate = limit.per_minute / 60
+
+        def work(connection: sqlite3.Connection, now: float):
+            row = connection.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (limit.burst, now)
+            tokens = min(limit.burst, tokens + max(0.0, now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            connection.execute(
+                "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                (key, tokens, now, now + (limit.burst - tokens) / rate)
+            )
+            self.takes += 1
+            if self.takes % 1000 == 0:
+                connection.execute("DELETE FROM rate_buckets WHERE full_at <= ?", (now,))
+            return allowed, tokens, 0.0 if allowed else (1 - tokens) / rate
+
+        return self._transaction(work)
+
+    def refund(self, key: str, limit: Limit) -> None:
+        rate = limit.per_minute / 60
+
+        def work(connection: sqlite3.Connection, now: float):
+            row = connection.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return
+            tokens = min(limit.burst, row[0] + max(0.0, now - row[1]) * rate + 1)
+            connection.execute(
+                "UPDATE rate_buckets SET tokens = ?, updated = ?, full_at = ? WHERE key = ?",
+                (tokens, now, now + (limit.burst - tokens) / rate, key)
+            )
+
+        self._transaction(work)
+
+    def acquire(self, key: str, limit: Limit) -> Optional[str]:
+        def work(connection: sqlite3.Connection, now: float):
+            connection.execute("DELETE FROM rate_slots WHERE key = ? AND expires <= ?", (key, now))
+            (taken,) = connection.execute("SELECT COUNT(*) FROM rate_slots WHERE key = ?", (key,)).fetchone()
+            if taken >= limit.concurrency:
+                return None
+            handle = uuid.uuid4().hex
+            connection.execute(
+                "INSERT INTO rate_slots (handle, key, expires) VALUES (?, ?, ?)", (handle, key, now + self.lease)
+            )
+            return handle
+
+        return self._transaction(work)
+
+    def release(self, key: str, handle: str) -> None:
+        with self.lock:
+            self.connection.execute("DELETE FROM rate_slots WHERE handle = ?", (handle,))
+
+    def in_flight(self, key: str) -> int:
+        with self.lock:
+            (taken,) = self.connection.execute(
+                "SELECT COUNT(*) FROM rate_slots WHERE key = ? AND expires > ?", (key, time.time())
+            ).fetchone()
+        return taken
+
+
+def create_store(kind: str = RATE_LIMIT_STORE):
+    if kind == "memory":
+        return MemoryStore()
+    if kind == "sqlite":
+        return SQLiteStore()
+    raise ValueError(f"Unknown RATE_LIMIT_STORE: {kind}")
+
+
+class RateLimiter:
+    """Applies RATE_LIMITS through a store and counts the outcomes."""
+
+    def __init__(self, store, limits: Dict[str, Limit] = RATE_LIMITS, enabled: bool = RATE_LIMIT_ENABLED):
+        self.store = store
+        self.limits = limits
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counts = {name: {"allowed": 0, "throttled": 0, "busy": 0} for name in limits}
+
+    async def _call(self, method: Callable, *args):
+        if self.store.blocking:
+            return await run_in_threadpool(method, *args)
+        return method(*args)
+
+    def _count(self, name: str, outcome: str) -> None:
+        with self.lock:
+            self.counts[name][outcome] += 1
+
+    async def acquire(self, name: str, user_id: int, response: Optional[Response] = None) -> Optional[str]:
+        """
+        Admit one request, or raise HTTPException 503 (route busy) or 429
+        (user out of tokens). Pass the returned handle to `release` once the
+        request is done.
+        """
+        limit = self.limits[name]
+        if not self.enabled:
+            return None
+        handle = None
+        if limit.concurrency > 0:
+            handle = await self._call(self.store.acquire, f"{name}:slots", limit)
+            if handle is None:
+                self._count(name, "busy")
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="This service is busy, please retry shortly",
+                    headers={"Retry-After": str(RATE_LIMIT_BUSY_RETRY_AFTER)},
+                )
+        if limit.per_minute > 0:
+            try:
+                allowed, tokens, wait = await self._call(self.store.take, f"{name}:{user_id}", limit)
+            except BaseException:
+                await self.release(name, handle)
+                raise
+            if not allowed:
+                await self.release(name, handle)
+                self._count(name, "throttled")
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Rate limit exceeded, please slow down",
+                    headers={
+                        "Retry-After": str(max(1, math.ceil(wait))),
+                        LIMIT_HEADER: str(limit.burst),
+                        REMAINING_HEADER: "0",
+                    },
+                )
+            if response is not None:
+                response.headers[LIMIT_HEADER] = str(limit.burst)
+                response.headers[REMAINING_HEADER] = str(int(tokens))
+        self._count(name, "allowed")
+        return handle
+
+    async def release(self, name: str, handle: Optional[str]) -> None:
+        if handle is not None:
+            await self._call(self.store.release, f"{name}:slots", handle)
+
+    async def refund(self, name: str, user_id: int) -> None:
+        """Return the token an admitted request spent, when it was turned away later on."""
+        limit = self.limits[name]
+        if self.enabled and limit.per_minute > 0:
+            await self._call(self.store.refund, f"{name}:{user_id}", limit)
+
+    @asynccontextmanager
+    async def hold(self, name: str, user_id: int, response: Optional[Response] = None):
+        handle = await self.acquire(name, user_id, response)
+        try:
+            yield
+        finally:
+            await self.release(name, handle)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            counts = {name: dict(outcomes) for name, outcomes in self.counts.items()}
+        return {
+            "enabled": self.enabled,
+            "store": type(self.store).__name__,
+            "limits": {
+                name: {
+                    **limit._asdict(),
+                    **counts[name],
+                    "in_flight": self.store.in_flight(f"{name}:slots"),
+                }
+                for name, limit in self.limits.items()
+            },
+        }
+
+
+rate_limiter = RateLimiter(create_store())
+
+
+def rate_limit(name: str, user_dependency: Callable = get_current_user_async):
+    """
+    Route dependency applying the named limit to the current user. Pass the
+    same user dependency the route uses, so the token is resolved once.
+    """
+    if name not in RATE_LIMITS:
+        raise ValueError(f"Unknown rate limit: {name}")
+
+    async def dependency(response: Response, current_user: Principal = Depends(user_dependency)):
+        # The slot is held until the response, streamed or not, has been sent
+        async with rate_limiter.hold(name, current_user.id, response):
+            yield
+
+    return dependency
@@ -0,0 +1,148 @@
+"""
+Verified access tokens, cached.
+
+Resolving a bearer token means checking its signature and loading the user
+it names. `token_cache` keeps the result for each token, so repeat requests
+skip both steps. An entry lasts for TOKEN_CACHE_TTL seconds, and never past
+the token's own expiry. Only the TOKEN_CACHE_SIZE most recently used tokens
+are kept.
+
+Entries hold a `Principal`: the user's identity columns and the token's
+claims, detached from any session. The tree version is left out because
+every write changes it; read it with `tree_state`.
+
+A commit that updates or deletes a user drops that user's tokens from this
+process's cache. Other worker processes pick the change up when their
+entries expire.
+"""
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, NamedTuple, Optional, Set, Tuple
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from ..models import User
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "60"))
+
+# Session.info key holding ids of users changed in the pending transaction
+CHANGED_USERS_KEY = "changed_users"
+
+
+class Principal(NamedTuple):
+    """The authenticated user, as resolved from a token."""
+    id: int
+    username: str
+    email: str
+    is_active: bool
+    created_at: Optional[datetime]
+    claims: Dict
+
+    @classmethod
+    def from_user(cls, user: User, claims: Dict) -> "Principal":
+        return cls(user.id, user.username, user.email, bool(user.is_active), user.created_at, claims)
+
+
+class TokenCache:
+    """LRU map of token to Principal with per-entry expiry."""
+
+    def __init__(self, size: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, Tuple[Principal, float]]" = OrderedDict()
+        self.tokens_of: Dict[int, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _drop(self, token: str) -> None:
+        principal, _ = self.entries.pop(token)
+        tokens = self.tokens_of.get(principal.id)
+        if tokens:
+            tokens.discard(token)
+            if not tokens:
+                del self.tokens_of[principal.id]
+
+    def get(self, token: str) -> Optional[Principal]:
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            principal, expires = entry
+            if expires <= time.monotonic():
+                self._drop(token)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(token)
+            self.hits += 1
+            return principal
+
+    def put(self, token: str, principal: Principal) -> None:
+        ttl = self.ttl
+        if "exp" in principal.claims:
+            ttl = min(ttl, principal.claims["exp"] - time.time())
+        if ttl <= 0 or self.size <= 0:
+            return
+        with self.lock:
+            if token in self.entries:
+                self._drop(token)
+            self.entries[token] = (principal, time.monotonic() + ttl)
+            self.tokens_of.setdefault(principal.id, set()).add(token)
+            while len(self.entries) > self.size:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self.lock:
+            for token in list(self.tokens_of.get(user_id, ())):
+                self._drop(token)
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.tokens_of.clear()
+
+    def stats(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+token_cache = TokenCache()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_changed(mapper, connection, target: User) -> None:
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(CHANGED_USERS_KEY, set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session: Session) -> None:
+    for user_id in session.info.pop(CHANGED_USERS_KEY, ()):
+        token_cache.invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session: Session) -> None:
+    session.info.pop(CHANGED_USERS_KEY, None)
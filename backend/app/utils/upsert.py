@@ -0,0 +1,13 @@
+from typing import Union
+
+from sqlalchemy import Table
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.sql.dml import Insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+
+def dialect_insert(db: Union[Session, Connection], table: Table) -> Insert:
+    """INSERT supporting ON CONFLICT for the database behind `db` (SQLite or PostgreSQL)."""
+    dialect = db.dialect if isinstance(db, Connection) else db.get_bind().dialect
+    return postgresql.insert(table) if dialect.name == "postgresql" else sqlite.insert(table)
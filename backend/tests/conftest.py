@@ -0,0 +1,27 @@
+import os
+import tempfile
+
+# Point the app at a throwaway database before anything imports app.database
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+
+import pytest
+
+from app.database import SessionLocal, init_db
+from app.models import User
+from app.utils.token_cache import Principal
+
+
+@pytest.fixture(scope="session")
+def database():
+    init_db()
+
+
+@pytest.fixture
+def principal(database):
+    """A fresh user, as an authenticated route would see them."""
+    with SessionLocal() as db:
+        name = f"user{os.urandom(4).hex()}"
+        user = User(username=name, email=f"{name}@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        return Principal.from_user(user, {})
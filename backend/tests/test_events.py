@@ -0,0 +1,66 @@
+import asyncio
+
+from app.database import WriteSessionLocal, async_engine
+from app.routes import events
+from app.services.tree_version import bump_tree_version, tree_state
+
+
+def _write(user_id: int) -> int:
+    with WriteSessionLocal() as db:
+        version = bump_tree_version(db, user_id, upserted={"member": [1]})
+        db.commit()
+        return version
+
+
+def _run(coroutine):
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            # Pooled aiosqlite connections are bound to this loop
+            await async_engine.dispose()
+    return asyncio.run(run())
+
+
+async def _stream(user, during=None):
+    """The `ready` event, then the first `change` after running `during`."""
+    response = await events.stream_events(request=None, current_user=user)
+    chunks = response.body_iterator
+    try:
+        ready = await chunks.__anext__()
+        extra = during() if during else None
+        change = await asyncio.wait_for(chunks.__anext__(), 2)
+        return ready, change, extra
+    finally:
+        await chunks.aclose()
+
+
+def test_write_committed_after_version_read_is_delivered(principal, monkeypatch):
+    written = []
+
+    def read_then_write(db, user_id):
+        state = tree_state(db, user_id)
+        written.append(_write(user_id))
+        return state
+
+    monkeypatch.setattr(events, "tree_state", read_then_write)
+    ready, change, _ = _run(_stream(principal))
+
+    assert f"id: {written[0] - 1}\n" in ready
+    assert change.startswith("event: change\n")
+    assert f"id: {written[0]}\n" in change
+
+
+def test_write_covered_by_ready_is_not_repeated(principal, monkeypatch):
+    written = []
+
+    def write_then_read(db, user_id):
+        written.append(_write(user_id))
+        return tree_state(db, user_id)
+
+    monkeypatch.setattr(events, "tree_state", write_then_read)
+    ready, change, later = _run(_stream(principal, during=lambda: _write(principal.id)))
+
+    assert f"id: {written[0]}\n" in ready
+    # The queued event for written[0] is skipped; the next one is the later write
+    assert f"id: {later}\n" in change
@@ -0,0 +1,47 @@
+from sqlalchemy import create_engine, inspect, select
+
+from app import migrations
+from app.migrations import schema_steps, upgrade_schema
+from app.models import Base
+
+
+def _engine(tmp_path):
+    return create_engine(f"sqlite:///{tmp_path / 'upgrade.db'}")
+
+
+def test_steps_run_once(tmp_path, monkeypatch):
+    engine = _engine(tmp_path)
+    Base.metadata.create_all(bind=engine)
+    calls = []
+
+    def count_calls(connection):
+        calls.append(connection)
+
+    monkeypatch.setattr(migrations, "UPGRADE_STEPS", migrations.UPGRADE_STEPS + [count_calls])
+    upgrade_schema(engine)
+    upgrade_schema(engine)
+
+    with engine.connect() as connection:
+        applied = set(connection.scalars(select(schema_steps.c.name)))
+    assert len(calls) == 1
+    assert "count_calls" in applied and "backfill_tree_stats" in applied
+    engine.dispose()
+
+
+def test_not_null_column_added_to_existing_rows(tmp_path):
+    engine = _engine(tmp_path)
+    with engine.begin() as connection:
+        # users as created before tree_version existed
+        connection.exec_driver_sql(
+            "CREATE TABLE users (id INTEGER PRIMARY KEY, email VARCHAR NOT NULL, username VARCHAR NOT NULL, "
+            "hashed_password VARCHAR NOT NULL, created_at DATETIME, is_active BOOLEAN)"
+        )
+        connection.exec_driver_sql("INSERT INTO users (email, username, hashed_password) VALUES ('a@b.c', 'a', 'x')")
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+
+    with engine.connect() as connection:
+        columns = {column["name"]: column for column in inspect(connection).get_columns("users")}
+        assert columns["tree_version"]["nullable"] is False
+        assert connection.exec_driver_sql("SELECT tree_version FROM users").scalar() == 0
+    engine.dispose()
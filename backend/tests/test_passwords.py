@@ -0,0 +1,21 @@
+import asyncio
+
+import pytest
+
+from app.services.passwords import PasswordHasher
+
+
+def test_failed_operations_are_not_counted_as_completed():
+    hasher = PasswordHasher(workers=1, limit=4)
+
+    async def run():
+        await hasher.hash("secret")
+        with pytest.raises(ValueError):
+            await hasher.verify("secret", "not a hash")
+
+    try:
+        asyncio.run(run())
+    finally:
+        hasher.executor.shutdown()
+    stats = hasher.stats()
+    assert (stats["completed"], stats["failed"], stats["pending"]) == (1, 1, 0)
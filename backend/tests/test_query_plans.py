@@ -0,0 +1,21 @@
+import pytest
+from sqlalchemy import create_engine
+
+from app.migrations import upgrade_schema
+from app.models import Base
+from app.utils.query_plans import full_scans, route_queries
+
+
+@pytest.fixture(scope="module")
+def engine(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('plans') / 'plans.db'}")
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize("name", sorted(route_queries()))
+def test_route_query_uses_an_index(engine, name):
+    with engine.connect() as connection:
+        assert full_scans(connection, route_queries()[name]) == []
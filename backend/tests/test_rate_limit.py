@@ -0,0 +1,25 @@
+import pytest
+
+from app.utils.rate_limit import Limit, MemoryStore, SQLiteStore
+
+LIMIT = Limit(per_minute=1, burst=2, concurrency=0)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    return MemoryStore() if request.param == "memory" else SQLiteStore(str(tmp_path / "limits.db"))
+
+
+def test_refund_returns_a_spent_token(store):
+    assert store.take("search:1", LIMIT)[0]
+    assert store.take("search:1", LIMIT)[0]
+    store.refund("search:1", LIMIT)
+    assert store.take("search:1", LIMIT)[0]
+    assert not store.take("search:1", LIMIT)[0]
+
+
+def test_refund_never_exceeds_burst(store):
+    store.take("search:1", LIMIT)
+    store.refund("search:1", LIMIT)
+    store.refund("search:1", LIMIT)
+    assert [store.take("search:1", LIMIT)[0] for _ in range(3)] == [True, True, False]
@@ -0,0 +1,16 @@
+import pytest
+
+from app.services.relationships import relationship_label
+
+
+@pytest.mark.parametrize("degree, ordinal", [
+    (3, "third"),
+    (11, "11th"),
+    (13, "13th"),
+    (21, "21st"),
+    (22, "22nd"),
+    (23, "23rd"),
+    (112, "112th"),
+])
+def test_cousin_ordinals(degree, ordinal):
+    assert relationship_label(degree + 1, degree + 1) == f"{ordinal} cousin"
@@ -22,8 +22,9 @@ export default function Dashboard() {
 
   const loadFamilyMembers = async () => {
     try {
-      const response = await familyAPI.getAll()
-      setMembers(response.data)
+      // The whole tree in one columnar response; the list endpoint is paged
+      const response = await familyAPI.getTree()
+      setMembers(response.data.members)
     } catch (error) {
       console.error('Failed to load family members:', error)
     } finally {
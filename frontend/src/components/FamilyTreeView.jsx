@@ -1,13 +1,23 @@
-import { useEffect, useRef, useState } from 'react'
+import { useCallback, useEffect, useMemo, useRef, useState } from 'react'
 import { useFamilyStore } from '../stores/familyStore'
+import { familyAPI } from '../services/api'
 import * as d3 from 'd3'
 import '../styles/FamilyTree.css'
 
+// Layout positions come from the server in node widths and generations
+const NODE_WIDTH = 160
+const ROW_HEIGHT = 120
+const VIEWPORT_PADDING = 2
+const margin = { top: 40, left: 120 }
+
 export default function FamilyTreeView() {
   const { members, selectMember, selectedMember } = useFamilyStore()
   const svgRef = useRef()
   const containerRef = useRef()
+  const transformRef = useRef(d3.zoomIdentity)
   const [dimensions, setDimensions] = useState({ width: 800, height: 600 })
+  const [layout, setLayout] = useState(null)
+  const [chosenRootId, setChosenRootId] = useState(null)
 
   useEffect(() => {
     const updateDimensions = () => {
@@ -24,106 +34,136 @@ export default function FamilyTreeView() {
     return () => window.removeEventListener('resize', updateDimensions)
   }, [])
 
-  useEffect(() => {
-    if (!members.length || !svgRef.current) return
-
-    renderTree()
-  }, [members, dimensions, selectedMember])
-
-  const buildHierarchy = () => {
-    // Create a map of all members
-    const memberMap = new Map(members.map(m => [m.id, { ...m, children: [] }]))
-
-    // Find root members (those without parents) and build tree structure
-    const roots = []
-
-    members.forEach(member => {
-      const node = memberMap.get(member.id)
-
-      if (!member.father_id && !member.mother_id) {
-        roots.push(node)
-      } else {
-        // Add this member as a child of their parents
-        if (member.father_id && memberMap.has(member.father_id)) {
-          memberMap.get(member.father_id).children.push(node)
-        } else if (member.mother_id && memberMap.has(member.mother_id)) {
-          memberMap.get(member.mother_id).children.push(node)
-        }
-      }
-    })
-
-    // If no roots found, use all members
-    if (roots.length === 0 && members.length > 0) {
-      return { name: 'Root', children: Array.from(memberMap.values()) }
+  // Members with no recorded parents can each root a chart. Those with
+  // children come first, earliest born first, so the default is a family
+  // rather than someone entered on their own.
+  const roots = useMemo(() => {
+    const parents = new Set(members.flatMap(m => [m.father_id, m.mother_id]).filter(Boolean))
+    return members
+      .filter(m => !m.father_id && !m.mother_id)
+      .sort((a, b) =>
+        (parents.has(b.id) - parents.has(a.id)) ||
+        ((a.birth_year ?? Infinity) - (b.birth_year ?? Infinity)) ||
+        `${a.last_name} ${a.first_name}`.localeCompare(`${b.last_name} ${b.first_name}`)
+      )
+  }, [members])
+
+  const rootId = useMemo(() => {
+    if (chosenRootId && roots.some(m => m.id === chosenRootId)) return chosenRootId
+    return (roots[0] || members[0])?.id
+  }, [chosenRootId, roots, members])
+
+  // Fetch the nodes inside the visible area, in layout units
+  const loadViewport = useCallback((transform) => {
+    if (!rootId) return
+    const { width, height } = dimensions
+    const [x0, y0] = transform.invert([0, 0])
+    const [x1, y1] = transform.invert([width, height])
+    const box = {
+      min_x: (x0 - margin.left) / NODE_WIDTH - VIEWPORT_PADDING,
+      max_x: (x1 - margin.left) / NODE_WIDTH + VIEWPORT_PADDING,
+      min_y: (y0 - margin.top) / ROW_HEIGHT - VIEWPORT_PADDING,
+      max_y: (y1 - margin.top) / ROW_HEIGHT + VIEWPORT_PADDING,
     }
+    familyAPI.getLayout(rootId, { chart: 'descendants', ...box })
+      .then(response => setLayout(response.data))
+      .catch(error => console.error('Failed to load tree layout:', error))
+  }, [rootId, dimensions])
 
-    // Return structure for D3
-    return roots.length === 1 ? roots[0] : { name: 'Root', children: roots }
-  }
+  // Members are refetched after every edit, which changes the layout
+  useEffect(() => {
+    loadViewport(transformRef.current)
+  }, [members, loadViewport])
+
+  useEffect(() => {
+    if (!svgRef.current) return
 
-  const renderTree = () => {
     const svg = d3.select(svgRef.current)
-    svg.selectAll('*').remove()
+      .attr('width', dimensions.width)
+      .attr('height', dimensions.height)
 
-    const { width, height } = dimensions
-    const margin = { top: 40, right: 120, bottom: 40, left: 120 }
+    const zoom = d3.zoom()
+      .scaleExtent([0.1, 3])
+      .on('zoom', (event) => {
+        transformRef.current = event.transform
+        svg.select('g.chart').attr('transform', event.transform)
+      })
+      .on('end', (event) => loadViewport(event.transform))
 
-    const treeLayout = d3.tree()
-      .size([height - margin.top - margin.bottom, width - margin.left - margin.right])
+    svg.call(zoom)
+    return () => svg.on('.zoom', null)
+  }, [dimensions, loadViewport])
 
-    const root = d3.hierarchy(buildHierarchy())
+  useEffect(() => {
+    if (!layout || !svgRef.current) return
 
-    treeLayout(root)
+    renderTree()
+  }, [layout, selectedMember])
 
-    const g = svg
-      .attr('width', width)
-      .attr('height', height)
-      .append('g')
-      .attr('transform', `translate(${margin.left},${margin.top})`)
+  const renderTree = () => {
+    const svg = d3.select(svgRef.current)
+    svg.selectAll('*').remove()
 
-    // Add zoom functionality
-    const zoom = d3.zoom()
-      .scaleExtent([0.5, 3])
-      .on('zoom', (event) => {
-        g.attr('transform', event.transform)
+    const position = new Map(layout.nodes.map(n => [n.id, n]))
+    const px = (node) => margin.left + node.x * NODE_WIDTH
+    const py = (node) => margin.top + node.y * ROW_HEIGHT
+
+    const g = svg.append('g')
+      .attr('class', 'chart')
+      .attr('transform', transformRef.current)
+
+    // Families may reference members outside the viewport; only draw the ends we have
+    const links = []
+    layout.families.forEach(family => {
+      const parents = family.parents.map(id => position.get(id)).filter(Boolean)
+      if (!parents.length) return
+      const from = {
+        x: d3.mean(parents, px),
+        y: d3.mean(parents, py),
+      }
+      if (parents.length === 2) {
+        links.push({ source: { x: px(parents[0]), y: py(parents[0]) }, target: { x: px(parents[1]), y: py(parents[1]) }, couple: true })
+      }
+      family.children.forEach(id => {
+        const child = position.get(id)
+        if (child) links.push({ source: from, target: { x: px(child), y: py(child) } })
       })
+    })
 
-    svg.call(zoom)
-
-    // Draw links
     g.selectAll('.link')
-      .data(root.links())
+      .data(links)
       .enter()
       .append('path')
       .attr('class', 'link')
-      .attr('d', d3.linkHorizontal()
-        .x(d => d.y)
-        .y(d => d.x))
+      .attr('d', d => d.couple
+        ? `M${d.source.x},${d.source.y}H${d.target.x}`
+        : d3.linkVertical().x(p => p.x).y(p => p.y)(d))
       .style('fill', 'none')
-      .style('stroke', '#ccc')
+      .style('stroke', d => d.couple ? '#999' : '#ccc')
       .style('stroke-width', 2)
 
-    // Draw nodes
+    // Draw nodes; each layout node carries the member fields it is labelled with
     const nodes = g.selectAll('.node')
-      .data(root.descendants())
+      .data(layout.nodes)
       .enter()
       .append('g')
-      .attr('class', d => `node ${selectedMember?.id === d.data.id ? 'selected' : ''}`)
-      .attr('transform', d => `translate(${d.y},${d.x})`)
+      .attr('class', d => `node ${selectedMember?.id === d.id ? 'selected' : ''}`)
+      .attr('transform', d => `translate(${px(d)},${py(d)})`)
       .style('cursor', 'pointer')
       .on('click', (event, d) => {
-        if (d.data.id) {
-          selectMember(d.data)
-        }
+        // The tree holds a few columns per member; the side panel needs the full record
+        familyAPI.getOne(d.id)
+          .then(response => selectMember(response.data))
+          .catch(error => console.error('Failed to load family member:', error))
       })
 
     // Add circles for nodes
     nodes.append('circle')
       .attr('r', 8)
       .style('fill', d => {
-        if (selectedMember?.id === d.data.id) return '#4CAF50'
-        if (d.data.gender === 'male') return '#64B5F6'
-        if (d.data.gender === 'female') return '#F48FB1'
+        if (selectedMember?.id === d.id) return '#4CAF50'
+        if (d.gender === 'male') return '#64B5F6'
+        if (d.gender === 'female') return '#F48FB1'
         return '#90A4AE'
       })
       .style('stroke', '#333')
@@ -131,27 +171,22 @@ export default function FamilyTreeView() {
 
     // Add labels
     nodes.append('text')
-      .attr('dy', '.31em')
-      .attr('x', d => d.children ? -12 : 12)
-      .style('text-anchor', d => d.children ? 'end' : 'start')
+      .attr('dy', '2em')
+      .style('text-anchor', 'middle')
       .style('font-size', '12px')
       .style('fill', '#333')
-      .text(d => {
-        if (!d.data.first_name) return d.data.name || ''
-        return `${d.data.first_name} ${d.data.last_name || ''}`
-      })
+      .text(d => `${d.first_name} ${d.last_name || ''}`)
 
     // Add birth/death years
     nodes.append('text')
-      .attr('dy', '1.5em')
-      .attr('x', d => d.children ? -12 : 12)
-      .style('text-anchor', d => d.children ? 'end' : 'start')
+      .attr('dy', '3.3em')
+      .style('text-anchor', 'middle')
       .style('font-size', '10px')
       .style('fill', '#666')
       .text(d => {
-        if (!d.data.birth_date && !d.data.death_date) return ''
-        const birth = d.data.birth_date ? new Date(d.data.birth_date).getFullYear() : '?'
-        const death = d.data.death_date ? new Date(d.data.death_date).getFullYear() : ''
+        if (!d.birth_year && !d.death_year) return ''
+        const birth = d.birth_year || '?'
+        const death = d.death_year || ''
         return death ? `${birth}-${death}` : `b. ${birth}`
       })
   }
@@ -167,6 +202,22 @@ export default function FamilyTreeView() {
 
   return (
     <div className="family-tree-container" ref={containerRef}>
+      {roots.length > 1 && (
+        <div className="tree-root-picker">
+          <label htmlFor="tree-root">Tree of</label>
+          <select
+            id="tree-root"
+            value={rootId}
+            onChange={(event) => setChosenRootId(Number(event.target.value))}
+          >
+            {roots.map(m => (
+              <option key={m.id} value={m.id}>
+                {m.first_name} {m.last_name || ''}{m.birth_year ? ` (b. ${m.birth_year})` : ''}
+              </option>
+            ))}
+          </select>
+        </div>
+      )}
       <svg ref={svgRef} className="family-tree-svg"></svg>
     </div>
   )
@@ -53,7 +53,13 @@ export default function MemberSidePanel() {
   const handleSave = async () => {
     try {
       const response = await familyAPI.update(selectedMember.id, editData)
-      updateMember(selectedMember.id, response.data)
+      // Keep the tree's year columns in step with the edited dates
+      const year = (date) => (date ? parseInt(date.slice(0, 4), 10) : null)
+      updateMember(selectedMember.id, {
+        ...response.data,
+        birth_year: year(response.data.birth_date),
+        death_year: year(response.data.death_date),
+      })
       setIsEditing(false)
     } catch (error) {
       console.error('Failed to update member:', error)
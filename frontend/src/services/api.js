@@ -38,12 +38,40 @@ export const authAPI = {
 // Family Members API
 export const familyAPI = {
   getAll: () => api.get('/family-members'),
+  // Whole tree as parallel arrays; `data.members` rebuilds one object per person
+  getTree: () => api.get('/family-members/tree').then((response) => {
+    const tree = response.data
+    const members = tree.ids.map((id, i) => ({
+      id,
+      first_name: tree.first_names[i],
+      last_name: tree.last_names[i],
+      birth_year: tree.birth_years[i],
+      death_year: tree.death_years[i],
+      father_id: tree.father_ids[i],
+      mother_id: tree.mother_ids[i],
+      gender: tree.gender_codes[tree.genders[i]],
+    }))
+    return { ...response, data: { ...tree, members } }
+  }),
+  lookup: (params) => api.get('/family-members/lookup', { params }),
   getOne: (id) => api.get(`/family-members/${id}`),
   create: (data) => api.post('/family-members', data),
+  batch: (operations) => api.post('/family-members/batch', operations),
   update: (id, data) => api.put(`/family-members/${id}`, data),
   delete: (id) => api.delete(`/family-members/${id}`),
   getChildren: (id) => api.get(`/family-members/${id}/children`),
   getAncestors: (id, generations = 3) => api.get(`/family-members/${id}/ancestors?generations=${generations}`),
+  getDescendants: (id, depth = null) => {
+    const params = depth ? `?depth=${depth}` : ''
+    return api.get(`/family-members/${id}/descendants${params}`, { responseType: 'text' })
+      .then((response) => ({
+        ...response,
+        data: response.data.split('\n').filter(Boolean).map((line) => JSON.parse(line)),
+      }))
+  },
+  // Chart positions; pass min_x/max_x/min_y/max_y to fetch only one viewport
+  getLayout: (id, params = {}) => api.get(`/family-members/${id}/layout`, { params }),
+  getImplex: (id, generations = 10) => api.get(`/family-members/${id}/implex`, { params: { generations } }),
 }
 
 // Documents API
@@ -59,10 +87,55 @@ export const documentsAPI = {
   delete: (id) => api.delete(`/documents/${id}`),
 }
 
+// GEDCOM API
+export const gedcomAPI = {
+  // Response body is NDJSON progress events, one per line
+  import: (formData) => api.post('/import/gedcom', formData, {
+    headers: { 'Content-Type': 'multipart/form-data' },
+    responseType: 'text',
+  }),
+  export: () => api.get('/export/gedcom', { responseType: 'blob' }),
+}
+
+// Duplicates API
+export const duplicatesAPI = {
+  scan: () => api.post('/duplicates/scan'),
+  getAll: (cursor = null) => api.get('/duplicates', { params: cursor ? { cursor } : {} }),
+  dismiss: (id) => api.post(`/duplicates/${id}/dismiss`),
+  merge: (id, keepId = null) => api.post(`/duplicates/${id}/merge`, { keep_id: keepId }),
+}
+
+// Families API
+export const familiesAPI = {
+  get: (memberId) => api.get(`/families/${memberId}`),
+  // One request for a whole generation
+  batch: (memberIds) => api.post('/families/batch', { member_ids: memberIds }),
+}
+
+// Sync API
+export const syncAPI = {
+  // Changes since a tree version; 0 fetches everything
+  since: (version = 0) => api.get('/sync', { params: { since: version } }),
+}
+
+// Live change feed; EventSource cannot send headers, so the token goes in the query
+export const eventsAPI = {
+  connect: () => new EventSource(
+    `/api/events?access_token=${encodeURIComponent(useAuthStore.getState().token)}`
+  ),
+}
+
+// Statistics API
+export const statsAPI = {
+  get: (top = 10) => api.get('/stats', { params: { top } }),
+  rebuild: () => api.post('/stats/rebuild'),
+}
+
 // Search API
 export const searchAPI = {
   genealogy: (query) => api.post('/search/genealogy', query),
   history: () => api.get('/search/history'),
+  local: (q, type = null) => api.get('/search/local', { params: type ? { q, type } : { q } }),
   sources: () => api.get('/search/sources'),
 }
 